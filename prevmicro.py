@@ -1,1572 +1,5360 @@
-import os
-import re
-import subprocess
-import wave
-
-import tempfile
-import shutil
-import logging
-from pathlib import Path
-import requests
-import json
-from pptx.enum.text import MSO_AUTO_SIZE
-import re
-import json
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
-from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION, XL_DATA_LABEL_POSITION
-from pptx.chart.data import CategoryChartData
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from PIL import Image, ImageDraw
-from io import BytesIO
-from bs4 import BeautifulSoup
-from datetime import datetime
-import cv2
-import numpy as np
-from gtts import gTTS
-import moviepy as mp
-
-import tempfile
-import shutil
-from pathlib import Path
-import time
-import threading
-from concurrent.futures import ThreadPoolExecutor
-import logging
-
-# === Setup logging ===
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# === Load environment variables ===
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY_1")
-GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID_1")
-UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
-
-# === Initialize LLM ===
-llm = ChatGroq(
-    groq_api_key=GROQ_API_KEY,
-    model_name="openai/gpt-oss-20b",
-)
-
-# === Enhanced McKinsey Style Constants ===
-MCKINSEY_COLORS = {
-    "blue": RGBColor(12, 74, 126),
-    "light_blue": RGBColor(79, 129, 189),
-    "dark_blue": RGBColor(6, 45, 85),
-    "accent_blue": RGBColor(102, 170, 238),
-    "gray": RGBColor(89, 89, 89),
-    "light_gray": RGBColor(217, 217, 217),
-    "dark_gray": RGBColor(64, 64, 64),
-    "background": RGBColor(255, 255, 255),
-    "text": RGBColor(0, 0, 0),
-    "white": RGBColor(255, 255, 255)
-}
-FONT_NAME = "Aptos Display"
-
-# === Video Configuration ===
-VIDEO_CONFIG = {
-    "width": 1920,
-    "height": 1080,
-    "fps": 30,
-    "slide_duration": 8,  # seconds per slide (will be adjusted based on audio)
-    "transition_duration": 0.5,  # seconds for transitions
-    "background_color": (255, 255, 255),  # White background
-    "output_format": "mp4"
-}
-
-def get_slide_content_with_charts(topic, n_slides):
-    prompt = f"""
-    You are preparing a professional, data-driven PowerPoint presentation outline 
-    with exactly {n_slides} slides on the topic "{topic}".
-
-    Rules:
-    - Return ONLY valid JSON, no explanations or markdown.
-    - "intro" must be maximum 1â€“2 lines (<=150 characters).
-    - Each slide must include:
-      - "title": max 8 words
-      - "insight": one sentence
-      - "type": either "bullets" or "chart"
-      - If "type" = "bullets", "data" must be an array of objects:
-        {{"point": "short phrase", "desc": "1â€“2 line explanation"}}
-      - If "type" = "chart", "data" must be JSON:
-        {{
-          "type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
-          "data": [["Label1", 123], ["Label2", 456]],
-          "source": "Source: Organization, 2025"
-        }}
-        and optionally include "context": "Why this data matters"
-
-    JSON format:
-    {{
-      "intro": "short intro text",
-      "slides": [
-        {{
-          "title": "Slide Title",
-          "insight": "Key insight",
-          "type": "bullets",
-          "data": [
-            {{"point": "Clarity", "desc": "Use straightforward language to avoid confusion"}},
-            {{"point": "Audience Awareness", "desc": "Adapt tone and style to the readers"}}
-          ]
-        }},
-        {{
-          "title": "Slide with Chart",
-          "insight": "Data-driven point",
-          "type": "chart",
-          "data": {{
-            "type": "COLUMN",
-            "data": [["X", 10], ["Y", 20]],
-            "source": "Source: Example Org, 2025"
-          }},
-          "context": "Why this data is important"
-        }}
-      ]
-    }}
-    """
-    return llm.invoke(prompt).content
-
-def parse_mckinsey_response(text):
-    slides = []
-    intro_match = re.search(r"Introduction:\s*(.*?)\n---", text, re.DOTALL)
-    introduction = ""
-
-    slide_chunks = text.split('---')
-    for chunk in slide_chunks:
-        if not chunk.strip():
-            continue
-
-        try:
-            title_match = re.search(r"Title: (.*?)\n", chunk, re.IGNORECASE)
-            insight_match = re.search(r"Key Insight: (.*?)\n", chunk, re.IGNORECASE)
-            context_match = re.search(r"Context: (.*?)\n", chunk, re.IGNORECASE)
-
-            title = title_match.group(1).strip() if title_match else f"Slide {len(slides)+1}"
-            insight = insight_match.group(1).strip() if insight_match else None
-            context = context_match.group(1).strip() if context_match else ""
-
-            if not insight:
-                print(f"Skipping slide due to missing insight: {chunk[:100]}")
-                continue
-
-            content = {"title": title, "insight": insight, "context": context}
-
-            chart_match = re.search(r"Chart:\s*```json\n(.*?)\n```", chunk, re.DOTALL)
-            if chart_match:
-                try:
-                    chart_data = json.loads(chart_match.group(1).strip())
-                    content["type"] = "chart"
-                    content["data"] = chart_data
-                except json.JSONDecodeError:
-                    print(f"[Warning] Chart JSON malformed. Falling back to bullets.")
-                    content["type"] = "bullets"
-                    content["data"] = ["No chart data was available."]
-            else:
-                bullets_match = re.search(r"Bullets:\s*(.*)", chunk, re.DOTALL)
-                bullets_raw = bullets_match.group(1) if bullets_match else ""
-                bullets = [b.strip("- ").strip() for b in bullets_raw.split('\n') if b.strip()]
-                if not bullets:
-                    bullets = ["No content was provided by the AI for this slide."]
-                content["type"] = "bullets"
-                content["data"] = bullets
-
-            slides.append(content)
-        except Exception as e:
-            print(f"Could not parse a slide chunk, skipping. Error: {e}\nChunk: {chunk[:100]}...")
-            continue
-
-    return {"intro": introduction, "slides": slides}
-
-def parse_json_slides(text: str):
-    try:
-        # 1. Strip markdown fences if present
-        cleaned = text.strip()
-        if cleaned.startswith("```"):
-            cleaned = re.sub(r"^```(json)?", "", cleaned, flags=re.IGNORECASE).strip()
-            cleaned = re.sub(r"```$", "", cleaned).strip()
-
-        # 2. Extract JSON object if there's extra text around it
-        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        if match:
-            cleaned = match.group(0)
-
-        # 3. Parse JSON
-        return json.loads(cleaned)
-
-    except json.JSONDecodeError as e:
-        print(f"[Error] JSON parse failed: {e}")
-        print(f"[Debug Raw Start] {text[:300]}...")
-        return {"intro": "", "slides": []}
-
-def add_enhanced_title_slide(prs, topic, intro):
-    """Creates a stunning McKinsey-style title slide with professional layout and design elements."""
-    slide = prs.slides.add_slide(prs.slide_layouts[6])
-    slide.background.fill.solid()
-    slide.background.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
-
-    # Background geometric elements for visual appeal
-    bg_rect = slide.shapes.add_shape(1, Inches(8), Inches(0), Inches(3.33), Inches(7.5))
-    bg_rect.fill.solid()
-    bg_rect.fill.fore_color.rgb = MCKINSEY_COLORS["light_blue"]
-    bg_rect.line.fill.background()
-    
-    # Diagonal accent shape
-    accent_shape = slide.shapes.add_shape(1, Inches(0), Inches(6.7), Inches(13.33), Inches(1.0))
-    accent_shape.fill.solid()
-    accent_shape.fill.fore_color.rgb = MCKINSEY_COLORS["blue"]
-    accent_shape.line.fill.background()
-
-    # Main Title - Bold and prominent
-    title_box = slide.shapes.add_textbox(Inches(1), Inches(1.2), Inches(10), Inches(2))
-    tf = title_box.text_frame
-    tf.word_wrap = True
-    p = tf.paragraphs[0]
-    p.text = topic.upper()
-    p.font.name = FONT_NAME
-    p.font.size = Pt(52)
-    p.font.bold = True
-    p.font.color.rgb = MCKINSEY_COLORS["dark_blue"]
-    p.alignment = PP_ALIGN.LEFT
-
-    # Professional subtitle with current date
-    current_date = datetime.now().strftime("%B %Y")
-    subtitle_box = slide.shapes.add_textbox(Inches(1), Inches(3.2), Inches(10), Inches(0.8))
-    tf2 = subtitle_box.text_frame
-    p2 = tf2.paragraphs[0]
-    p2.text = f"Strategic Analysis & Business Intelligence | {current_date}"
-    p2.font.name = FONT_NAME
-    p2.font.size = Pt(20)
-    p2.font.color.rgb = MCKINSEY_COLORS["gray"]
-    p2.alignment = PP_ALIGN.LEFT
-
-    # Executive Summary Box with better formatting
-    intro_box = slide.shapes.add_textbox(Inches(1), Inches(4.0), Inches(10), Inches(1.5))
-    tf3 = intro_box.text_frame
-    tf3.word_wrap = True
-    tf3.auto_size = MSO_AUTO_SIZE.NONE
-    tf3.margin_left = Inches(0.2)
-    tf3.margin_right = Inches(0.2)
-    tf3.margin_top = Inches(0.1)
-    tf3.margin_bottom = Inches(0.1)
-    
-    p3 = tf3.paragraphs[0]
-    p3.font.name = FONT_NAME
-    p3.font.size = Pt(14)
-    p3.font.bold = True
-    p3.font.color.rgb = MCKINSEY_COLORS["blue"]
-    p3.alignment = PP_ALIGN.LEFT
-    
-    # Add the actual introduction content
-    p4 = tf3.add_paragraph()
-    p4.text = intro
-    p4.font.name = FONT_NAME
-    p4.font.size = Pt(16)
-    p4.font.color.rgb = MCKINSEY_COLORS["text"]
-    p4.alignment = PP_ALIGN.LEFT
-    p4.space_before = Pt(8)
-
-    # Professional branding footer
-    brand_box = slide.shapes.add_textbox(Inches(1), Inches(7), Inches(6), Inches(0.4))
-    tf4 = brand_box.text_frame
-    p5 = tf4.paragraphs[0]
-    p5.text = "MADE BY ENTHRAL AI"
-    p5.font.name = FONT_NAME
-    p5.font.size = Pt(10)
-    p5.font.italic = True
-    p5.font.color.rgb = MCKINSEY_COLORS["white"]
-    p5.alignment = PP_ALIGN.LEFT
-
-    # Decorative elements
-    line1 = slide.shapes.add_shape(1, Inches(1), Inches(4.2), Inches(4), Inches(0))
-    line1.line.color.rgb = MCKINSEY_COLORS["accent_blue"]
-    line1.line.width = Pt(4)
-    
-    line2 = slide.shapes.add_shape(1, Inches(1), Inches(4.3), Inches(2), Inches(0))
-    line2.line.color.rgb = MCKINSEY_COLORS["blue"]
-    line2.line.width = Pt(2)
-
-def add_chart_slide_with_context(slide, chart_info, context):
-    if context:
-        tx_box = slide.shapes.add_textbox(Inches(1), Inches(1.6), Inches(11), Inches(0.6))
-        tf = tx_box.text_frame
-        p = tf.paragraphs[0]
-        p.text = context
-        p.font.size = Pt(14)
-        p.font.name = FONT_NAME
-        p.font.color.rgb = MCKINSEY_COLORS["gray"]
-
-    add_chart_slide(slide, chart_info)
-
-def calculate_dynamic_image_size(image_path, max_width=5.8, max_height=4.5):
-    """Enhanced image size calculation for the new layout."""
-    try:
-        with Image.open(image_path) as img:
-            original_width, original_height = img.size
-            aspect_ratio = original_width / original_height
-            
-            # Calculate dimensions based on aspect ratio
-            if aspect_ratio > (max_width / max_height):
-                width = max_width
-                height = max_width / aspect_ratio
-            else:
-                height = max_height
-                width = max_height * aspect_ratio
-            
-            # Ensure minimum size for impact
-            width = max(width, 4.0)
-            height = max(height, 3.0)
-            
-            return Inches(width), Inches(height)
-    except Exception as e:
-        print(f"Error calculating image size: {e}")
-        return Inches(5.0), Inches(3.5)
-
-def build_mckinsey_ppt(parsed_data, topic):
-    prs = Presentation()
-    prs.slide_width = Inches(13.33)
-    prs.slide_height = Inches(7.5)
-    blank_layout = prs.slide_layouts[6]
-
-    add_enhanced_title_slide(prs, topic, parsed_data["intro"])
-
-    for i, slide_content in enumerate(parsed_data["slides"], start=1):
-        slide = prs.slides.add_slide(blank_layout)
-        slide.background.fill.solid()
-        slide.background.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
-
-        add_enhanced_header(slide, slide_content['title'], slide_content['insight'])
-        add_enhanced_footer(slide, i + 1)
-
-        if slide_content['type'] == 'chart':
-            add_chart_slide_with_context(slide, slide_content['data'], slide_content.get("context", ""))
-        else:
-            image_path = fetch_image(f"{slide_content['title']} {slide_content['insight']}", topic)
-            add_enhanced_text_and_image_slide(slide, slide_content['data'], image_path)
-
-    filename = topic.strip().replace(" ", "_") + "_McKinsey_Style.pptx"
-    prs.save(filename)
-    print(f"\nPresentation saved as: {filename}")
-    return filename
-
-def add_enhanced_header(slide, title, insight):
-    """Adds a professionally styled title and key insight with better visual hierarchy."""
-    # Background header area
-    header_bg = slide.shapes.add_shape(1, Inches(0), Inches(0), Inches(13.33), Inches(1.4))
-    header_bg.fill.solid()
-    header_bg.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
-    header_bg.line.color.rgb = MCKINSEY_COLORS["light_gray"]
-    header_bg.line.width = Pt(1)
-    
-    # Title
-    tx_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.15), Inches(12), Inches(0.65))
-    tf = tx_box.text_frame
-    tf.vertical_anchor = MSO_ANCHOR.TOP
-    tf.margin_left = Inches(0.1)
-    p = tf.paragraphs[0]
-    p.text = title.upper()
-    p.font.name = FONT_NAME
-    p.font.size = Pt(26)
-    p.font.bold = True
-    p.font.color.rgb = MCKINSEY_COLORS["dark_blue"]
-
-    # Key Insight with better styling
-    insight_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.8), Inches(12), Inches(0.5))
-    tf2 = insight_box.text_frame
-    tf2.margin_left = Inches(0.1)
-    p_insight = tf2.paragraphs[0]
-    p_insight.text = f"Key Insight: {insight}"
-    p_insight.font.name = FONT_NAME
-    p_insight.font.size = Pt(14)
-    p_insight.font.color.rgb = MCKINSEY_COLORS["gray"]
-    p_insight.font.italic = True
-
-    # Enhanced blue accent line
-    line = slide.shapes.add_shape(1, Inches(0.5), Inches(1.35), Inches(12), Inches(0))
-    line.line.color.rgb = MCKINSEY_COLORS["blue"]
-    line.line.width = Pt(3)
-
-def add_enhanced_footer(slide, slide_number):
-    """Adds a professionally styled footer with slide number and branding."""
-    # Footer background
-    footer_bg = slide.shapes.add_shape(1, Inches(0), Inches(6.9), Inches(13.33), Inches(0.6))
-    footer_bg.fill.solid()
-    footer_bg.fill.fore_color.rgb = MCKINSEY_COLORS["light_gray"]
-    footer_bg.line.fill.background()
-    
-    # Slide number
-    tx_box = slide.shapes.add_textbox(Inches(11.5), Inches(7.0), Inches(1.5), Inches(0.4))
-    tf = tx_box.text_frame
-    p = tf.paragraphs[0]
-    p.text = f"{slide_number}"
-    p.alignment = PP_ALIGN.CENTER
-    p.font.name = FONT_NAME
-    p.font.size = Pt(12)
-    p.font.bold = True
-    p.font.color.rgb = MCKINSEY_COLORS["blue"]
-    
-    # Professional footer text
-    footer_text_box = slide.shapes.add_textbox(Inches(0.5), Inches(7.0), Inches(6), Inches(0.4))
-    tf2 = footer_text_box.text_frame
-    p2 = tf2.paragraphs[0]
-    p2.text = "MADE BY ENTHRAL AI"
-    p2.font.name = FONT_NAME
-    p2.font.size = Pt(9)
-    p2.font.color.rgb = MCKINSEY_COLORS["dark_gray"]
-
-def fetch_image(prompt: str, topic: str) -> str:
-    """Enhanced image fetching with multiple sources."""
-    from urllib.parse import quote
-    
-    headers = {"User-Agent": "Mozilla/5.0"}
-    query = f"{topic} {prompt}".strip()
-    encoded = quote(query)
-
-    def is_vertical(img):
-        w, h = img.size
-        aspect_ratio = w / h
-        return aspect_ratio < 1.25
-
-    def try_save_image(url, label, require_vertical=True):
-        try:
-            r = requests.get(url, stream=True, headers=headers, timeout=10)
-            if r.status_code == 200 and 'image' in r.headers.get('Content-Type', ''):
-                img = Image.open(BytesIO(r.content)).convert("RGB")
-                if not require_vertical or is_vertical(img):
-                    filename = f"{label}_{re.sub(r'[^a-zA-Z0-9]', '_', url)[:30]}.jpg"
-                    img.save(filename, format="JPEG")
-                    return filename
-        except:
-            pass
-        return None
-
-    def fetch_from_google(require_vertical=True):
-        try:
-            if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
-                return None
-                
-            g_url = f"https://www.googleapis.com/customsearch/v1?q={encoded}&searchType=image&num=8&key={GOOGLE_API_KEY}&cx={GOOGLE_CSE_ID}"
-            response = requests.get(g_url, timeout=15)
-            
-            if response.status_code != 200:
-                return None
-                
-            data = response.json()
-            
-            if 'items' not in data:
-                return None
-                
-            for i, item in enumerate(data['items']):
-                url = item.get("link", "")
-                if url:
-                    img_path = try_save_image(url, f"google_{i}", require_vertical)
-                    if img_path:
-                        return img_path
-                        
-        except Exception as e:
-            pass
-        return None
-
-    def create_fallback():
-        try:
-            img = Image.new('RGB', (800, 600), color=(245, 245, 245))
-            draw = ImageDraw.Draw(img)
-            draw.rectangle([40, 40, 760, 560], outline=(12, 74, 126), width=4)
-            draw.rectangle([80, 80, 720, 520], outline=(217, 217, 217), width=2)
-            
-            try:
-                from PIL import ImageFont
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            except:
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
-            draw.text((400, 250), "Professional", fill=(12, 74, 126), anchor='mm', font=font_large)
-            draw.text((400, 300), "Image Placeholder", fill=(12, 74, 126), anchor='mm', font=font_large)
-            draw.text((400, 380), f"Topic: {topic}", fill=(89, 89, 89), anchor='mm', font=font_small)
-            draw.ellipse([320, 150, 480, 200], outline=(79, 129, 189), width=3)
-            
-            img.save('fallback.jpg', 'JPEG', quality=90)
-            return True
-        except:
-            return False
-
-    # Try different methods
-    for orientation_pref in [True, False]:
-        image_path = fetch_from_google(require_vertical=orientation_pref)
-        if image_path:
-            return image_path
-    
-    # Fallback
-    if not os.path.exists("fallback.jpg"):
-        create_fallback()
-    
-    return "fallback.jpg" if os.path.exists("fallback.jpg") else None
-
-def validated_image_bytes(path, max_width=800, max_height=500):
-    """Enhanced image validation with better error handling and optimization."""
-    try:
-        if not path or not os.path.exists(path):
-            return None
-            
-        with Image.open(path) as img:
-            img.verify()
-            
-        with Image.open(path) as img:
-            if img.mode != 'RGB':
-                img = img.convert("RGB")
-            
-            original_w, original_h = img.size
-            img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-            
-            stream = BytesIO()
-            img.save(stream, format="PNG", optimize=True, quality=90)
-            stream.seek(0)
-            
-            return stream
-            
-    except Exception as e:
-        return None
-
-def add_chart_slide(slide, chart_info):
-    """Adds a dynamically generated chart to the slide."""
-    from pptx.chart.data import CategoryChartData
-    from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION, XL_DATA_LABEL_POSITION
-
-    try:
-        raw_data = chart_info.get("data", [])
-        if not raw_data or not isinstance(raw_data, list):
-            raise ValueError("Chart data is missing or malformed.")
-
-        chart_type_str = chart_info.get("type", "BAR").upper()
-        chart_type_map = {
-            "BAR": XL_CHART_TYPE.BAR_CLUSTERED,
-            "COLUMN": XL_CHART_TYPE.COLUMN_CLUSTERED,
-            "LINE": XL_CHART_TYPE.LINE,
-            "PIE": XL_CHART_TYPE.PIE,
-            "DOUGHNUT": XL_CHART_TYPE.DOUGHNUT,
-            "AREA": XL_CHART_TYPE.AREA,
-            "SCATTER": XL_CHART_TYPE.XY_SCATTER_LINES,
-            "STACKED_BAR": XL_CHART_TYPE.BAR_STACKED
-        }
-        chart_type = chart_type_map.get(chart_type_str, XL_CHART_TYPE.COLUMN_CLUSTERED)
-
-        chart_data = CategoryChartData()
-
-        # Handle different data formats
-        if all(isinstance(row, list) and len(row) > 2 for row in raw_data):
-            categories = [row[0] for row in raw_data]
-            num_series = len(raw_data[0]) - 1
-            series_data = [[] for _ in range(num_series)]
-
-            for row in raw_data:
-                for i in range(num_series):
-                    val = row[i + 1]
-                    series_data[i].append(float(val) if isinstance(val, (int, float)) else 0)
-
-            chart_data.categories = categories
-            for i, values in enumerate(series_data):
-                chart_data.add_series(f"Series {i + 1}", values)
-
-        elif all(isinstance(row, list) and len(row) == 2 for row in raw_data):
-            chart_data.categories = [str(row[0]) for row in raw_data]
-            values = [float(row[1]) if isinstance(row[1], (int, float)) else 0.0 for row in raw_data]
-            chart_data.add_series("", values)
-
-        else:
-            raise ValueError("Invalid chart data format.")
-
-        # Create chart
-        x, y, cx, cy = Inches(1), Inches(1.7), Inches(11), Inches(4.5)
-        graphic_frame = slide.shapes.add_chart(chart_type, x, y, cx, cy, chart_data)
-        chart = graphic_frame.chart
-
-        chart.has_legend = True
-        chart.legend.position = XL_LEGEND_POSITION.RIGHT
-        chart.legend.include_in_layout = False
-
-        plot = chart.plots[0]
-        plot.has_data_labels = True
-        plot.data_labels.font.size = Pt(12)
-        plot.data_labels.font.bold = True
-        plot.data_labels.font.color.rgb = MCKINSEY_COLORS["gray"]
-
-        # Chart source
-        source_text = chart_info.get("source", "")
-        if source_text:
-            tx_box = slide.shapes.add_textbox(Inches(1), Inches(6.4), Inches(11), Inches(0.4))
-            p = tx_box.text_frame.paragraphs[0]
-            p.text = source_text
-            p.font.size = Pt(9)
-            p.font.italic = True
-            p.font.color.rgb = MCKINSEY_COLORS["gray"]
-
-    except Exception as e:
-        print(f"Failed to create chart: {e}")
-        tx_box = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(11), Inches(1))
-        tx_box.text_frame.paragraphs[0].text = "Error: Could not generate the requested chart."
-
-def add_enhanced_text_and_image_slide(slide, bullets, image_path):
-    """Creates an elegant side-by-side layout with bullet points and image."""
-    text_width = Inches(5.5)
-    text_height = Inches(4.5)
-
-    tx_box = slide.shapes.add_textbox(Inches(0.8), Inches(1.8), text_width, text_height)
-    tf = tx_box.text_frame
-    tf.word_wrap = True
-    tf.margin_left = Inches(0.15)
-    tf.margin_right = Inches(0.15)
-    tf.margin_top = Inches(0.1)
-    tf.margin_bottom = Inches(0.1)
-    tf.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
-
-    for bullet in bullets:
-        if isinstance(bullet, dict):
-            p = tf.add_paragraph()
-            p.text = f"â€¢ {bullet.get('point','').strip()}"
-            p.font.name = FONT_NAME
-            p.font.size = Pt(16)
-            p.font.color.rgb = MCKINSEY_COLORS["text"]
-            p.level = 0
-            p.space_after = Pt(6)
-
-            desc = bullet.get("desc", "").strip()
-            if desc:
-                desc_p = tf.add_paragraph()
-                desc_p.text = desc
-                desc_p.font.name = FONT_NAME
-                desc_p.font.size = Pt(13)
-                desc_p.font.color.rgb = MCKINSEY_COLORS["gray"]
-                desc_p.level = 1
-                desc_p.space_after = Pt(12)
-        else:
-            p = tf.add_paragraph()
-            p.text = f"â€¢ {str(bullet).strip()}"
-            p.font.name = FONT_NAME
-            p.font.size = Pt(16)
-            p.font.color.rgb = MCKINSEY_COLORS["text"]
-            p.level = 0
-            p.space_after = Pt(12)
-
-    # Add image
-    img_stream = validated_image_bytes(image_path)
-    if not img_stream:
-        img_stream = validated_image_bytes("fallback.jpg")
-
-    if img_stream:
-        try:
-            available_width = Inches(5.8)
-            available_height = Inches(4.5)
-            with Image.open(image_path if os.path.exists(image_path) else "fallback.jpg") as img:
-                original_width, original_height = img.size
-                aspect_ratio = original_width / original_height
-                if aspect_ratio > (available_width.inches / available_height.inches):
-                    img_width = available_width
-                    img_height = Inches(available_width.inches / aspect_ratio)
-                else:
-                    img_height = available_height
-                    img_width = Inches(available_height.inches * aspect_ratio)
-                img_width = max(img_width, Inches(4.0))
-                img_height = max(img_height, Inches(3.0))
-            img_x = Inches(7.0)
-            img_y = Inches(1.8) + (available_height - img_height) / 2
-            pic = slide.shapes.add_picture(img_stream, img_x, img_y, width=img_width, height=img_height)
-            pic.line.color.rgb = MCKINSEY_COLORS["light_gray"]
-            pic.line.width = Pt(1)
-        except Exception as e:
-            print(f"[Image Error] {e}")
-
-# === AI NARRATION GENERATION ===
-
-# def generate_narration_script(parsed_data, topic):
-#     """Generate AI narration script for the entire presentation."""
-#     logger.info("Generating narration script with AI...")
-    
-#     prompt = f"""
-#     Create a professional narration script for a PowerPoint presentation about "{topic}".
-#     The script should be engaging, clear, and suitable for text-to-speech conversion.
-    
-#     Presentation data:
-#     Introduction: {parsed_data.get("intro", "")}
-    
-#     Slides:
-#     """
-    
-#     for i, slide in enumerate(parsed_data.get("slides", []), 1):
-#         prompt += f"\nSlide {i}: {slide.get('title', '')}\n"
-#         prompt += f"Key Insight: {slide.get('insight', '')}\n"
-        
-#         if slide.get('type') == 'chart':
-#             chart_data = slide.get('data', {})
-#             prompt += f"Chart Type: {chart_data.get('type', 'Unknown')}\n"
-#             prompt += f"Chart Source: {chart_data.get('source', 'No source')}\n"
-#             if 'context' in slide:
-#                 prompt += f"Context: {slide['context']}\n"
-#         else:
-#             bullets = slide.get('data', [])
-#             if isinstance(bullets, list):
-#                 for bullet in bullets:
-#                     if isinstance(bullet, dict):
-#                         prompt += f"- {bullet.get('point', '')}: {bullet.get('desc', '')}\n"
-#                     else:
-#                         prompt += f"- {str(bullet)}\n"
-    
-#     prompt += f"""
-    
-#     Create a narration script with the following structure:
-#     1. Title slide: Welcome and introduction (20-30 seconds)
-#     2. For each content slide: Explain the title, key insight, and main points (30-45 seconds each)
-#     3. Keep the language conversational but professional
-#     4. Use smooth transitions between slides
-#     5. End with a brief conclusion
-    
-#     Format the response as JSON:
-#     {{
-#         "title_narration": "Welcome text for title slide...",
-#         "slide_narrations": [
-#             "Narration for slide 1...",
-#             "Narration for slide 2...",
-#             ...
-#         ],
-#         "conclusion": "Brief closing remarks..."
-#     }}
-#     """
-    
-#     try:
-#         response = llm.invoke(prompt).content
-#         # Parse JSON response
-#         narration_data = json.loads(response.strip())
-#         return narration_data
-#     except Exception as e:
-#         logger.error(f"Failed to generate narration script: {e}")
-#         # Fallback narration
-#         return {
-#             "title_narration": f"Welcome to this presentation about {topic}. Let's explore the key insights and analysis.",
-#             "slide_narrations": [f"This slide covers {slide.get('title', f'slide {i+1}')}. {slide.get('insight', 'Key information is presented here.')}" 
-#                                for i, slide in enumerate(parsed_data.get("slides", []))],
-#             "conclusion": "Thank you for your attention. This concludes our presentation."
-#         }
-def generate_narration_script(parsed_data, topic):
-    """Generate AI narration script for the entire presentation with better error handling."""
-    logger.info("Generating narration script with AI...")
-    
-    try:
-        prompt = f"""
-        Create a professional narration script for a PowerPoint presentation about "{topic}".
-        The script should be engaging, clear, and suitable for text-to-speech conversion.
-        
-        Presentation data:
-        Introduction: {parsed_data.get("intro", "")}
-        
-        Slides:
-        """
-        
-        for i, slide in enumerate(parsed_data.get("slides", []), 1):
-            prompt += f"\nSlide {i}: {slide.get('title', '')}\n"
-            prompt += f"Key Insight: {slide.get('insight', '')}\n"
-            
-            if slide.get('type') == 'chart':
-                chart_data = slide.get('data', {})
-                prompt += f"Chart Type: {chart_data.get('type', 'Unknown')}\n"
-                prompt += f"Chart Source: {chart_data.get('source', 'No source')}\n"
-                if 'context' in slide:
-                    prompt += f"Context: {slide['context']}\n"
-            else:
-                bullets = slide.get('data', [])
-                if isinstance(bullets, list):
-                    for bullet in bullets[:3]:  # Limit to first 3 bullets for prompt
-                        if isinstance(bullet, dict):
-                            prompt += f"- {bullet.get('point', '')}: {bullet.get('desc', '')}\n"
-                        else:
-                            prompt += f"- {str(bullet)}\n"
-        
-        prompt += f"""
-        
-        Create a narration script with the following structure:
-        1. Title slide: Welcome and introduction (20-30 seconds)
-        2. For each content slide: Explain the title, key insight, and main points (30-45 seconds each)
-        3. Keep the language conversational but professional
-        4. Use smooth transitions between slides
-        5. End with a brief conclusion
-        
-        Return only a JSON object in this exact format:
-        {{
-            "title_narration": "Welcome text for title slide...",
-            "slide_narrations": [
-                "Narration for slide 1...",
-                "Narration for slide 2..."
-            ],
-            "conclusion": "Brief closing remarks..."
-        }}
-        """
-        
-        response = llm.invoke(prompt).content.strip()
-        
-        # Clean up response - remove markdown formatting if present
-        if response.startswith("```json"):
-            response = response.replace("```json", "").replace("```", "").strip()
-        elif response.startswith("```"):
-            response = response.replace("```", "", 1).replace("```", "").strip()
-        
-        # Parse JSON response
-        import json
-        try:
-            narration_data = json.loads(response)
-            
-            # Validate the structure
-            if not isinstance(narration_data, dict):
-                raise ValueError("Response is not a dictionary")
-            
-            if "title_narration" not in narration_data:
-                narration_data["title_narration"] = f"Welcome to this presentation about {topic}."
-            
-            if "slide_narrations" not in narration_data or not isinstance(narration_data["slide_narrations"], list):
-                narration_data["slide_narrations"] = []
-            
-            if "conclusion" not in narration_data:
-                narration_data["conclusion"] = "Thank you for your attention."
-            
-            return narration_data
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}")
-            logger.error(f"Response was: {response[:500]}...")
-            raise
-            
-    except Exception as e:
-        logger.error(f"Failed to generate narration script: {e}")
-        # Fallback narration
-        return {
-            "title_narration": f"Welcome to this presentation about {topic}. Let's explore the key insights and analysis.",
-            "slide_narrations": [f"This slide covers {slide.get('title', f'slide {i+1}')}. {slide.get('insight', 'Key information is presented here.')}" 
-                               for i, slide in enumerate(parsed_data.get("slides", []))],
-            "conclusion": "Thank you for your attention. This concludes our presentation."
-        }
-def create_audio_from_text(text, output_path, lang='en', slow=False):
-    """Create audio file from text using gTTS."""
-    try:
-        logger.info(f"Creating audio: {output_path[:50]}...")
-        tts = gTTS(text=text, lang=lang, slow=slow)
-        tts.save(output_path)
-        return output_path
-    except Exception as e:
-        logger.error(f"Failed to create audio: {e}")
-        return None
-
-# def get_audio_duration(audio_path):
-#     """Get the duration of an audio file."""
-#     try:
-#         audio = mp.AudioFileClip(audio_path)
-#         duration = audio.duration
-#         audio.close()
-#         return duration
-#     except Exception as e:
-#         logger.error(f"Failed to get audio duration: {e}")
-#         return VIDEO_CONFIG["slide_duration"]  # fallback duration
-
-def convert_mp3_to_wav(mp3_path):
-    """Convert MP3 to WAV using ffmpeg if available."""
-    wav_path = mp3_path.replace('.mp3', '.wav')
-    try:
-        # Try using ffmpeg if available
-        if shutil.which('ffmpeg'):
-            subprocess.run([
-                'ffmpeg', '-i', mp3_path, '-acodec', 'pcm_s16le', 
-                '-ar', '44100', wav_path, '-y'
-            ], check=True, capture_output=True, text=True)
-            return wav_path
-        else:
-            logger.warning("ffmpeg not found, using original MP3 file")
-            return mp3_path
-    except subprocess.CalledProcessError as e:
-        logger.warning(f"Failed to convert MP3 to WAV: {e}, using original file")
-        return mp3_path
-    except Exception as e:
-        logger.error(f"Audio conversion error: {e}")
-        return mp3_path
-# def create_video_from_slides_and_audio(image_files, audio_files, output_path):
-#     """Create video from slide images and audio files using OpenCV."""
-#     logger.info("Creating video from slides and audio using OpenCV...")
-    
-#     try:
-#         # Video writer setup
-#         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-#         video_writer = cv2.VideoWriter(
-#             output_path, 
-#             fourcc, 
-#             VIDEO_CONFIG["fps"], 
-#             (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"])
-#         )
-        
-#         temp_audio_files = []
-#         total_duration = 0
-        
-#         for i, (image_path, audio_path) in enumerate(zip(image_files, audio_files)):
-#             if not os.path.exists(image_path) or not os.path.exists(audio_path):
-#                 logger.warning(f"Missing file for slide {i+1}")
-#                 continue
-            
-#             # Get audio duration
-#             audio_duration = get_audio_duration(audio_path)
-#             total_duration += audio_duration
-#             logger.info(f"Slide {i+1}: {audio_duration:.1f}s duration")
-            
-#             # Convert MP3 to WAV if needed for better compatibility
-#             wav_path = convert_mp3_to_wav(audio_path)
-#             temp_audio_files.append((wav_path, audio_path))  # Store both paths
-            
-#             # Load and process image
-#             img = cv2.imread(image_path)
-#             if img is None:
-#                 logger.error(f"Could not load image: {image_path}")
-#                 continue
-                
-#             # Resize image to video dimensions
-#             img_resized = cv2.resize(img, (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"]))
-            
-#             # Calculate number of frames for this slide
-#             num_frames = int(audio_duration * VIDEO_CONFIG["fps"])
-            
-#             # Write frames for this slide
-#             for frame_num in range(num_frames):
-#                 # Add simple fade effect for transitions (optional)
-#                 if i > 0 and frame_num < int(VIDEO_CONFIG["fps"] * VIDEO_CONFIG["transition_duration"]):
-#                     # Fade in effect
-#                     alpha = frame_num / (VIDEO_CONFIG["fps"] * VIDEO_CONFIG["transition_duration"])
-#                     # Create a simple fade by blending with a black frame
-#                     black_frame = np.zeros_like(img_resized)
-#                     faded_img = cv2.addWeighted(img_resized, alpha, black_frame, 1-alpha, 0)
-#                     video_writer.write(faded_img)
-#                 else:
-#                     video_writer.write(img_resized)
-            
-#             logger.info(f"Processed slide {i+1}: {num_frames} frames ({audio_duration:.1f}s)")
-        
-#         video_writer.release()
-#         logger.info(f"Video frames written. Total duration: {total_duration:.1f}s")
-        
-#         # Now we need to add audio to the video
-#         final_output_path = output_path.replace('.mp4', '_final.mp4')
-        
-#         if shutil.which('ffmpeg') and len(temp_audio_files) > 0:
-#             try:
-#                 # Concatenate all audio files
-#                 audio_list_file = output_path.replace('.mp4', '_audio_list.txt')
-#                 with open(audio_list_file, 'w', encoding='utf-8') as f:
-#                     for wav_path, _ in temp_audio_files:
-#                         # Use absolute path and escape for Windows
-#                         abs_path = os.path.abspath(wav_path).replace('\\', '/')
-#                         f.write(f"file '{abs_path}'\n")
-                
-#                 concat_audio_path = output_path.replace('.mp4', '_combined_audio.wav')
-                
-#                 logger.info("Combining audio files...")
-#                 # Combine audio files
-#                 result = subprocess.run([
-#                     'ffmpeg', '-f', 'concat', '-safe', '0', '-i', audio_list_file,
-#                     '-c', 'copy', concat_audio_path, '-y'
-#                 ], capture_output=True, text=True)
-                
-#                 if result.returncode != 0:
-#                     logger.error(f"FFmpeg audio concat failed: {result.stderr}")
-#                     raise subprocess.CalledProcessError(result.returncode, 'ffmpeg')
-                
-#                 logger.info("Combining video with audio...")
-#                 # Combine video with audio
-#                 result = subprocess.run([
-#                     'ffmpeg', '-i', output_path, '-i', concat_audio_path,
-#                     '-c:v', 'copy', '-c:a', 'aac', '-shortest', 
-#                     final_output_path, '-y'
-#                 ], capture_output=True, text=True)
-                
-#                 if result.returncode != 0:
-#                     logger.error(f"FFmpeg video+audio combine failed: {result.stderr}")
-#                     raise subprocess.CalledProcessError(result.returncode, 'ffmpeg')
-                
-#                 # Clean up temporary files
-#                 try:
-#                     os.remove(output_path)  # Remove video-only file
-#                     os.remove(audio_list_file)
-#                     os.remove(concat_audio_path)
-                    
-#                     # Move final file to original name
-#                     shutil.move(final_output_path, output_path)
-#                 except Exception as cleanup_error:
-#                     logger.warning(f"Cleanup error: {cleanup_error}")
-                
-#                 logger.info(f"Video with audio created successfully: {output_path}")
-#                 return output_path
-                
-#             except subprocess.CalledProcessError as e:
-#                 logger.error(f"FFmpeg error: {e}")
-#                 logger.info(f"Video created without audio: {output_path}")
-#                 return output_path
-#             except Exception as e:
-#                 logger.error(f"Unexpected error during audio-video combination: {e}")
-#                 logger.info(f"Video created without audio: {output_path}")
-#                 return output_path
-#         else:
-#             if not shutil.which('ffmpeg'):
-#                 logger.warning("ffmpeg not found - video created without audio")
-#             logger.info(f"Video created: {output_path}")
-#             return output_path
-        
-#     except Exception as e:
-#         logger.error(f"Failed to create video: {e}")
-#         return None
-#     finally:
-#         # Clean up temporary audio files
-#         for wav_path, original_path in temp_audio_files:
-#             if wav_path != original_path and os.path.exists(wav_path):
-#                 try:
-#                     os.remove(wav_path)
-#                 except Exception as e:
-#                     logger.warning(f"Failed to clean up temp audio file {wav_path}: {e}")
-
-# Also add these imports at the top of your file if not already present:
-
-def get_audio_duration(audio_path):
-    """Get the duration of an audio file using file size estimation."""
-    try:
-        if audio_path.endswith('.mp3'):
-            # For MP3, estimate duration from file size
-            file_size = os.path.getsize(audio_path)
-            # Rough estimation: 1MB â‰ˆ 60 seconds for typical speech
-            # More conservative estimate for better sync
-            estimated_duration = max(3, file_size / (1024 * 15))  # Adjust divisor for accuracy
-            return estimated_duration
-        elif audio_path.endswith('.wav'):
-            # For WAV files, try to use wave module
-            import wave
-            with wave.open(audio_path, 'r') as wav_file:
-                frames = wav_file.getnframes()
-                rate = wav_file.getframerate()
-                duration = frames / float(rate)
-                return duration
-        else:
-            return VIDEO_CONFIG["slide_duration"]  # fallback
-    except Exception as e:
-        logger.error(f"Failed to get audio duration: {e}")
-        return VIDEO_CONFIG["slide_duration"]  # fallback duration
-# === PPT TO VIDEO CONVERSION ===
-
-# def convert_ppt_to_images(ppt_path, output_dir):
-#     """Convert PowerPoint slides to images."""
-#     logger.info(f"Converting PPT to images: {ppt_path}")
-    
-#     try:
-#         # Create output directory
-#         os.makedirs(output_dir, exist_ok=True)
-        
-#         # Use python-pptx to read the presentation
-#         prs = Presentation(ppt_path)
-#         image_files = []
-        
-#         # For each slide, we'll create a screenshot-like image
-#         # Note: This is a simplified approach. For better quality, you might need
-#         # to use tools like LibreOffice in headless mode or other conversion tools
-        
-#         for i, slide in enumerate(prs.slides):
-#             image_path = os.path.join(output_dir, f"slide_{i+1:02d}.png")
-            
-#             # Create a blank image with presentation dimensions
-#             # Convert inches to pixels (assuming 96 DPI)
-#             width_px = int(prs.slide_width.inches * 96)
-#             height_px = int(prs.slide_height.inches * 96)
-            
-#             # Scale to video resolution
-#             scale_x = VIDEO_CONFIG["width"] / width_px
-#             scale_y = VIDEO_CONFIG["height"] / height_px
-#             scale = min(scale_x, scale_y)
-            
-#             final_width = int(width_px * scale)
-#             final_height = int(height_px * scale)
-            
-#             # Create image (this is a placeholder - in practice you'd need proper PPT rendering)
-#             img = Image.new('RGB', (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"]), 
-#                           color=VIDEO_CONFIG["background_color"])
-            
-#             draw = ImageDraw.Draw(img)
-            
-#             # Add slide number and basic layout
-#             draw.rectangle([50, 50, VIDEO_CONFIG["width"]-50, VIDEO_CONFIG["height"]-50], 
-#                          outline=(200, 200, 200), width=2)
-            
-#             # Add slide number
-#             try:
-#                 font = ImageDraw.ImageFont.load_default()
-#                 draw.text((VIDEO_CONFIG["width"]//2, 100), f"Slide {i+1}", 
-#                          fill=(50, 50, 50), font=font, anchor="mm")
-#             except:
-#                 draw.text((VIDEO_CONFIG["width"]//2, 100), f"Slide {i+1}", 
-#                          fill=(50, 50, 50), anchor="mm")
-            
-#             img.save(image_path, 'PNG', quality=95)
-#             image_files.append(image_path)
-#             logger.info(f"Created slide image: {image_path}")
-        
-#         return image_files
-        
-#     except Exception as e:
-#         logger.error(f"Failed to convert PPT to images: {e}")
-#         return []
-import subprocess, glob
-
-import subprocess, glob, shutil
-
-import subprocess, glob, os, shutil
-from pdf2image import convert_from_path
-
-def convert_ppt_to_images(ppt_path, output_dir):
-    """Convert PPT to images (one PNG per slide) using LibreOffice + pdf2image."""
-    logger.info(f"Converting PPT to images via PDF: {ppt_path}")
-    os.makedirs(output_dir, exist_ok=True)
-
-    try:
-        # Step 1: Convert PPT â†’ PDF
-        cmd = [
-            "soffice", "--headless", "--convert-to", "pdf",
-            "--outdir", output_dir, ppt_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            logger.error(f"LibreOffice PDF export failed: {result.stderr}")
-            return []
-
-        # Step 2: Find the generated PDF
-        base = os.path.splitext(os.path.basename(ppt_path))[0]
-        pdf_path = os.path.join(output_dir, base + ".pdf")
-        if not os.path.exists(pdf_path):
-            logger.error("PDF not found after LibreOffice export")
-            return []
-
-        # Step 3: Convert PDF pages â†’ PNGs
-        images = convert_from_path(pdf_path, dpi=200)
-        image_files = []
-        for i, page in enumerate(images, start=1):
-            img_file = os.path.join(output_dir, f"slide_{i:02d}.png")
-            page.save(img_file, "PNG")
-            image_files.append(img_file)
-
-        logger.info(f"Generated {len(image_files)} slide images")
-        return image_files
-
-    except Exception as e:
-        logger.error(f"Failed to convert PPT to images: {e}")
-        return []
-
-# def create_video_from_slides_and_audio(image_files, audio_files, output_path):
-#     """Create video from slide images and audio files."""
-#     logger.info("Creating video from slides and audio...")
-    
-#     try:
-#         video_clips = []
-        
-#         for i, (image_path, audio_path) in enumerate(zip(image_files, audio_files)):
-#             if not os.path.exists(image_path) or not os.path.exists(audio_path):
-#                 logger.warning(f"Missing file for slide {i+1}")
-#                 continue
-            
-#             # Get audio duration
-#             audio_duration = get_audio_duration(audio_path)
-            
-#             # Create image clip
-#             img_clip = mp.ImageClip(image_path, duration=audio_duration)
-            
-#             # Load audio
-#             audio_clip = mp.AudioFileClip(audio_path)
-            
-#             # Combine image and audio
-#             video_clip = img_clip.set_audio(audio_clip)
-            
-#             # Add fade transition
-#             if i > 0:
-#                 video_clip = video_clip.fadein(VIDEO_CONFIG["transition_duration"])
-            
-#             video_clips.append(video_clip)
-        
-#         if not video_clips:
-#             raise Exception("No valid video clips created")
-        
-#         # Concatenate all clips
-#         final_video = mp.concatenate_videoclips(video_clips, method="compose")
-        
-#         # Write the video file
-#         final_video.write_videofile(
-#             output_path,
-#             fps=VIDEO_CONFIG["fps"],
-#             codec='libx264',
-#             audio_codec='aac',
-#             temp_audiofile='temp-audio.m4a',
-#             remove_temp=True,
-#             verbose=False,
-#             logger=None
-#         )
-        
-#         # Clean up
-#         for clip in video_clips:
-#             clip.close()
-#         final_video.close()
-        
-#         logger.info(f"Video created successfully: {output_path}")
-#         return output_path
-        
-#     except Exception as e:
-#         logger.error(f"Failed to create video: {e}")
-#         return None
-def create_video_from_slides_and_audio(image_files, audio_files, output_path):
-    """Create video from slide images and audio files."""
-    logger.info("Creating video from slides and audio...")
-    
-    try:
-        import moviepy.editor as mp_editor
-        
-        video_clips = []
-        
-        for i, (image_path, audio_path) in enumerate(zip(image_files, audio_files)):
-            if not os.path.exists(image_path) or not os.path.exists(audio_path):
-                logger.warning(f"Missing file for slide {i+1}")
-                continue
-            
-            # Get audio duration
-            audio_duration = get_audio_duration(audio_path)
-            logger.info(f"Slide {i+1}: {audio_duration:.1f}s duration")
-            
-            # Create image clip - CORRECTED
-            img_clip = mp_editor.ImageClip(image_path, duration=audio_duration)
-            
-            # Load audio - CORRECTED
-            audio_clip = mp_editor.AudioFileClip(audio_path)
-            
-            # Combine image and audio - CORRECTED
-            video_clip = img_clip.set_audio(audio_clip)
-            
-            # Add fade transition
-            if i > 0:
-                video_clip = video_clip.fadein(VIDEO_CONFIG["transition_duration"])
-            
-            video_clips.append(video_clip)
-            logger.info(f"Processed slide {i+1}")
-        
-        if not video_clips:
-            raise Exception("No valid video clips created")
-        
-        # Concatenate all clips
-        logger.info("Concatenating video clips...")
-        final_video = mp_editor.concatenate_videoclips(video_clips, method="compose")
-        
-        # Write the video file
-        logger.info(f"Writing video to {output_path}...")
-        final_video.write_videofile(
-            output_path,
-            fps=VIDEO_CONFIG["fps"],
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            verbose=False,
-            logger=None
-        )
-        
-        # Clean up
-        for clip in video_clips:
-            clip.close()
-        final_video.close()
-        
-        logger.info(f"Video created successfully: {output_path}")
-        return output_path
-        
-    except ImportError:
-        logger.error("MoviePy not properly installed. Please install with: pip install moviepy")
-        return None
-    except Exception as e:
-        logger.error(f"Failed to create video: {e}")
-        return None
-
-def create_presentation_video(parsed_data, topic, ppt_path):
-    """Main function to create video from presentation data."""
-    logger.info("Starting video creation process...")
-    
-    # Create temporary directories
-    temp_dir = tempfile.mkdtemp(prefix="ppt_video_")
-    images_dir = os.path.join(temp_dir, "images")
-    audio_dir = os.path.join(temp_dir, "audio")
-    
-    try:
-        os.makedirs(images_dir, exist_ok=True)
-        os.makedirs(audio_dir, exist_ok=True)
-        
-        # Step 1: Generate narration script
-        narration_data = generate_narration_script(parsed_data, topic)
-        
-        # Step 2: Create audio files
-        audio_files = []
-        
-        # Title slide audio
-        title_audio_path = os.path.join(audio_dir, "title.mp3")
-        if create_audio_from_text(narration_data["title_narration"], title_audio_path):
-            audio_files.append(title_audio_path)
-        
-        # Content slides audio
-        for i, narration in enumerate(narration_data["slide_narrations"]):
-            audio_path = os.path.join(audio_dir, f"slide_{i+1:02d}.mp3")
-            if create_audio_from_text(narration, audio_path):
-                audio_files.append(audio_path)
-        
-        # Conclusion audio (if exists)
-        if narration_data.get("conclusion"):
-            conclusion_audio_path = os.path.join(audio_dir, "conclusion.mp3")
-            if create_audio_from_text(narration_data["conclusion"], conclusion_audio_path):
-                audio_files.append(conclusion_audio_path)
-        
-        logger.info(f"Created {len(audio_files)} audio files")
-        
-        # Step 3: Convert PPT to images
-        image_files = convert_ppt_to_images(ppt_path, images_dir)
-        
-        # Ensure we have matching numbers of images and audio files
-        min_length = min(len(image_files), len(audio_files))
-        image_files = image_files[:min_length]
-        audio_files = audio_files[:min_length]
-        
-        if min_length == 0:
-            raise Exception("No matching image and audio files found")
-        
-        # Step 4: Create video
-        video_filename = topic.strip().replace(" ", "_") + "_presentation.mp4"
-        video_path = create_video_from_slides_and_audio(image_files, audio_files, video_filename)
-        
-        if video_path and os.path.exists(video_path):
-            logger.info(f"Video creation successful: {video_path}")
-            file_size = os.path.getsize(video_path) / (1024 * 1024)  # MB
-            logger.info(f"Video file size: {file_size:.1f} MB")
-            return video_path
-        else:
-            raise Exception("Video creation failed")
-    
-    except Exception as e:
-        logger.error(f"Video creation process failed: {e}")
-        return None
-    
-    finally:
-        # Clean up temporary files
-        try:
-            shutil.rmtree(temp_dir)
-            logger.info("Temporary files cleaned up")
-        except:
-            logger.warning("Failed to clean up temporary files")
-
-# === UTILITY FUNCTIONS ===
-
-def classify_paragraph_type(raw_text):
-    """Classifies the type of presentation based on user input text."""
-    prompt = f"""
-    Classify the following text into one category:
-    - business
-    - academic
-    - technical
-    - educational
-    - motivational
-    - general
-
-    Text:
-    \"\"\"{raw_text}\"\"\"
-
-    Respond with only one word (the category).
-    """
-    result = llm.invoke(prompt).content.strip().lower()
-    if result not in ["business", "academic", "technical", "educational", "motivational", "general"]:
-        return "business"  # default fallback
-    return result
-
-def refine_paragraph_input(raw_text, category="business"):
-    """Refines raw text differently depending on content type."""
-    style_guidelines = {
-        "business": "Make it concise, factual, and strategic. Focus on insights, numbers, and implications.",
-        "academic": "Make it clear, explanatory, with definitions and logical flow.",
-        "technical": "Make it precise, structured, with focus on processes, systems, and technical clarity.",
-        "educational": "Make it simple, clear, and beginner-friendly with learning outcomes.",
-        "motivational": "Make it inspiring, story-driven, with positive tone and key messages.",
-        "general": "Make it well-structured, clear, and neutral."
-    }
-
-    guidelines = style_guidelines.get(category, style_guidelines["business"])
-
-    prompt = f"""
-    Refine and summarize the following text for a professional {category} presentation.
-    {guidelines}
-    Output 5-6 concise paragraphs, well-structured for slide generation.
-    Do not use bold, italics, underlines, Markdown symbols (like *, **, _), or any decorative formatting.
-    Only plain text should be returned.
-    Text:
-    \"\"\"{raw_text}\"\"\"
-
-    Refined version:
-    """
-    return llm.invoke(prompt).content
-
-def get_slide_content_from_paragraph(context_text, category="business", min_slides=1, max_slides=15):
-    """Generate slide content from paragraph input."""
-    style_instructions = {
-        "business": "Use a McKinsey-style with charts, insights, and data-driven points.",
-        "academic": "Use an academic style with definitions, theories, and structured explanation.",
-        "technical": "Use a technical style with system diagrams, architecture, workflows, or pseudocode.",
-        "educational": "Use an educational style with simple language, learning outcomes, and key concepts.",
-        "motivational": "Use a motivational style with quotes, storytelling, and call-to-action messages.",
-        "general": "Use a general informative style with clarity and balanced explanation."
-    }
-    style = style_instructions.get(category, style_instructions["business"])
-
-    prompt = f"""
-    You are preparing a professional {category} PowerPoint presentation outline 
-    based on the following refined content:
-
-    \"\"\"{context_text}\"\"\"
-
-    Rules:
-    - Create between {min_slides} and {max_slides} slides depending on content richness.
-    - {style}
-    - Return ONLY valid JSON, no explanations or markdown.
-    - "intro" must be maximum 2-3 lines.
-    - Each slide must include:
-      - "title": max 8 words
-      - "insight": one or two sentences summarizing the key takeaway
-      - "type": either "bullets" or "chart"
-      - If "type" = "bullets", "data" must be an array of objects:
-        {{"point": "short phrase", "desc": "5-6 line proper explanation"}}
-      - If "type" = "chart", "data" must be JSON:
-        {{
-          "type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
-          "data": [["Label1", 123], ["Label2", 456]],
-          "source": "Source: Organization, 2025"
-        }}
-        and optionally include "context": "Why this data matters"
-
-    JSON format:
-    {{
-      "intro": "short intro text",
-      "slides": [
-        {{
-          "title": "Slide Title",
-          "insight": "Key insight",
-          "type": "bullets",
-          "data": [
-            {{"point": "Clarity", "desc": "Use straightforward language to avoid confusion"}},
-            {{"point": "Audience Awareness", "desc": "Adapt tone and style to the readers"}}
-          ]
-        }},
-        {{
-          "title": "Slide with Chart",
-          "insight": "Data-driven point",
-          "type": "chart",
-          "data": {{
-            "type": "COLUMN",
-            "data": [["X", 10], ["Y", 20]],
-            "source": "Source: Example Org, 2025"
-          }},
-          "context": "Why this data is important"
-        }}
-      ]
-    }}
-    """
-    return llm.invoke(prompt).content
-
-def generate_topic_from_paragraph(context_text):
-    """Generate a topic title from paragraph content."""
-    prompt = f"""
-    Generate a concise, professional presentation title (max 6 words) from this content:
-    "{context_text[:200]}..."
-    
-    Return only the title, no quotes or formatting.
-    """
-    return llm.invoke(prompt).content.strip()
-
-# === MAIN EXECUTION ===
-
-if __name__ == "__main__":
-    print("=== PPT to Video Converter with AI Narration ===\n")
-    
-    mode = input("Choose input mode (1=Topic, 2=Paragraph): ").strip()
-    create_video = input("Create video after PPT? (y/n): ").strip().lower() == 'y'
-
-    if mode == "1":
-        # === Topic-based workflow ===
-        topic = input("Enter your presentation topic: ").strip()
-        try:
-            n = int(input("Number of slides: "))
-            if n < 1:
-                raise ValueError("Slide count must be at least 1.")
-        except Exception as e:
-            print(f"Invalid input: {e}")
-            exit()
-
-        print(f"\n[1/4] Generating JSON content with AI for '{topic}'...")
-        raw_content = get_slide_content_with_charts(topic, n)
-
-        print("[2/4] Parsing JSON response...")
-        parsed_slides = parse_json_slides(raw_content)
-
-        if not parsed_slides.get("slides"):
-            print("Failed to generate or parse JSON content. Please try again.")
-            exit()
-
-        print(f"[3/4] Building PowerPoint presentation...")
-        ppt_path = build_mckinsey_ppt(parsed_slides, topic)
-        
-        if create_video:
-            print(f"[4/4] Creating video with AI narration...")
-            video_path = create_presentation_video(parsed_slides, topic, ppt_path)
-            if video_path:
-                print(f"\n SUCCESS!")
-                print(f" PowerPoint: {ppt_path}")
-                print(f" Video: {video_path}")
-            else:
-                print(f"\nâš ï¸  PowerPoint created: {ppt_path}")
-                print("âŒ Video creation failed")
-
-    elif mode == "2":
-        # === Paragraph-based workflow ===
-        context_text = input("Enter paragraph/context for your presentation: ").strip()
-
-        print("\n[1/6] Detecting content type...")
-        category = classify_paragraph_type(context_text)
-        print(f" Detected category: {category}")
-
-        print("\n[2/6] Refining input text...")
-        refined_text = refine_paragraph_input(context_text, category)
-
-        topic = generate_topic_from_paragraph(context_text)
-        print(f"â†’ Generated topic: {topic}")
-
-        print("\n[3/6] Generating JSON slides...")
-        raw_content = get_slide_content_from_paragraph(refined_text, category)
-
-        print("[4/6] Parsing JSON response...")
-        parsed_slides = parse_json_slides(raw_content)
-
-        if not parsed_slides.get("slides"):
-            print("Failed to generate or parse JSON content. Please try again.")
-            exit()
-
-        print(f"[5/6] Building PowerPoint presentation...")
-        ppt_path = build_mckinsey_ppt(parsed_slides, topic)
-        
-        if create_video:
-            print(f"[6/6] Creating video with AI narration...")
-            video_path = create_presentation_video(parsed_slides, topic, ppt_path)
-            if video_path:
-                print(f"\n SUCCESS!")
-                print(f"PowerPoint: {ppt_path}")
-                print(f" Video: {video_path}")
-            else:
-                print(f"\nPowerPoint created: {ppt_path}")
-                print(" Video creation failed")
-
-    else:
+import os
+import re
+import subprocess
+import wave
+
+import tempfile
+import shutil
+import logging
+from pathlib import Path
+import requests
+import json
+from pptx.enum.text import MSO_AUTO_SIZE
+import re
+import json
+from pptx import Presentation
+from pptx.util import Inches, Pt
+from pptx.dml.color import RGBColor
+from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
+from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION, XL_DATA_LABEL_POSITION
+from pptx.chart.data import CategoryChartData
+from pptx.opc.constants import RELATIONSHIP_TARGET_MODE as RTM, RELATIONSHIP_TYPE as RT
+try:  # private python-pptx API, only needed to merge sharded builds (see sharded_build_supported)
+    from pptx.opc.package import _Relationship
+except ImportError:
+    _Relationship = None
+from pptx.opc.packuri import PackURI
+from dotenv import load_dotenv
+from langchain_groq import ChatGroq
+from PIL import Image, ImageDraw
+from io import BytesIO
+from bs4 import BeautifulSoup
+from datetime import datetime
+import cv2
+import numpy as np
+from gtts import gTTS
+import moviepy as mp
+
+import tempfile
+import shutil
+from pathlib import Path
+import time
+import random
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from fractions import Fraction
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+import hashlib
+import heapq
+import itertools
+import contextvars
+import platform
+import sqlite3
+import bisect
+import zlib
+import logging
+
+# === Setup logging ===
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# === Load environment variables ===
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY_1")
+GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID_1")
+UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
+
+# === LLM Rate Limiting ===
+LLM_RATE_LIMITS = {
+    "requests_per_minute": int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+    "tokens_per_minute": int(os.getenv("GROQ_TOKENS_PER_MINUTE", "8000")),
+    "expected_output_tokens": 1500,  # reserved per call until the real usage is known
+    "initial_concurrency": 4,
+    "min_concurrency": 1,
+    "max_concurrency": 16,
+    "max_retries": 5,
+    "base_backoff": 1.0,  # seconds
+    "max_backoff": 60.0,
+}
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at capacity per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available, then take them."""
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(min(delay, 5.0))
+
+    def adjust(self, delta):
+        """Give back (positive) or charge (negative) tokens once the real cost is known."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + delta)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit: grows slowly on success, halves on every 429."""
+
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= max(self.minimum, int(self.limit)):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+                logger.warning(f"LLM rate limited, concurrency reduced to {int(self.limit)}")
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            self.cond.notify_all()
+
+def _llm_error_status(error):
+    """Best-effort HTTP status code of an LLM client exception."""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status
+
+def _parse_reset_duration(value):
+    """Parse Groq style reset durations ("7.66s", "2m59.56s", "120ms") or plain seconds."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    match = re.fullmatch(r"(?:(\d+)h)?(?:(\d+)m(?!s))?(?:([\d.]+)s)?(?:([\d.]+)ms)?", str(value).strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, millis = match.groups()
+    return (int(hours or 0) * 3600 + int(minutes or 0) * 60
+            + float(seconds or 0) + float(millis or 0) / 1000.0)
+
+def _retry_after_seconds(error):
+    """Read the server requested delay from retry-after style response headers."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = headers.get(header)
+        if value:
+            seconds = _parse_reset_duration(value)
+            if seconds is not None:
+                return seconds
+    return None
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token)."""
+    return max(1, len(str(text)) // 4)
+
+class RateLimitedLLM:
+    """Shared wrapper around the chat model enforcing provider limits for every call site.
+
+    Requests pass a requests/min and a tokens/min bucket plus an adaptive
+    concurrency limit. Rate limit and transient errors are retried with jittered
+    exponential backoff, honouring retry-after headers.
+    """
+
+    def __init__(self, client, limits=None):
+        self.client = client
+        self.limits = dict(LLM_RATE_LIMITS, **(limits or {}))
+        self.request_bucket = TokenBucket(self.limits["requests_per_minute"])
+        self.token_bucket = TokenBucket(self.limits["tokens_per_minute"])
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            self.limits["initial_concurrency"],
+            self.limits["min_concurrency"],
+            self.limits["max_concurrency"],
+        )
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _wait_if_paused(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _is_retryable(self, error):
+        status = _llm_error_status(error)
+        if status is not None:
+            return status == 429 or status >= 500
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+    def invoke(self, prompt, **kwargs):
+        reserved = estimate_tokens(prompt) + self.limits["expected_output_tokens"]
+
+        for attempt in range(self.limits["max_retries"] + 1):
+            self._wait_if_paused()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(reserved)
+            self.concurrency.acquire()
+            try:
+                response = self.client.invoke(prompt, **kwargs)
+            except Exception as e:
+                throttled = _llm_error_status(e) == 429
+                self.concurrency.release(throttled=throttled)
+                if not self._is_retryable(e) or attempt == self.limits["max_retries"]:
+                    raise
+                retry_after = _retry_after_seconds(e)
+                if throttled and retry_after:
+                    self._pause(retry_after)
+                backoff = min(self.limits["max_backoff"], self.limits["base_backoff"] * 2 ** attempt)
+                delay = max(retry_after or 0.0, random.uniform(0, backoff))
+                logger.warning(f"LLM call failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.concurrency.release()
+            usage = getattr(response, "usage_metadata", None) or {}
+            if usage.get("total_tokens"):
+                self.token_bucket.adjust(reserved - usage["total_tokens"])
+            return response
+
+# === Initialize LLM ===
+llm = RateLimitedLLM(ChatGroq(
+    groq_api_key=GROQ_API_KEY,
+    model_name="openai/gpt-oss-20b",
+))
+
+# === Enhanced McKinsey Style Constants ===
+MCKINSEY_COLORS = {
+    "blue": RGBColor(12, 74, 126),
+    "light_blue": RGBColor(79, 129, 189),
+    "dark_blue": RGBColor(6, 45, 85),
+    "accent_blue": RGBColor(102, 170, 238),
+    "gray": RGBColor(89, 89, 89),
+    "light_gray": RGBColor(217, 217, 217),
+    "dark_gray": RGBColor(64, 64, 64),
+    "background": RGBColor(255, 255, 255),
+    "text": RGBColor(0, 0, 0),
+    "white": RGBColor(255, 255, 255)
+}
+FONT_NAME = "Aptos Display"
+
+# === Video Configuration ===
+VIDEO_CONFIG = {
+    "width": 1920,
+    "height": 1080,
+    "fps": 30,
+    "slide_duration": 8,  # seconds per slide (will be adjusted based on audio)
+    "transition_duration": 0.5,  # seconds for transitions
+    "background_color": (255, 255, 255),  # White background
+    "output_format": os.getenv("VIDEO_OUTPUT_FORMAT", "mp4"),  # mp4 | hls (see HLS_CONFIG)
+    "encoding_profile": "static",  # see ENCODING_PROFILES
+    "transition_style": "crossfade",  # crossfade | fade_black | none
+    "quality": "final",  # see RENDER_PROFILES
+    "dpi": 200,  # slide rasterization
+    "save_slide_images": False,  # keep a PNG per slide; otherwise pages are piped to the encoder
+    "keyframe_interval": 2,  # seconds between forced keyframes, so players can seek inside a slide
+    # e.g. "1080p,720p,480p": encode these RENDITION_LADDER entries in one pass
+    "rendition_ladder": [name for name in os.getenv("VIDEO_LADDER", "").split(",") if name.strip()],
+    "bullet_reveal": os.getenv("VIDEO_BULLET_REVEAL", "0") == "1",  # fade bullets in with the narration
+}
+
+# === Render Quality Profiles ===
+# Each profile overrides VIDEO_CONFIG for one render (see get_render_settings)
+RENDER_PROFILES = {
+    "preview": {
+        "dpi": 50, "width": 854, "height": 480, "fps": 10,
+        "x264_preset": "ultrafast", "crf": 32, "audio_bitrate": "64k",
+    },
+    "draft": {
+        "dpi": 100, "width": 1280, "height": 720, "fps": 24,
+        "x264_preset": "veryfast", "crf": 26, "audio_bitrate": "96k",
+    },
+    "final": {
+        "dpi": 200, "width": 1920, "height": 1080, "fps": 30,
+        "x264_preset": "medium", "crf": 20, "audio_bitrate": "128k",
+    },
+}
+
+# === DECK MODEL ===
+
+CHART_TYPES = ("BAR", "COLUMN", "LINE", "PIE", "DOUGHNUT", "AREA", "SCATTER", "STACKED_BAR")
+DECK_FORMAT_MAGIC = b"DECK\x01"
+DECK_CACHE_DIR = os.getenv("DECK_CACHE_DIR", ".deck_cache")
+DECK_CACHE_MODE = os.getenv("DECK_CACHE", "on")  # on | refresh (regenerate and overwrite) | off
+DECK_MIN_RECOVERED = float(os.getenv("DECK_MIN_RECOVERED", "0.5"))  # share of real slides a usable deck needs
+
+CHART_CONFIG = {
+    # Point budget per chart type; longer series are downsampled with LTTB
+    "max_points": {"LINE": 400, "AREA": 400, "SCATTER": 400},
+    "max_slices": 8,  # PIE/DOUGHNUT keep the top N-1 categories plus "Other"
+    "other_label": "Other",
+}
+
+NUMERIC_CLEANUP = str.maketrans("", "", "$€£¥%, \u00a0")
+
+def _coerce_numeric(values):
+    """Vectorized conversion of an object array of LLM values to float, NaN where not numeric.
+
+    Numeric strings are cleaned of currency symbols, thousands separators and
+    percent signs. Only entries that still fail to convert are handled one by one.
+    """
+    flat = np.asarray(values, dtype=object).ravel()
+    is_bool = np.fromiter((isinstance(v, bool) for v in flat), dtype=bool, count=flat.size)
+    strings = np.array([str(v).translate(NUMERIC_CLEANUP) if v is not None else "" for v in flat], dtype=str)
+    strings[is_bool] = ""
+    try:
+        result = np.where(strings == "", "nan", strings).astype(float)
+    except ValueError:
+        def safe(text):
+            try:
+                return float(text)
+            except ValueError:
+                return np.nan
+        result = np.array([safe(text) if text else np.nan for text in strings], dtype=float)
+    return result.reshape(np.shape(values))
+
+def normalize_chart_values(raw_data, chart_type):
+    """Turn chart rows [[label, v1, v2, ...], ...] into categories and a (series, points) array.
+
+    Ragged rows are padded with NaN. NaNs are interpolated for continuous chart
+    types (LINE/AREA/SCATTER) and set to 0 for the rest.
+    """
+    width = max(len(row) for row in raw_data)
+    categories = [str(row[0]) for row in raw_data]
+    padded = np.full((len(raw_data), width - 1), None, dtype=object)
+    for i, row in enumerate(raw_data):
+        padded[i, :len(row) - 1] = row[1:]
+    values = _coerce_numeric(padded).T  # one row per series
+
+    values[~np.isfinite(values)] = np.nan
+    if chart_type in ("LINE", "AREA", "SCATTER"):
+        positions = np.arange(values.shape[1])
+        for series in values:
+            valid = ~np.isnan(series)
+            if valid.any() and not valid.all():
+                series[~valid] = np.interp(positions[~valid], positions[valid], series[valid])
+    return categories, np.nan_to_num(values, nan=0.0)
+
+def lttb_indices(y, n_out):
+    """Largest-triangle-three-buckets: indices of n_out points preserving the shape of y."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        xs, ys = x[start:end], y[start:end]
+        areas = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+def downsample_chart(categories, values, chart_type, max_points=None, max_slices=None):
+    """Reduce a chart to its point budget: LTTB for line-like charts, top-N + "Other" for pies."""
+    if chart_type in ("PIE", "DOUGHNUT"):
+        max_slices = max_slices or CHART_CONFIG["max_slices"]
+        if len(categories) <= max_slices:
+            return categories, values
+        order = np.argsort(-values[0], kind="stable")
+        keep, rest = order[:max_slices - 1], order[max_slices - 1:]
+        other = values[:, rest].sum(axis=1, keepdims=True)
+        return ([categories[i] for i in keep] + [CHART_CONFIG["other_label"]],
+                np.concatenate([values[:, keep], other], axis=1))
+
+    max_points = max_points or CHART_CONFIG["max_points"].get(chart_type)
+    if max_points and len(categories) > max_points:
+        signal = values[0] if len(values) == 1 else values.sum(axis=0)
+        indices = lttb_indices(signal, max_points)
+        return [categories[i] for i in indices], values[:, indices]
+    return categories, values
+
+@dataclass(slots=True)
+class Bullet:
+    point: str
+    desc: str = ""
+
+    @classmethod
+    def from_raw(cls, raw):
+        if isinstance(raw, dict):
+            return cls(str(raw.get("point", "")).strip(), str(raw.get("desc", "") or "").strip())
+        return cls(str(raw).strip())
+
+@dataclass(slots=True)
+class Chart:
+    type: str
+    categories: list
+    series: list  # one list of floats per series, aligned with categories
+    series_names: list
+    source: str = ""
+
+    @classmethod
+    def from_dict(cls, chart_info):
+        """Validate chart JSON from the LLM ({"type", "data": rows, "source"})."""
+        if not isinstance(chart_info, dict):
+            raise ValueError("Chart data is missing or malformed.")
+        raw_data = chart_info.get("data", [])
+        if not raw_data or not isinstance(raw_data, list):
+            raise ValueError("Chart data is missing or malformed.")
+
+        chart_type = str(chart_info.get("type", "BAR")).upper()
+        if chart_type not in CHART_TYPES:
+            chart_type = "COLUMN"
+
+        if not all(isinstance(row, list) and len(row) >= 2 for row in raw_data):
+            raise ValueError("Invalid chart data format.")
+
+        categories, values = normalize_chart_values(raw_data, chart_type)
+        original_points = len(categories)
+        categories, values = downsample_chart(categories, values, chart_type)
+        if len(categories) < original_points:
+            logger.info(f"Downsampled {chart_type} chart from {original_points} to {len(categories)} points")
+
+        series = values.tolist()
+        names = [""] if len(series) == 1 else [f"Series {i + 1}" for i in range(len(series))]
+
+        return cls(chart_type, categories, series, names, str(chart_info.get("source", "") or ""))
+
+    def to_dict(self):
+        rows = [[category] + [values[i] for values in self.series] for i, category in enumerate(self.categories)]
+        return {"type": self.type, "data": rows, "source": self.source}
+
+@dataclass(slots=True)
+class Slide:
+    title: str
+    insight: str
+    type: str  # "bullets" | "chart"
+    bullets: list = field(default_factory=list)
+    chart: Chart = None
+    context: str = ""
+    is_placeholder: bool = False  # not serialized: decks with placeholders are never cached
+
+    @classmethod
+    def from_dict(cls, raw):
+        """Validate one slide dict from the LLM; raises ValueError if it is unusable."""
+        if not isinstance(raw, dict):
+            raise ValueError("Slide is not an object.")
+        title = raw.get("title")
+        if not isinstance(title, str) or not title.strip():
+            raise ValueError("Slide has no title.")
+        insight = raw.get("insight")
+        if not isinstance(insight, str):
+            raise ValueError("Slide has no insight.")
+        context = raw.get("context") or ""
+
+        if raw.get("type") == "chart":
+            return cls(title, insight, "chart", chart=Chart.from_dict(raw.get("data")), context=str(context))
+        if raw.get("type") == "bullets":
+            data = raw.get("data")
+            if not isinstance(data, list) or not data:
+                raise ValueError("Bullet slide has no bullets.")
+            return cls(title, insight, "bullets", bullets=[Bullet.from_raw(b) for b in data], context=str(context))
+        raise ValueError(f"Unknown slide type: {raw.get('type')}")
+
+    @classmethod
+    def placeholder(cls, position, title=None):
+        """Stand-in for a slide that could not be generated, so slide positions stay aligned."""
+        return cls(title or f"Slide {position + 1}", "", "bullets", bullets=[Bullet("Content unavailable")],
+                   is_placeholder=True)
+
+    def to_dict(self):
+        content = {"title": self.title, "insight": self.insight, "type": self.type}
+        if self.type == "chart":
+            content["data"] = self.chart.to_dict()
+        else:
+            content["data"] = [{"point": b.point, "desc": b.desc} for b in self.bullets]
+        if self.context:
+            content["context"] = self.context
+        return content
+
+@dataclass(slots=True)
+class Deck:
+    intro: str
+    slides: list
+
+    @classmethod
+    def from_dict(cls, parsed):
+        """Build a validated deck from parsed JSON.
+
+        Invalid slides, and positions still listed under "missing", are logged and
+        replaced by placeholders so the deck keeps its intended slide count.
+        """
+        slides = []
+        for i, raw in enumerate(parsed.get("slides", [])):
+            try:
+                slides.append(Slide.from_dict(raw))
+            except ValueError as e:
+                logger.warning(f"Slide {i + 1} is invalid ({e}); using a placeholder")
+                title = raw.get("title") if isinstance(raw, dict) else None
+                slides.append(Slide.placeholder(i, title.strip() if isinstance(title, str) else None))
+        for position in sorted(parsed.get("missing") or []):
+            logger.warning(f"Slide {position + 1} is missing; using a placeholder")
+            slides.insert(min(position, len(slides)), Slide.placeholder(position))
+        return cls(str(parsed.get("intro", "") or ""), slides)
+
+    @property
+    def recovered(self):
+        """Number of real (not placeholder) slides."""
+        return sum(not slide.is_placeholder for slide in self.slides)
+
+    def usable(self, min_share=None):
+        """Whether enough real slides were recovered to build a deck (see DECK_MIN_RECOVERED)."""
+        min_share = DECK_MIN_RECOVERED if min_share is None else min_share
+        return self.recovered > 0 and self.recovered >= min_share * len(self.slides)
+
+    def to_dict(self):
+        return {"intro": self.intro, "slides": [slide.to_dict() for slide in self.slides]}
+
+    def dumps(self):
+        """Compact binary form: magic header + zlib-compressed positional JSON."""
+        compact = [self.intro, [
+            [s.title, s.insight, s.context,
+             [[b.point, b.desc] for b in s.bullets] if s.type == "bullets" else None,
+             [s.chart.type, s.chart.categories, s.chart.series, s.chart.series_names, s.chart.source]
+             if s.type == "chart" else None]
+            for s in self.slides
+        ]]
+        payload = json.dumps(compact, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return DECK_FORMAT_MAGIC + zlib.compress(payload, 1)
+
+    @classmethod
+    def loads(cls, data):
+        if not data.startswith(DECK_FORMAT_MAGIC):
+            raise ValueError("Not a serialized deck.")
+        try:
+            intro, raw_slides = json.loads(zlib.decompress(data[len(DECK_FORMAT_MAGIC):]))
+            slides = []
+            for title, insight, context, bullets, chart in raw_slides:
+                if chart is not None:
+                    chart_type, categories, series, names, source = chart
+                    if any(len(values) != len(categories) for values in series):
+                        raise ValueError("Chart series length mismatch.")
+                    slides.append(Slide(title, insight, "chart",
+                                        chart=Chart(chart_type, categories, series, names, source), context=context))
+                else:
+                    slides.append(Slide(title, insight, "bullets",
+                                        bullets=[Bullet(point, desc) for point, desc in bullets], context=context))
+            return cls(intro, slides)
+        except (TypeError, ValueError, zlib.error) as e:
+            raise ValueError(f"Corrupt deck data: {e}")
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.dumps())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+def as_deck(parsed_data):
+    """Accept either a Deck or the parsed JSON dict."""
+    return parsed_data if isinstance(parsed_data, Deck) else Deck.from_dict(parsed_data)
+
+def deck_cache_path(*key_parts):
+    """Cache file for a deck generated from the given inputs (mode, topic, slide count, ...)."""
+    digest = hashlib.sha256(json.dumps(key_parts, default=str).encode("utf-8")).hexdigest()[:24]
+    return os.path.join(DECK_CACHE_DIR, f"{digest}.deck")
+
+def load_cached_deck(*key_parts):
+    path = deck_cache_path(*key_parts)
+    if DECK_CACHE_MODE != "on" or not os.path.exists(path):
+        return None
+    try:
+        deck = Deck.load(path)
+        logger.info(f"Loaded cached deck: {path}")
+        return deck
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable deck cache {path}: {e}")
+        return None
+
+def save_cached_deck(deck, *key_parts):
+    """Cache a deck; decks with placeholder slides are not cached, so the next run regenerates them."""
+    if DECK_CACHE_MODE == "off":
+        return None
+    if deck.recovered < len(deck.slides):
+        logger.warning(f"Not caching deck with {len(deck.slides) - deck.recovered} placeholder slides")
+        return None
+    os.makedirs(DECK_CACHE_DIR, exist_ok=True)
+    return deck.save(deck_cache_path(*key_parts))
+
+def get_slide_content_with_charts(topic, n_slides):
+    prompt = f"""
+    You are preparing a professional, data-driven PowerPoint presentation outline 
+    with exactly {n_slides} slides on the topic "{topic}".
+
+    Rules:
+    - Return ONLY valid JSON, no explanations or markdown.
+    - "intro" must be maximum 1â€“2 lines (<=150 characters).
+    - Each slide must include:
+      - "title": max 8 words
+      - "insight": one sentence
+      - "type": either "bullets" or "chart"
+      - If "type" = "bullets", "data" must be an array of objects:
+        {{"point": "short phrase", "desc": "1â€“2 line explanation"}}
+      - If "type" = "chart", "data" must be JSON:
+        {{
+          "type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
+          "data": [["Label1", 123], ["Label2", 456]],
+          "source": "Source: Organization, 2025"
+        }}
+        and optionally include "context": "Why this data matters"
+
+    JSON format:
+    {{
+      "intro": "short intro text",
+      "slides": [
+        {{
+          "title": "Slide Title",
+          "insight": "Key insight",
+          "type": "bullets",
+          "data": [
+            {{"point": "Clarity", "desc": "Use straightforward language to avoid confusion"}},
+            {{"point": "Audience Awareness", "desc": "Adapt tone and style to the readers"}}
+          ]
+        }},
+        {{
+          "title": "Slide with Chart",
+          "insight": "Data-driven point",
+          "type": "chart",
+          "data": {{
+            "type": "COLUMN",
+            "data": [["X", 10], ["Y", 20]],
+            "source": "Source: Example Org, 2025"
+          }},
+          "context": "Why this data is important"
+        }}
+      ]
+    }}
+    """
+    return llm.invoke(prompt).content
+
+def parse_mckinsey_response(text):
+    slides = []
+    intro_match = re.search(r"Introduction:\s*(.*?)\n---", text, re.DOTALL)
+    introduction = ""
+
+    slide_chunks = text.split('---')
+    for chunk in slide_chunks:
+        if not chunk.strip():
+            continue
+
+        try:
+            title_match = re.search(r"Title: (.*?)\n", chunk, re.IGNORECASE)
+            insight_match = re.search(r"Key Insight: (.*?)\n", chunk, re.IGNORECASE)
+            context_match = re.search(r"Context: (.*?)\n", chunk, re.IGNORECASE)
+
+            title = title_match.group(1).strip() if title_match else f"Slide {len(slides)+1}"
+            insight = insight_match.group(1).strip() if insight_match else None
+            context = context_match.group(1).strip() if context_match else ""
+
+            if not insight:
+                print(f"Skipping slide due to missing insight: {chunk[:100]}")
+                continue
+
+            content = {"title": title, "insight": insight, "context": context}
+
+            chart_match = re.search(r"Chart:\s*```json\n(.*?)\n```", chunk, re.DOTALL)
+            if chart_match:
+                try:
+                    chart_data = json.loads(chart_match.group(1).strip())
+                    content["type"] = "chart"
+                    content["data"] = chart_data
+                except json.JSONDecodeError:
+                    print(f"[Warning] Chart JSON malformed. Falling back to bullets.")
+                    content["type"] = "bullets"
+                    content["data"] = ["No chart data was available."]
+            else:
+                bullets_match = re.search(r"Bullets:\s*(.*)", chunk, re.DOTALL)
+                bullets_raw = bullets_match.group(1) if bullets_match else ""
+                bullets = [b.strip("- ").strip() for b in bullets_raw.split('\n') if b.strip()]
+                if not bullets:
+                    bullets = ["No content was provided by the AI for this slide."]
+                content["type"] = "bullets"
+                content["data"] = bullets
+
+            slides.append(content)
+        except Exception as e:
+            print(f"Could not parse a slide chunk, skipping. Error: {e}\nChunk: {chunk[:100]}...")
+            continue
+
+    return {"intro": introduction, "slides": slides}
+
+SMART_DOUBLE_QUOTES = "\u201c\u201d\u201e\u201f"
+
+def _strip_code_fences(text):
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = re.sub(r"^```(json)?", "", cleaned, flags=re.IGNORECASE).strip()
+        cleaned = re.sub(r"```$", "", cleaned).strip()
+    return cleaned
+
+def _close_json(chars, stack, in_string=False):
+    """Join scanned characters, closing an open string and any open brackets."""
+    text = "".join(chars)
+    if in_string:
+        text += '"'
+    text = re.sub(r"[\s,:]+$", "", text)
+    return text + "".join(reversed(stack))
+
+def _closes_string(text, i):
+    rest = text[i:].lstrip()
+    return not rest or rest[0] in ":,}]"
+
+def smart_quote_delimiters(text):
+    """Replace curly double quotes that delimit JSON strings with plain ones.
+
+    Curly quotes inside a string are left alone. A string opened by a curly quote
+    ends at the next quote followed by a JSON separator (or the end of the text).
+    """
+    out = []
+    in_string = None  # '"' or "smart" while inside a string
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif in_string == '"':
+                if ch == '"':
+                    in_string = None
+            elif ch in SMART_DOUBLE_QUOTES + '"':
+                if _closes_string(text, i + 1):
+                    ch = '"'
+                    in_string = None
+                elif ch == '"':
+                    ch = '\\"'
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = '"'
+        elif ch in SMART_DOUBLE_QUOTES:
+            ch = '"'
+            in_string = "smart"
+        out.append(ch)
+    return "".join(out)
+
+def repair_json_text(text):
+    """Best-effort repair of LLM JSON output.
+
+    Fixes trailing commas, raw newlines inside strings, text after the top-level
+    object, unterminated strings, truncated arrays/objects and curly quotes used as
+    string delimiters. Text is first repaired with its quotes untouched; curly quotes
+    are only converted where they delimit strings (see smart_quote_delimiters).
+    Returns a list of candidate texts, most complete first.
+    """
+    cleaned = _strip_code_fences(text)
+    candidates = _repair_candidates(cleaned)
+    delimited = smart_quote_delimiters(cleaned)
+    if delimited != cleaned:
+        fixed = _repair_candidates(delimited)
+        candidates = candidates[:1] + fixed[:1] + candidates[1:] + fixed[1:]
+    return candidates
+
+def _repair_candidates(cleaned):
+    start = cleaned.find("{")
+    if start == -1:
+        return [cleaned]
+    cleaned = cleaned[start:]
+
+    chars = []
+    stack = []
+    in_string = False
+    escape = False
+    last_comma = None  # (length, stack) at the most recent separator outside strings
+
+    for ch in cleaned:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            chars.append(ch)
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            # Drop a trailing comma before the closer
+            while chars and chars[-1].isspace():
+                chars.pop()
+            if chars and chars[-1] == ",":
+                chars.pop()
+            if not stack or stack[-1] != ch:
+                continue  # stray closer
+            stack.pop()
+            chars.append(ch)
+            if not stack:
+                break  # ignore anything after the top-level object
+            continue
+        elif ch == ",":
+            last_comma = (len(chars), list(stack))
+        chars.append(ch)
+
+    if escape:
+        chars.pop()
+    candidates = [_close_json(chars, stack, in_string)]
+    if stack and last_comma:
+        # Truncated mid-value: cut back to the last complete element
+        length, comma_stack = last_comma
+        candidates.append(_close_json(chars[:length], comma_stack))
+    return candidates
+
+def _iter_array_objects(text, start):
+    """Yield the text of each balanced {...} element of the array starting at text[start]."""
+    depth = 0
+    in_string = False
+    escape = False
+    obj_start = None
+    for i in range(start + 1, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            if depth == 0 and ch == "{":
+                obj_start = i
+            depth += 1
+        elif ch in "}]":
+            if depth == 0:
+                return  # end of the slides array
+            depth -= 1
+            if depth == 0 and obj_start is not None:
+                yield text[obj_start:i + 1]
+                obj_start = None
+
+def _loads_first(candidates):
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def salvage_json_slides(text):
+    """Recover the intro and every complete slide object from broken JSON output."""
+    cleaned = smart_quote_delimiters(_strip_code_fences(text))
+
+    intro_match = re.search(r'"intro"\s*:\s*"((?:[^"\\]|\\.)*)"', cleaned, re.DOTALL)
+    intro = ""
+    if intro_match:
+        try:
+            intro = json.loads(f'"{intro_match.group(1)}"')
+        except json.JSONDecodeError:
+            intro = intro_match.group(1)
+
+    slides = []
+    array_match = re.search(r'"slides"\s*:\s*\[', cleaned)
+    if array_match:
+        for obj_text in _iter_array_objects(cleaned, array_match.end() - 1):
+            slides.append(_loads_first(repair_json_text(obj_text)))
+    return {"intro": intro, "slides": slides}
+
+def validate_slide(slide):
+    """Return True if a parsed slide has everything the PPT builder needs."""
+    try:
+        Slide.from_dict(slide)
+        return True
+    except ValueError:
+        return False
+
+def parse_json_slides(text: str, expected_slides=None):
+    """Parse the slide JSON returned by the LLM, repairing and salvaging broken output.
+
+    Invalid or missing slides are dropped; their positions (in the intended deck)
+    are listed under "missing" so fill_missing_slides can request only those.
+    """
+    cleaned = _strip_code_fences(text)
+
+    # Extract JSON object if there's extra text around it
+    match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+    if match:
+        cleaned = match.group(0)
+
+    try:
+        parsed = json.loads(cleaned)
+    except json.JSONDecodeError as e:
+        print(f"[Warning] JSON parse failed: {e}. Attempting repair...")
+        parsed = _loads_first(repair_json_text(text))
+        if not isinstance(parsed, dict) or not isinstance(parsed.get("slides"), list):
+            parsed = salvage_json_slides(text)
+
+    if not isinstance(parsed, dict):
+        print(f"[Error] Could not recover any slides. [Debug Raw Start] {text[:300]}...")
+        return {"intro": "", "slides": [], "missing": list(range(expected_slides or 0))}
+
+    raw_slides = parsed.get("slides") if isinstance(parsed.get("slides"), list) else []
+    slides = []
+    missing = []
+    for i, slide in enumerate(raw_slides):
+        if validate_slide(slide):
+            slides.append(slide)
+        else:
+            missing.append(i)
+    if expected_slides:
+        missing.extend(range(len(raw_slides), expected_slides))
+        missing = [i for i in missing if i < expected_slides]
+
+    if missing:
+        print(f"[Warning] Recovered {len(slides)} slides, {len(missing)} missing or invalid")
+
+    intro = parsed.get("intro") if isinstance(parsed.get("intro"), str) else ""
+    return {"intro": intro, "slides": slides, "missing": missing}
+
+def fill_missing_slides(parsed, topic, generate=None):
+    """Ask the LLM for only the slides listed in parsed["missing"] and insert them in place.
+
+    generate(prompt) returns raw LLM text; defaults to the shared llm.
+    """
+    missing = parsed.get("missing") or []
+    if not missing:
+        return parsed
+    generate = generate or (lambda prompt: llm.invoke(prompt).content)
+
+    total = len(parsed["slides"]) + len(missing)
+    existing = [slide["title"] for slide in parsed["slides"]]
+    positions = ", ".join(str(i + 1) for i in missing)
+    prompt = f"""
+    A presentation on "{topic}" has {total} slides, but slides {positions} are missing.
+    The existing slide titles are: {json.dumps(existing)}.
+
+    Write ONLY the {len(missing)} missing slides, in order, without repeating existing topics.
+    Return ONLY valid JSON, no explanations or markdown:
+    {{
+      "slides": [
+        {{
+          "title": "max 8 words",
+          "insight": "one sentence",
+          "type": "bullets",
+          "data": [{{"point": "short phrase", "desc": "1-2 line explanation"}}]
+        }}
+      ]
+    }}
+    A slide may instead use "type": "chart" with "data":
+    {{"type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
+      "data": [["Label1", 123], ["Label2", 456]], "source": "Source: Organization, 2025"}}
+    """
+    try:
+        replacement = parse_json_slides(generate(prompt))["slides"]
+    except Exception as e:
+        logger.error(f"Failed to regenerate missing slides: {e}")
+        return parsed
+
+    slides = list(parsed["slides"])
+    still_missing = []
+    for position, slide in zip(missing, replacement + [None] * len(missing)):
+        if slide is None:
+            still_missing.append(position)
+            continue
+        slides.insert(min(position, len(slides)), slide)
+
+    print(f"Regenerated {len(missing) - len(still_missing)} of {len(missing)} missing slides")
+    return {"intro": parsed["intro"], "slides": slides, "missing": still_missing}
+
+# === HEDGED SLIDE GENERATION ===
+
+HEDGE_CONFIG = {
+    "enabled": os.getenv("LLM_HEDGING", "0") == "1",
+    "percentile": 0.9,  # hedge once the first call is slower than this latency percentile
+    "default_deadline": 25.0,  # seconds, used until min_samples latencies are known
+    "min_samples": 5,
+    "max_extra_fraction": 0.2,  # hedges may add at most 20% extra requests...
+    "burst": 1,  # ...plus this many, so the first slow call can still be hedged
+}
+
+class LatencyTracker:
+    """Sliding window of successful call latencies."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, default):
+        with self.lock:
+            if len(self.samples) < HEDGE_CONFIG["min_samples"]:
+                return default
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class HedgeBudget:
+    """Caps hedged requests to a fraction of primary requests."""
+
+    def __init__(self, max_extra_fraction, burst):
+        self.max_extra_fraction = max_extra_fraction
+        self.burst = burst
+        self.primary = 0
+        self.hedged = 0
+        self.lock = threading.Lock()
+
+    def record_primary(self):
+        with self.lock:
+            self.primary += 1
+
+    def try_spend(self):
+        with self.lock:
+            if self.hedged < self.primary * self.max_extra_fraction + self.burst:
+                self.hedged += 1
+                return True
+            return False
+
+# One tracker per request shape: a 3-slide expansion and a 40-slide deck have very different latencies
+slide_latency = {}
+slide_latency_lock = threading.Lock()
+hedge_budget = HedgeBudget(HEDGE_CONFIG["max_extra_fraction"], HEDGE_CONFIG["burst"])
+
+def latency_tracker(shape):
+    """LatencyTracker for one request shape (see request_shape), created on first use."""
+    with slide_latency_lock:
+        if shape not in slide_latency:
+            slide_latency[shape] = LatencyTracker()
+        return slide_latency[shape]
+
+def request_shape(kind, expected_slides=None):
+    """Key for latency tracking: the caller's kind of request and its slide count rounded to a power of two."""
+    return kind, (expected_slides or 0).bit_length()
+
+def hedged_llm_call(generate, parse=parse_json_slides, is_valid=lambda parsed: bool(parsed.get("slides")),
+                    shape=("deck", 0)):
+    """Call generate() (which returns raw LLM text) and parse the result, firing one backup request when the first
+    is slower than the latency percentile deadline or returns an unusable result.
+
+    The deadline comes from the latencies of earlier requests of the same shape.
+    The first valid parsed result wins. The losing request is cancelled if it has not
+    started yet, otherwise its result is discarded. Returns the parsed result (the last
+    invalid one if neither request produced a valid result).
+    """
+    tracker = latency_tracker(shape)
+
+    def attempt():
+        started = time.monotonic()
+        content = generate()
+        tracker.record(time.monotonic() - started)
+        return parse(content)
+
+    deadline = tracker.percentile(HEDGE_CONFIG["percentile"], HEDGE_CONFIG["default_deadline"])
+    hedge_budget.record_primary()
+    # Never inline: the deadline only works while the attempt runs on another thread
+    pending = {scheduler.submit("io", attempt, inline=False)}
+    hedged = False
+    fallback = None
+
+    try:
+        with scheduler.lend_slot("io"):
+            while pending:
+                done, pending = wait(pending, timeout=None if hedged else deadline, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        parsed = future.result()
+                    except Exception as e:
+                        logger.error(f"LLM request failed: {e}")
+                        continue
+                    if is_valid(parsed):
+                        return parsed
+                    fallback = parsed
+
+                # Slow (nothing finished before the deadline) or unusable: fire the hedge
+                if not hedged:
+                    if hedge_budget.try_spend():
+                        reason = "unusable response" if done else f"no response after {deadline:.1f}s"
+                        logger.info(f"Hedging slide generation request ({reason})")
+                        pending.add(scheduler.submit("io", attempt, inline=False))
+                    else:
+                        logger.info("Hedge budget exhausted, waiting for the first request")
+                    hedged = True
+
+        return fallback if fallback is not None else parse("")
+    finally:
+        for loser in pending:
+            loser.cancel()
+
+def generate_parsed_slides(generate, hedge=None, expected_slides=None, kind="deck"):
+    """Call a slide-generation function and parse its JSON, hedging when enabled (see HEDGE_CONFIG).
+
+    kind names the caller ("deck", "expand", ...) so each kind of request is
+    hedged against its own latency history.
+    """
+    hedge = HEDGE_CONFIG["enabled"] if hedge is None else hedge
+    parse = lambda text: parse_json_slides(text, expected_slides)
+    if hedge:
+        return hedged_llm_call(generate, parse=parse, shape=request_shape(kind, expected_slides))
+    return parse(generate())
+
+# === OUTLINE-THEN-EXPAND GENERATION ===
+
+OUTLINE_CONFIG = {
+    "min_slides": int(os.getenv("OUTLINE_MIN_SLIDES", "12")),  # smaller decks use one completion
+    "group_size": 3,  # slides expanded per LLM call
+    "max_workers": LLM_RATE_LIMITS["max_concurrency"],  # the rate limiter still applies per call
+}
+
+def get_slide_outline(topic, n_slides):
+    """Ask for a short outline: intro plus title, type and insight for every slide."""
+    prompt = f"""
+    Outline a professional, data-driven PowerPoint presentation with exactly {n_slides} slides
+    on the topic "{topic}". Do not write slide content yet.
+
+    Return ONLY valid JSON, no explanations or markdown:
+    {{
+      "intro": "max 150 characters",
+      "outline": [
+        {{"title": "max 8 words", "type": "bullets" | "chart", "insight": "one sentence"}}
+      ]
+    }}
+    Use "chart" for slides whose point is best made with numbers.
+    """
+    parsed = _loads_first(repair_json_text(llm.invoke(prompt).content))
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("outline"), list):
+        raise ValueError("Outline response is not valid JSON")
+    outline = [
+        {"title": str(item["title"]).strip(), "insight": str(item.get("insight") or ""),
+         "type": "chart" if item.get("type") == "chart" else "bullets"}
+        for item in parsed["outline"] if isinstance(item, dict) and str(item.get("title") or "").strip()
+    ][:n_slides]
+    return {"intro": str(parsed.get("intro") or ""), "outline": outline}
+
+def expand_slides(topic, outline, positions):
+    """Write the full content of the outline slides at positions; returns raw LLM text."""
+    titles = "\n".join(f"{i + 1}. {item['title']}" for i, item in enumerate(outline))
+    wanted = json.dumps([outline[i] for i in positions], ensure_ascii=False, indent=2)
+    prompt = f"""
+    You are writing slides for a presentation on "{topic}". The full outline is:
+    {titles}
+
+    Write ONLY these {len(positions)} slides, in this order, keeping their title, type and insight:
+    {wanted}
+
+    Rules:
+    - Return ONLY valid JSON, no explanations or markdown: {{"slides": [...]}}
+    - If "type" = "bullets", "data" must be an array of objects:
+      {{"point": "short phrase", "desc": "1–2 line explanation"}}
+    - If "type" = "chart", "data" must be JSON:
+      {{
+        "type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
+        "data": [["Label1", 123], ["Label2", 456]],
+        "source": "Source: Organization, 2025"
+      }}
+      and optionally include "context": "Why this data matters"
+    """
+    return llm.invoke(prompt).content
+
+def generate_outlined_slides(topic, n_slides, generate_outline=None, expand=None):
+    """Two-phase generation: one short outline call, then slide bodies in parallel groups.
+
+    Every group is a separate (hedged) completion of OUTLINE_CONFIG["group_size"]
+    slides, so latency no longer grows with deck length. Returns the same
+    {"intro", "slides", "missing"} shape as parse_json_slides; slides whose
+    group failed are listed in "missing" for fill_missing_slides.
+    """
+    generate_outline = generate_outline or get_slide_outline
+    expand = expand or expand_slides
+    plan = generate_outline(topic, n_slides)
+    outline = plan["outline"]
+    logger.info(f"Outline ready: {len(outline)} slides, expanding in groups of {OUTLINE_CONFIG['group_size']}")
+
+    size = OUTLINE_CONFIG["group_size"]
+    groups = [list(range(start, min(start + size, len(outline)))) for start in range(0, len(outline), size)]
+
+    def run(positions):
+        parsed = generate_parsed_slides(lambda: expand(topic, outline, positions), expected_slides=len(positions),
+                                        kind="expand")
+        remaining = iter(parsed["slides"])
+        return [None if k in parsed["missing"] else next(remaining, None) for k in range(len(positions))]
+
+    results = scheduler.map("io", run, groups, limit=max(1, min(OUTLINE_CONFIG["max_workers"], len(groups))))
+
+    slides = []
+    missing = []
+    for positions, expanded in zip(groups, results):
+        for position, slide in zip(positions, expanded):
+            if slide is None:
+                missing.append(position)
+            else:
+                slides.append(slide)
+    missing.extend(range(len(outline), n_slides))
+    return {"intro": plan["intro"], "slides": slides, "missing": missing}
+
+def generate_topic_slides(topic, n_slides):
+    """Generate and parse a topic deck, using outline-then-expand for large decks."""
+    if n_slides >= OUTLINE_CONFIG["min_slides"]:
+        try:
+            return generate_outlined_slides(topic, n_slides)
+        except Exception as e:
+            logger.error(f"Outline generation failed, falling back to a single completion: {e}")
+    return generate_parsed_slides(lambda: get_slide_content_with_charts(topic, n_slides), expected_slides=n_slides)
+
+def add_enhanced_title_slide(prs, topic, intro):
+    """Creates a stunning McKinsey-style title slide with professional layout and design elements."""
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    slide.background.fill.solid()
+    slide.background.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
+
+    # Background geometric elements for visual appeal
+    bg_rect = slide.shapes.add_shape(1, Inches(8), Inches(0), Inches(3.33), Inches(7.5))
+    bg_rect.fill.solid()
+    bg_rect.fill.fore_color.rgb = MCKINSEY_COLORS["light_blue"]
+    bg_rect.line.fill.background()
+    
+    # Diagonal accent shape
+    accent_shape = slide.shapes.add_shape(1, Inches(0), Inches(6.7), Inches(13.33), Inches(1.0))
+    accent_shape.fill.solid()
+    accent_shape.fill.fore_color.rgb = MCKINSEY_COLORS["blue"]
+    accent_shape.line.fill.background()
+
+    # Main Title - Bold and prominent
+    title_box = slide.shapes.add_textbox(Inches(1), Inches(1.2), Inches(10), Inches(2))
+    tf = title_box.text_frame
+    tf.word_wrap = True
+    p = tf.paragraphs[0]
+    p.text = topic.upper()
+    p.font.name = FONT_NAME
+    p.font.size = Pt(52)
+    p.font.bold = True
+    p.font.color.rgb = MCKINSEY_COLORS["dark_blue"]
+    p.alignment = PP_ALIGN.LEFT
+
+    # Professional subtitle with current date
+    current_date = datetime.now().strftime("%B %Y")
+    subtitle_box = slide.shapes.add_textbox(Inches(1), Inches(3.2), Inches(10), Inches(0.8))
+    tf2 = subtitle_box.text_frame
+    p2 = tf2.paragraphs[0]
+    p2.text = f"Strategic Analysis & Business Intelligence | {current_date}"
+    p2.font.name = FONT_NAME
+    p2.font.size = Pt(20)
+    p2.font.color.rgb = MCKINSEY_COLORS["gray"]
+    p2.alignment = PP_ALIGN.LEFT
+
+    # Executive Summary Box with better formatting
+    intro_box = slide.shapes.add_textbox(Inches(1), Inches(4.0), Inches(10), Inches(1.5))
+    tf3 = intro_box.text_frame
+    tf3.word_wrap = True
+    tf3.auto_size = MSO_AUTO_SIZE.NONE
+    tf3.margin_left = Inches(0.2)
+    tf3.margin_right = Inches(0.2)
+    tf3.margin_top = Inches(0.1)
+    tf3.margin_bottom = Inches(0.1)
+    
+    p3 = tf3.paragraphs[0]
+    p3.font.name = FONT_NAME
+    p3.font.size = Pt(14)
+    p3.font.bold = True
+    p3.font.color.rgb = MCKINSEY_COLORS["blue"]
+    p3.alignment = PP_ALIGN.LEFT
+    
+    # Add the actual introduction content
+    p4 = tf3.add_paragraph()
+    p4.text = intro
+    p4.font.name = FONT_NAME
+    p4.font.size = Pt(16)
+    p4.font.color.rgb = MCKINSEY_COLORS["text"]
+    p4.alignment = PP_ALIGN.LEFT
+    p4.space_before = Pt(8)
+
+    # Professional branding footer
+    brand_box = slide.shapes.add_textbox(Inches(1), Inches(7), Inches(6), Inches(0.4))
+    tf4 = brand_box.text_frame
+    p5 = tf4.paragraphs[0]
+    p5.text = "MADE BY ENTHRAL AI"
+    p5.font.name = FONT_NAME
+    p5.font.size = Pt(10)
+    p5.font.italic = True
+    p5.font.color.rgb = MCKINSEY_COLORS["white"]
+    p5.alignment = PP_ALIGN.LEFT
+
+    # Decorative elements
+    line1 = slide.shapes.add_shape(1, Inches(1), Inches(4.2), Inches(4), Inches(0))
+    line1.line.color.rgb = MCKINSEY_COLORS["accent_blue"]
+    line1.line.width = Pt(4)
+    
+    line2 = slide.shapes.add_shape(1, Inches(1), Inches(4.3), Inches(2), Inches(0))
+    line2.line.color.rgb = MCKINSEY_COLORS["blue"]
+    line2.line.width = Pt(2)
+
+def add_chart_slide_with_context(slide, chart_info, context):
+    if context:
+        tx_box = slide.shapes.add_textbox(Inches(1), Inches(1.6), Inches(11), Inches(0.6))
+        tf = tx_box.text_frame
+        p = tf.paragraphs[0]
+        p.text = context
+        p.font.size = Pt(14)
+        p.font.name = FONT_NAME
+        p.font.color.rgb = MCKINSEY_COLORS["gray"]
+
+    add_chart_slide(slide, chart_info)
+
+def calculate_dynamic_image_size(image_path, max_width=5.8, max_height=4.5):
+    """Enhanced image size calculation for the new layout."""
+    try:
+        with Image.open(image_path) as img:
+            original_width, original_height = img.size
+            aspect_ratio = original_width / original_height
+            
+            # Calculate dimensions based on aspect ratio
+            if aspect_ratio > (max_width / max_height):
+                width = max_width
+                height = max_width / aspect_ratio
+            else:
+                height = max_height
+                width = max_height * aspect_ratio
+            
+            # Ensure minimum size for impact
+            width = max(width, 4.0)
+            height = max(height, 3.0)
+            
+            return Inches(width), Inches(height)
+    except Exception as e:
+        print(f"Error calculating image size: {e}")
+        return Inches(5.0), Inches(3.5)
+
+PPTX_BUILD_CONFIG = {
+    "shard_min_slides": 40,  # smaller decks are built in this process
+    "max_workers": int(os.getenv("PPTX_BUILD_WORKERS", os.cpu_count() or 1)),
+    # PackageMerger relies on python-pptx internals (part.rels._rels, _Relationship, slides._sldIdLst);
+    # other releases fall back to the sequential build
+    "merge_pptx_versions": ("1.0.",),
+}
+
+def sharded_build_supported():
+    """Whether the installed python-pptx is a release PackageMerger is known to work with."""
+    import pptx
+    return _Relationship is not None and pptx.__version__.startswith(PPTX_BUILD_CONFIG["merge_pptx_versions"])
+
+def new_presentation():
+    prs = Presentation()
+    prs.slide_width = Inches(13.33)
+    prs.slide_height = Inches(7.5)
+    return prs
+
+def add_deck_slide(prs, slide_content, number, topic, images):
+    """Add one content slide; number is its position in the deck (title slide is 0)."""
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    slide.background.fill.solid()
+    slide.background.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
+
+    add_enhanced_header(slide, slide_content.title, slide_content.insight)
+    add_enhanced_footer(slide, number + 1)
+
+    if slide_content.type == 'chart':
+        add_chart_slide_with_context(slide, slide_content.chart, slide_content.context)
+    else:
+        image_path = images.get(number) or fetch_image(f"{slide_content.title} {slide_content.insight}", topic)
+        add_enhanced_text_and_image_slide(slide, slide_content.bullets, image_path)
+
+def build_mckinsey_ppt(parsed_data, topic, images=None, output_path=None, workers=None):
+    """Build the deck; images maps slide numbers to already fetched image paths.
+
+    Decks with at least PPTX_BUILD_CONFIG["shard_min_slides"] slides are built by
+    `workers` processes in parallel (see build_sharded_ppt) when the installed
+    python-pptx supports merging the shards; otherwise they are built sequentially.
+    """
+    deck = as_deck(parsed_data)
+    if images is None:
+        images = fetch_slide_images(deck, topic)
+    filename = output_path or topic.strip().replace(" ", "_") + "_McKinsey_Style.pptx"
+
+    workers = workers or PPTX_BUILD_CONFIG["max_workers"]
+    sharded = workers > 1 and len(deck.slides) >= PPTX_BUILD_CONFIG["shard_min_slides"]
+    if sharded and not sharded_build_supported():
+        import pptx
+        logger.warning(f"python-pptx {pptx.__version__} is not supported by the shard merger, building sequentially")
+        sharded = False
+    if sharded:
+        build_sharded_ppt(deck, topic, images, filename, workers)
+    else:
+        prs = new_presentation()
+        add_enhanced_title_slide(prs, topic, deck.intro)
+        for i, slide_content in enumerate(deck.slides, start=1):
+            add_deck_slide(prs, slide_content, i, topic, images)
+        prs.save(filename)
+
+    print(f"\nPresentation saved as: {filename}")
+    return filename
+
+# === SHARDED DECK BUILD ===
+
+def build_deck_shard(deck, topic, images, start, stop, output_path):
+    """Build content slides start..stop-1 (1-based) into their own package; shard 1 also gets the title slide."""
+    prs = new_presentation()
+    if start == 1:
+        add_enhanced_title_slide(prs, topic, deck.intro)
+    for i in range(start, stop):
+        add_deck_slide(prs, deck.slides[i - 1], i, topic, images)
+    prs.save(output_path)
+    return output_path
+
+def _retarget(part, rId, target):
+    """Point relationship rId of part at target, keeping the rId the slide XML refers to."""
+    rel = part.rels[rId]
+    part.rels._rels[rId] = _Relationship(part.partname.baseURI, rId, rel.reltype, RTM.INTERNAL, target)
+
+class PackageMerger:
+    """Append the slides of other presentations to a base presentation.
+
+    Slide, chart and embedding parts are renamed to free partnames in the base
+    package; layout and master references are pointed at the base's own parts
+    (every shard comes from the same template); images are stored once per
+    distinct content, whichever package they came from.
+    """
+
+    SHARED_RELTYPES = (RT.SLIDE_LAYOUT, RT.NOTES_MASTER)
+
+    def __init__(self, prs):
+        self.prs = prs
+        parts = list(prs.part.package.iter_parts())
+        self.used = {str(part.partname) for part in parts}
+        self.next_number = {}
+        self.shared = {part.partname: part for part in parts}
+        self.media = {hashlib.sha1(part.blob).hexdigest(): part for part in parts
+                      if part.content_type.startswith("image/")}
+        self.adopted = set()
+
+    def _rename(self, part):
+        template = re.sub(r"\d*(\.\w+)$", r"%d\1", str(part.partname))
+        n = self.next_number.get(template, 1)
+        while template % n in self.used:
+            n += 1
+        self.next_number[template] = n + 1
+        self.used.add(template % n)
+        part.partname = PackURI(template % n)
+
+    def _adopt(self, part):
+        """Rename part and everything it references that the base package does not already hold."""
+        self._rename(part)
+        self.adopted.add(part)
+        for rId, rel in list(part.rels.items()):
+            if rel.is_external:
+                continue
+            target = rel.target_part
+            if rel.reltype in self.SHARED_RELTYPES:
+                _retarget(part, rId, self.shared[target.partname])
+            elif target.content_type.startswith("image/"):
+                digest = hashlib.sha1(target.blob).hexdigest()
+                if digest not in self.media:
+                    self._rename(target)
+                    self.media[digest] = target
+                _retarget(part, rId, self.media[digest])
+            elif target not in self.adopted:
+                self._adopt(target)
+
+    def append(self, other):
+        for slide in other.slides:
+            self._adopt(slide.part)
+            rId = self.prs.part.relate_to(slide.part, RT.SLIDE)
+            self.prs.slides._sldIdLst.add_sldId(rId)
+
+def merge_presentations(paths, output_path):
+    """Concatenate the slides of presentations built from the same template into one file."""
+    prs = Presentation(paths[0])
+    merger = PackageMerger(prs)
+    for path in paths[1:]:
+        merger.append(Presentation(path))
+    prs.save(output_path)
+    logger.info(f"Merged {len(paths)} packages: {len(prs.slides)} slides, {len(merger.media)} distinct images")
+    return output_path
+
+def build_sharded_ppt(deck, topic, images, output_path, workers):
+    """Build contiguous slide ranges in worker processes and merge the packages in slide order."""
+    slide_count = len(deck.slides)
+    shard_size = -(-slide_count // workers)
+    ranges = [(start, min(start + shard_size, slide_count + 1)) for start in range(1, slide_count + 1, shard_size)]
+    logger.info(f"Building {slide_count} slides in {len(ranges)} shards of up to {shard_size}")
+
+    with tempfile.TemporaryDirectory(prefix="pptx_shards_") as shard_dir:
+        futures = [
+            scheduler.submit("process", build_deck_shard, deck, topic, images, start, stop,
+                             os.path.join(shard_dir, f"shard{index:03d}.pptx"))
+            for index, (start, stop) in enumerate(ranges)
+        ]
+        return merge_presentations([future.result() for future in futures], output_path)
+
+def add_enhanced_header(slide, title, insight):
+    """Adds a professionally styled title and key insight with better visual hierarchy."""
+    # Background header area
+    header_bg = slide.shapes.add_shape(1, Inches(0), Inches(0), Inches(13.33), Inches(1.4))
+    header_bg.fill.solid()
+    header_bg.fill.fore_color.rgb = MCKINSEY_COLORS["background"]
+    header_bg.line.color.rgb = MCKINSEY_COLORS["light_gray"]
+    header_bg.line.width = Pt(1)
+    
+    # Title
+    tx_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.15), Inches(12), Inches(0.65))
+    tf = tx_box.text_frame
+    tf.vertical_anchor = MSO_ANCHOR.TOP
+    tf.margin_left = Inches(0.1)
+    p = tf.paragraphs[0]
+    p.text = title.upper()
+    p.font.name = FONT_NAME
+    p.font.size = Pt(26)
+    p.font.bold = True
+    p.font.color.rgb = MCKINSEY_COLORS["dark_blue"]
+
+    # Key Insight with better styling
+    insight_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.8), Inches(12), Inches(0.5))
+    tf2 = insight_box.text_frame
+    tf2.margin_left = Inches(0.1)
+    p_insight = tf2.paragraphs[0]
+    p_insight.text = f"Key Insight: {insight}"
+    p_insight.font.name = FONT_NAME
+    p_insight.font.size = Pt(14)
+    p_insight.font.color.rgb = MCKINSEY_COLORS["gray"]
+    p_insight.font.italic = True
+
+    # Enhanced blue accent line
+    line = slide.shapes.add_shape(1, Inches(0.5), Inches(1.35), Inches(12), Inches(0))
+    line.line.color.rgb = MCKINSEY_COLORS["blue"]
+    line.line.width = Pt(3)
+
+def add_enhanced_footer(slide, slide_number):
+    """Adds a professionally styled footer with slide number and branding."""
+    # Footer background
+    footer_bg = slide.shapes.add_shape(1, Inches(0), Inches(6.9), Inches(13.33), Inches(0.6))
+    footer_bg.fill.solid()
+    footer_bg.fill.fore_color.rgb = MCKINSEY_COLORS["light_gray"]
+    footer_bg.line.fill.background()
+    
+    # Slide number
+    tx_box = slide.shapes.add_textbox(Inches(11.5), Inches(7.0), Inches(1.5), Inches(0.4))
+    tf = tx_box.text_frame
+    p = tf.paragraphs[0]
+    p.text = f"{slide_number}"
+    p.alignment = PP_ALIGN.CENTER
+    p.font.name = FONT_NAME
+    p.font.size = Pt(12)
+    p.font.bold = True
+    p.font.color.rgb = MCKINSEY_COLORS["blue"]
+    
+    # Professional footer text
+    footer_text_box = slide.shapes.add_textbox(Inches(0.5), Inches(7.0), Inches(6), Inches(0.4))
+    tf2 = footer_text_box.text_frame
+    p2 = tf2.paragraphs[0]
+    p2.text = "MADE BY ENTHRAL AI"
+    p2.font.name = FONT_NAME
+    p2.font.size = Pt(9)
+    p2.font.color.rgb = MCKINSEY_COLORS["dark_gray"]
+
+IMAGE_SCORING_CONFIG = {
+    "candidates_per_slide": 8,
+    "download_workers": 8,
+    "score_size": 256,  # candidates are scored on a grayscale thumbnail of this size
+    "min_side": 300,  # smaller images are rejected outright
+    "full_resolution_side": 1000,  # short side that earns the full resolution score
+    "weights": {"sharpness": 0.45, "entropy": 0.3, "resolution": 0.25},
+    "vertical_bonus": 0.1,  # the image slot is close to square, so non-wide images fit better
+    "duplicate_distance": 10,  # max perceptual-hash Hamming distance (of 64 bits) for a near-duplicate
+}
+
+def search_image_candidates(query, num=None):
+    """Return candidate image URLs for a query from Google Custom Search."""
+    from urllib.parse import quote
+
+    if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        return []
+    num = num or IMAGE_SCORING_CONFIG["candidates_per_slide"]
+    try:
+        g_url = (f"https://www.googleapis.com/customsearch/v1?q={quote(query)}&searchType=image"
+                 f"&num={num}&key={GOOGLE_API_KEY}&cx={GOOGLE_CSE_ID}")
+        response = requests.get(g_url, timeout=15)
+        if response.status_code != 200:
+            return []
+        return [item["link"] for item in response.json().get("items", []) if item.get("link")]
+    except Exception as e:
+        logger.warning(f"Image search failed for '{query[:40]}': {e}")
+        return []
+
+@dataclass(slots=True)
+class ImageCandidate:
+    url: str
+    path: str  # the downloaded file, reopened only if the image is chosen
+    size: tuple  # original (width, height)
+    thumbnail: Image.Image  # RGB, short side about IMAGE_SCORING_CONFIG["score_size"]
+
+def download_image(url, directory):
+    """Download an image into directory and return it as an ImageCandidate, or None if it is not an image.
+
+    Only a small thumbnail is kept in memory for scoring.
+    """
+    try:
+        r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        if r.status_code == 200 and 'image' in r.headers.get('Content-Type', ''):
+            path = os.path.join(directory, hashlib.sha1(url.encode("utf-8")).hexdigest()[:12])
+            with open(path, "wb") as f:
+                f.write(r.content)
+            side = IMAGE_SCORING_CONFIG["score_size"]
+            with Image.open(path) as img:
+                size = img.size
+                img.draft("RGB", (side, side))  # JPEGs are decoded directly at a reduced scale
+                thumbnail = img.convert("RGB")
+            scale = side / min(thumbnail.size)
+            if scale < 1:
+                thumbnail = thumbnail.resize((max(1, round(thumbnail.width * scale)),
+                                              max(1, round(thumbnail.height * scale))), Image.Resampling.LANCZOS)
+            return ImageCandidate(url, path, size, thumbnail)
+    except Exception:
+        pass
+    return None
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+DCT_32 = _dct_matrix(32)
+
+def score_images(images, sizes=None):
+    """Score a batch of PIL images in one pass.
+
+    sizes gives the original (width, height) of each image when images are
+    thumbnails, for the resolution score and the min_side check. Returns a dict of NumPy arrays indexed like images: "sharpness" (variance of
+    the Laplacian), "entropy" (bits of the grayscale histogram), "resolution",
+    "score" (weighted combination in [0, 1+bonus]) and "phash" (64-bit DCT
+    perceptual hash as uint64).
+    """
+    cfg = IMAGE_SCORING_CONFIG
+    size = cfg["score_size"]
+    n = len(images)
+    gray = np.empty((n, size, size), dtype=np.float32)
+    small = np.empty((n, 32, 32), dtype=np.float32)
+    sides = np.empty((n, 2), dtype=np.float32)
+    for i, img in enumerate(images):
+        g = cv2.cvtColor(np.asarray(img, dtype=np.uint8), cv2.COLOR_RGB2GRAY)
+        gray[i] = cv2.resize(g, (size, size), interpolation=cv2.INTER_AREA)
+        small[i] = cv2.resize(g, (32, 32), interpolation=cv2.INTER_AREA)
+        sides[i] = sizes[i] if sizes else img.size
+
+    # Sharpness: variance of the 4-neighbour Laplacian, for the whole batch at once
+    lap = (4 * gray[:, 1:-1, 1:-1] - gray[:, :-2, 1:-1] - gray[:, 2:, 1:-1]
+           - gray[:, 1:-1, :-2] - gray[:, 1:-1, 2:])
+    sharpness = lap.reshape(n, -1).var(axis=1)
+
+    # Entropy: one bincount over offset pixel values gives every histogram
+    levels = gray.astype(np.int64).reshape(n, -1) + (np.arange(n) * 256)[:, None]
+    hist = np.bincount(levels.ravel(), minlength=n * 256).reshape(n, 256).astype(np.float64)
+    p = hist / hist.sum(axis=1, keepdims=True)
+    entropy = -(p * np.log2(np.where(p > 0, p, 1))).sum(axis=1)
+
+    resolution = np.clip(sides.min(axis=1) / cfg["full_resolution_side"], 0, 1)
+
+    # pHash: low-frequency 8x8 block of the 2D DCT, thresholded at its median
+    coeffs = (DCT_32 @ small @ DCT_32.T)[:, :8, :8].reshape(n, 64)
+    bits = coeffs > np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    phash = np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+    sharp_norm = np.log1p(sharpness) / max(np.log1p(sharpness).max(), 1e-6) if n else sharpness
+    weights = cfg["weights"]
+    score = (weights["sharpness"] * sharp_norm + weights["entropy"] * entropy / 8
+             + weights["resolution"] * resolution)
+    score = score + cfg["vertical_bonus"] * (sides[:, 0] / sides[:, 1] < 1.25)
+    score = np.where(sides.min(axis=1) < cfg["min_side"], -1.0, score)
+    return {"sharpness": sharpness, "entropy": entropy, "resolution": resolution, "score": score, "phash": phash}
+
+def hamming_distances(phash, others):
+    """Bit distance between one hash and an array of hashes."""
+    if len(others) == 0:
+        return np.zeros(0, dtype=np.int64)
+    xor = np.bitwise_xor(np.asarray(others, dtype=np.uint64), np.uint64(phash))
+    return np.unpackbits(xor.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def select_slide_images(prompts, topic, accepted=None):
+    """Pick one image per prompt from scored candidates.
+
+    Candidates of all slides are searched and downloaded concurrently (each URL
+    once, kept as a thumbnail plus the file on disk). Then, slide by slide, the
+    slide's candidates are scored with score_images and the best one that is not
+    a near-duplicate of an image already accepted for the deck is saved from its
+    original file. accepted ({"urls": set, "hashes": list}) carries that state across
+    calls. Returns {prompt index: saved image path}; slides without a usable
+    candidate are left out.
+    """
+    accepted = accepted if accepted is not None else {"urls": set(), "hashes": []}
+    workers = IMAGE_SCORING_CONFIG["download_workers"]
+
+    queries = [f"{topic} {prompt}".strip() for prompt in prompts]
+    candidate_urls = scheduler.map("io", search_image_candidates, queries, limit=workers)
+    urls = list(dict.fromkeys(
+        url for slide_urls in candidate_urls for url in slide_urls if url not in accepted["urls"]))
+    download_dir = tempfile.mkdtemp(prefix="img_candidates_")
+    try:
+        downloaded = dict(zip(urls, scheduler.map("io", lambda url: download_image(url, download_dir), urls,
+                                                  limit=workers)))
+
+        chosen = {}
+        scored = 0
+        for slide, slide_urls in enumerate(candidate_urls):
+            candidates = [downloaded[url] for url in dict.fromkeys(slide_urls) if downloaded.get(url)]
+            if not candidates:
+                continue
+            scores = score_images([c.thumbnail for c in candidates], [c.size for c in candidates])
+            scored += len(candidates)
+            for i in np.argsort(-scores["score"], kind="stable"):
+                candidate = candidates[i]
+                if scores["score"][i] < 0 or candidate.url in accepted["urls"]:
+                    continue
+                distances = hamming_distances(scores["phash"][i], accepted["hashes"])
+                if (distances <= IMAGE_SCORING_CONFIG["duplicate_distance"]).any():
+                    continue
+                filename = f"img_{hashlib.sha1(candidate.url.encode('utf-8')).hexdigest()[:12]}.jpg"
+                with Image.open(candidate.path) as img:
+                    img.convert("RGB").save(filename, format="JPEG")
+                accepted["urls"].add(candidate.url)
+                accepted["hashes"].append(int(scores["phash"][i]))
+                chosen[slide] = filename
+                break
+        logger.info(f"Scored {scored} candidate images for {len(prompts)} slides")
+        return chosen
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+def create_fallback_image(topic, path="fallback.jpg"):
+    """Draw the placeholder used when no usable image is found."""
+    try:
+        img = Image.new('RGB', (800, 600), color=(245, 245, 245))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([40, 40, 760, 560], outline=(12, 74, 126), width=4)
+        draw.rectangle([80, 80, 720, 520], outline=(217, 217, 217), width=2)
+        
+        try:
+            from PIL import ImageFont
+            font_large = ImageFont.load_default()
+            font_small = ImageFont.load_default()
+        except:
+            font_large = ImageFont.load_default()
+            font_small = ImageFont.load_default()
+        
+        draw.text((400, 250), "Professional", fill=(12, 74, 126), anchor='mm', font=font_large)
+        draw.text((400, 300), "Image Placeholder", fill=(12, 74, 126), anchor='mm', font=font_large)
+        draw.text((400, 380), f"Topic: {topic}", fill=(89, 89, 89), anchor='mm', font=font_small)
+        draw.ellipse([320, 150, 480, 200], outline=(79, 129, 189), width=3)
+        
+        img.save(path, 'JPEG', quality=90)
+        return path
+    except:
+        return None
+
+def fetch_image(prompt: str, topic: str, accepted=None) -> str:
+    """Fetch the best-scoring image for one slide (see select_slide_images), or the placeholder."""
+    return select_slide_images([prompt], topic, accepted).get(0) or fallback_image(topic)
+
+def fallback_image(topic):
+    if not os.path.exists("fallback.jpg"):
+        create_fallback_image(topic)
+    
+    return "fallback.jpg" if os.path.exists("fallback.jpg") else None
+
+def fetch_slide_images(deck, topic):
+    """Select images for every bullet slide of a deck in one batch; returns {slide number: path}."""
+    prompts = {i: f"{slide.title} {slide.insight}" for i, slide in enumerate(deck.slides, start=1)
+               if slide.type != "chart"}
+    chosen = select_slide_images(list(prompts.values()), topic)
+    images = {}
+    for position, number in enumerate(prompts):
+        images[number] = chosen.get(position) or fallback_image(topic)
+    return images
+
+def validated_image_bytes(path, max_width=800, max_height=500):
+    """Enhanced image validation with better error handling and optimization."""
+    try:
+        if not path or not os.path.exists(path):
+            return None
+            
+        with Image.open(path) as img:
+            img.verify()
+            
+        with Image.open(path) as img:
+            if img.mode != 'RGB':
+                img = img.convert("RGB")
+            
+            original_w, original_h = img.size
+            img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            
+            stream = BytesIO()
+            img.save(stream, format="PNG", optimize=True, quality=90)
+            stream.seek(0)
+            
+            return stream
+            
+    except Exception as e:
+        return None
+
+def add_chart_slide(slide, chart_info):
+    """Adds a dynamically generated chart to the slide. chart_info is a Chart (or raw chart dict)."""
+    from pptx.chart.data import CategoryChartData
+    from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION, XL_DATA_LABEL_POSITION
+
+    try:
+        if not isinstance(chart_info, Chart):
+            chart_info = Chart.from_dict(chart_info)
+
+        chart_type_map = {
+            "BAR": XL_CHART_TYPE.BAR_CLUSTERED,
+            "COLUMN": XL_CHART_TYPE.COLUMN_CLUSTERED,
+            "LINE": XL_CHART_TYPE.LINE,
+            "PIE": XL_CHART_TYPE.PIE,
+            "DOUGHNUT": XL_CHART_TYPE.DOUGHNUT,
+            "AREA": XL_CHART_TYPE.AREA,
+            "SCATTER": XL_CHART_TYPE.XY_SCATTER_LINES,
+            "STACKED_BAR": XL_CHART_TYPE.BAR_STACKED
+        }
+        chart_type = chart_type_map.get(chart_info.type, XL_CHART_TYPE.COLUMN_CLUSTERED)
+
+        # Values were validated and coerced when the deck was parsed
+        chart_data = CategoryChartData()
+        chart_data.categories = chart_info.categories
+        for name, values in zip(chart_info.series_names, chart_info.series):
+            chart_data.add_series(name, values)
+
+        # Create chart
+        x, y, cx, cy = Inches(1), Inches(1.7), Inches(11), Inches(4.5)
+        graphic_frame = slide.shapes.add_chart(chart_type, x, y, cx, cy, chart_data)
+        chart = graphic_frame.chart
+
+        chart.has_legend = True
+        chart.legend.position = XL_LEGEND_POSITION.RIGHT
+        chart.legend.include_in_layout = False
+
+        plot = chart.plots[0]
+        plot.has_data_labels = True
+        plot.data_labels.font.size = Pt(12)
+        plot.data_labels.font.bold = True
+        plot.data_labels.font.color.rgb = MCKINSEY_COLORS["gray"]
+
+        # Chart source
+        source_text = chart_info.source
+        if source_text:
+            tx_box = slide.shapes.add_textbox(Inches(1), Inches(6.4), Inches(11), Inches(0.4))
+            p = tx_box.text_frame.paragraphs[0]
+            p.text = source_text
+            p.font.size = Pt(9)
+            p.font.italic = True
+            p.font.color.rgb = MCKINSEY_COLORS["gray"]
+
+    except Exception as e:
+        print(f"Failed to create chart: {e}")
+        tx_box = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(11), Inches(1))
+        tx_box.text_frame.paragraphs[0].text = "Error: Could not generate the requested chart."
+
+def add_enhanced_text_and_image_slide(slide, bullets, image_path):
+    """Creates an elegant side-by-side layout with bullet points and image."""
+    text_width = Inches(5.5)
+    text_height = Inches(4.5)
+
+    tx_box = slide.shapes.add_textbox(Inches(0.8), Inches(1.8), text_width, text_height)
+    tx_box.name = BULLET_SHAPE_NAME
+    tf = tx_box.text_frame
+    tf.word_wrap = True
+    tf.margin_left = Inches(0.15)
+    tf.margin_right = Inches(0.15)
+    tf.margin_top = Inches(0.1)
+    tf.margin_bottom = Inches(0.1)
+    tf.auto_size = MSO_AUTO_SIZE.TEXT_TO_FIT_SHAPE
+
+    for bullet in bullets:
+        if not isinstance(bullet, Bullet):
+            bullet = Bullet.from_raw(bullet)
+
+        p = tf.add_paragraph()
+        p.text = f"â€¢ {bullet.point}"
+        p.font.name = FONT_NAME
+        p.font.size = Pt(16)
+        p.font.color.rgb = MCKINSEY_COLORS["text"]
+        p.level = 0
+        p.space_after = Pt(6) if bullet.desc else Pt(12)
+
+        if bullet.desc:
+            desc_p = tf.add_paragraph()
+            desc_p.text = bullet.desc
+            desc_p.font.name = FONT_NAME
+            desc_p.font.size = Pt(13)
+            desc_p.font.color.rgb = MCKINSEY_COLORS["gray"]
+            desc_p.level = 1
+            desc_p.space_after = Pt(12)
+
+    # Add image
+    img_stream = validated_image_bytes(image_path)
+    if not img_stream:
+        img_stream = validated_image_bytes("fallback.jpg")
+
+    if img_stream:
+        try:
+            available_width = Inches(5.8)
+            available_height = Inches(4.5)
+            with Image.open(image_path if os.path.exists(image_path) else "fallback.jpg") as img:
+                original_width, original_height = img.size
+                aspect_ratio = original_width / original_height
+                if aspect_ratio > (available_width.inches / available_height.inches):
+                    img_width = available_width
+                    img_height = Inches(available_width.inches / aspect_ratio)
+                else:
+                    img_height = available_height
+                    img_width = Inches(available_height.inches * aspect_ratio)
+                img_width = max(img_width, Inches(4.0))
+                img_height = max(img_height, Inches(3.0))
+            img_x = Inches(7.0)
+            img_y = Inches(1.8) + (available_height - img_height) / 2
+            pic = slide.shapes.add_picture(img_stream, img_x, img_y, width=img_width, height=img_height)
+            pic.line.color.rgb = MCKINSEY_COLORS["light_gray"]
+            pic.line.width = Pt(1)
+        except Exception as e:
+            print(f"[Image Error] {e}")
+
+# === AI NARRATION GENERATION ===
+
+# def generate_narration_script(parsed_data, topic):
+#     """Generate AI narration script for the entire presentation."""
+#     logger.info("Generating narration script with AI...")
+    
+#     prompt = f"""
+#     Create a professional narration script for a PowerPoint presentation about "{topic}".
+#     The script should be engaging, clear, and suitable for text-to-speech conversion.
+    
+#     Presentation data:
+#     Introduction: {parsed_data.get("intro", "")}
+    
+#     Slides:
+#     """
+    
+#     for i, slide in enumerate(parsed_data.get("slides", []), 1):
+#         prompt += f"\nSlide {i}: {slide.get('title', '')}\n"
+#         prompt += f"Key Insight: {slide.get('insight', '')}\n"
+        
+#         if slide.get('type') == 'chart':
+#             chart_data = slide.get('data', {})
+#             prompt += f"Chart Type: {chart_data.get('type', 'Unknown')}\n"
+#             prompt += f"Chart Source: {chart_data.get('source', 'No source')}\n"
+#             if 'context' in slide:
+#                 prompt += f"Context: {slide['context']}\n"
+#         else:
+#             bullets = slide.get('data', [])
+#             if isinstance(bullets, list):
+#                 for bullet in bullets:
+#                     if isinstance(bullet, dict):
+#                         prompt += f"- {bullet.get('point', '')}: {bullet.get('desc', '')}\n"
+#                     else:
+#                         prompt += f"- {str(bullet)}\n"
+    
+#     prompt += f"""
+    
+#     Create a narration script with the following structure:
+#     1. Title slide: Welcome and introduction (20-30 seconds)
+#     2. For each content slide: Explain the title, key insight, and main points (30-45 seconds each)
+#     3. Keep the language conversational but professional
+#     4. Use smooth transitions between slides
+#     5. End with a brief conclusion
+    
+#     Format the response as JSON:
+#     {{
+#         "title_narration": "Welcome text for title slide...",
+#         "slide_narrations": [
+#             "Narration for slide 1...",
+#             "Narration for slide 2...",
+#             ...
+#         ],
+#         "conclusion": "Brief closing remarks..."
+#     }}
+#     """
+    
+#     try:
+#         response = llm.invoke(prompt).content
+#         # Parse JSON response
+#         narration_data = json.loads(response.strip())
+#         return narration_data
+#     except Exception as e:
+#         logger.error(f"Failed to generate narration script: {e}")
+#         # Fallback narration
+#         return {
+#             "title_narration": f"Welcome to this presentation about {topic}. Let's explore the key insights and analysis.",
+#             "slide_narrations": [f"This slide covers {slide.get('title', f'slide {i+1}')}. {slide.get('insight', 'Key information is presented here.')}" 
+#                                for i, slide in enumerate(parsed_data.get("slides", []))],
+#             "conclusion": "Thank you for your attention. This concludes our presentation."
+#         }
+def generate_narration_script(parsed_data, topic):
+    """Generate AI narration script for the entire presentation with better error handling."""
+    logger.info("Generating narration script with AI...")
+    deck = as_deck(parsed_data)
+    
+    try:
+        prompt = f"""
+        Create a professional narration script for a PowerPoint presentation about "{topic}".
+        The script should be engaging, clear, and suitable for text-to-speech conversion.
+        
+        Presentation data:
+        Introduction: {deck.intro}
+        
+        Slides:
+        """
+        
+        for i, slide in enumerate(deck.slides, 1):
+            prompt += f"\nSlide {i}: {slide.title}\n"
+            prompt += f"Key Insight: {slide.insight}\n"
+            
+            if slide.type == 'chart':
+                prompt += f"Chart Type: {slide.chart.type}\n"
+                prompt += f"Chart Source: {slide.chart.source or 'No source'}\n"
+                if slide.context:
+                    prompt += f"Context: {slide.context}\n"
+            else:
+                for bullet in slide.bullets[:3]:  # Limit to first 3 bullets for prompt
+                    if bullet.desc:
+                        prompt += f"- {bullet.point}: {bullet.desc}\n"
+                    else:
+                        prompt += f"- {bullet.point}\n"
+        
+        prompt += f"""
+        
+        Create a narration script with the following structure:
+        1. Title slide: Welcome and introduction (20-30 seconds)
+        2. For each content slide: Explain the title, key insight, and main points (30-45 seconds each)
+        3. Keep the language conversational but professional
+        4. Use smooth transitions between slides
+        5. End with a brief conclusion
+        
+        Return only a JSON object in this exact format:
+        {{
+            "title_narration": "Welcome text for title slide...",
+            "slide_narrations": [
+                "Narration for slide 1...",
+                "Narration for slide 2..."
+            ],
+            "conclusion": "Brief closing remarks..."
+        }}
+        """
+        
+        response = llm.invoke(prompt).content.strip()
+        
+        # Clean up response - remove markdown formatting if present
+        if response.startswith("```json"):
+            response = response.replace("```json", "").replace("```", "").strip()
+        elif response.startswith("```"):
+            response = response.replace("```", "", 1).replace("```", "").strip()
+        
+        # Parse JSON response
+        import json
+        try:
+            narration_data = json.loads(response)
+            
+            # Validate the structure
+            if not isinstance(narration_data, dict):
+                raise ValueError("Response is not a dictionary")
+            
+            if "title_narration" not in narration_data:
+                narration_data["title_narration"] = f"Welcome to this presentation about {topic}."
+            
+            if "slide_narrations" not in narration_data or not isinstance(narration_data["slide_narrations"], list):
+                narration_data["slide_narrations"] = []
+            
+            if "conclusion" not in narration_data:
+                narration_data["conclusion"] = "Thank you for your attention."
+            
+            return narration_data
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error: {e}")
+            logger.error(f"Response was: {response[:500]}...")
+            raise
+            
+    except Exception as e:
+        logger.error(f"Failed to generate narration script: {e}")
+        # Fallback narration; flagged so callers don't checkpoint it as the real script
+        return {
+            "fallback": True,
+            "title_narration": f"Welcome to this presentation about {topic}. Let's explore the key insights and analysis.",
+            "slide_narrations": [f"This slide covers {slide.title}. {slide.insight or 'Key information is presented here.'}" 
+                               for slide in deck.slides],
+            "conclusion": "Thank you for your attention. This concludes our presentation."
+        }
+NARRATION_LANGUAGES = {
+    # code used by the TTS engines: (name for the translation prompt, ISO 639-2 tag for the container)
+    "en": ("English", "eng"),
+    "es": ("Spanish", "spa"),
+    "fr": ("French", "fra"),
+    "de": ("German", "deu"),
+    "pt": ("Portuguese", "por"),
+    "it": ("Italian", "ita"),
+    "nl": ("Dutch", "nld"),
+    "hi": ("Hindi", "hin"),
+    "ja": ("Japanese", "jpn"),
+    "zh-CN": ("Simplified Chinese", "chi"),
+}
+
+def translate_narration(narration_data, lang):
+    """Translate a narration script into lang, keeping one entry per slide.
+
+    Segments the model drops or mangles keep their original text, so the
+    translated script always lines up with the slides.
+    """
+    name = NARRATION_LANGUAGES.get(lang, (lang, None))[0]
+    segments = [narration_data["title_narration"], *narration_data["slide_narrations"],
+                narration_data.get("conclusion") or ""]
+    prompt = f"""
+    Translate each narration segment below into {name} for text-to-speech.
+    Keep the meaning, tone and approximate length; keep numbers, names and units.
+    Return only a JSON array of {len(segments)} strings, in the same order.
+
+    {json.dumps(segments, ensure_ascii=False, indent=2)}
+    """
+    translated = None
+    try:
+        response = _strip_code_fences(llm.invoke(prompt).content)
+        translated = _loads_first([response, response[response.find("["):response.rfind("]") + 1]])
+    except Exception as e:
+        logger.error(f"Failed to translate narration to {name}: {e}")
+
+    if not isinstance(translated, list) or len(translated) != len(segments):
+        logger.warning(f"Translation to {name} returned an unexpected shape, keeping untranslated segments")
+        translated = translated if isinstance(translated, list) else []
+    result = [
+        str(translated[i]).strip() if i < len(translated) and str(translated[i]).strip() else segment
+        for i, segment in enumerate(segments)
+    ]
+    return {
+        "title_narration": result[0],
+        "slide_narrations": result[1:-1],
+        "conclusion": result[-1],
+    }
+
+# === TTS BACKENDS ===
+
+TTS_CONFIG = {
+    "engine": os.getenv("TTS_ENGINE", "gtts"),  # gtts | espeak | piper
+    "fallback_engine": "espeak",  # used when the selected engine fails (e.g. no network)
+    "sample_rate": 22050,
+    "espeak_binary": "espeak-ng",
+    "espeak_speed": 165,  # words per minute
+    "espeak_slow_speed": 130,
+    "piper_binary": "piper",
+    "piper_model": os.getenv("PIPER_MODEL", ""),
+    "max_workers": os.cpu_count() or 2,
+    "worker_mb": 150,  # estimated peak memory of one synthesis job (piper loads its model per process)
+    "sentence_cache": os.getenv("TTS_SENTENCE_CACHE", "1") == "1",
+    "cache_dir": os.getenv("TTS_CACHE_DIR", ".tts_cache"),
+    "sentence_gap": 0.12,  # seconds of silence between stitched sentences
+}
+
+class TTSBackend:
+    """Base class for narration engines. Subclasses write one audio file per call."""
+    name = "base"
+    extension = ".wav"
+    local = True  # local engines are CPU-bound and can run one job per core
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, output_path, lang='en', slow=False):
+        raise NotImplementedError
+
+    def voice(self, lang='en', slow=False):
+        """Identifies everything besides the text that changes the audio (used as a cache key)."""
+        return f"{lang}:{'slow' if slow else 'normal'}"
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS over the network, produces MP3."""
+    name = "gtts"
+    extension = ".mp3"
+    local = False
+
+    def synthesize(self, text, output_path, lang='en', slow=False):
+        tts = gTTS(text=text, lang=lang, slow=slow)
+        tts.save(output_path)
+        return output_path
+
+class EspeakBackend(TTSBackend):
+    """Offline espeak-ng engine writing 16-bit PCM WAV directly."""
+    name = "espeak"
+
+    def available(self):
+        return shutil.which(TTS_CONFIG["espeak_binary"]) is not None
+
+    def voice(self, lang='en', slow=False):
+        speed = TTS_CONFIG["espeak_slow_speed"] if slow else TTS_CONFIG["espeak_speed"]
+        return f"{lang}:{speed}"
+
+    def synthesize(self, text, output_path, lang='en', slow=False):
+        speed = TTS_CONFIG["espeak_slow_speed"] if slow else TTS_CONFIG["espeak_speed"]
+        cmd = [
+            TTS_CONFIG["espeak_binary"], "-v", lang, "-s", str(speed),
+            "-w", output_path, "--stdin"
+        ]
+        subprocess.run(cmd, input=text, capture_output=True, text=True, check=True)
+        return output_path
+
+class PiperBackend(TTSBackend):
+    """Offline piper neural engine writing PCM WAV directly. Needs TTS_CONFIG["piper_model"]."""
+    name = "piper"
+
+    def available(self):
+        return bool(TTS_CONFIG["piper_model"]) and shutil.which(TTS_CONFIG["piper_binary"]) is not None
+
+    def voice(self, lang='en', slow=False):
+        return f"{os.path.basename(TTS_CONFIG['piper_model'])}:{'slow' if slow else 'normal'}"
+
+    def synthesize(self, text, output_path, lang='en', slow=False):
+        cmd = [
+            TTS_CONFIG["piper_binary"], "--model", TTS_CONFIG["piper_model"],
+            "--output_file", output_path
+        ]
+        if slow:
+            cmd += ["--length_scale", "1.25"]
+        subprocess.run(cmd, input=text, capture_output=True, text=True, check=True)
+        return output_path
+
+TTS_BACKENDS = {
+    "gtts": GTTSBackend,
+    "espeak": EspeakBackend,
+    "piper": PiperBackend,
+}
+
+def get_tts_backend(engine=None):
+    """Return a backend instance for the given engine name (defaults to TTS_CONFIG["engine"])."""
+    name = (engine or TTS_CONFIG["engine"]).lower()
+    if name not in TTS_BACKENDS:
+        logger.warning(f"Unknown TTS engine '{name}', using gtts")
+        name = "gtts"
+    return TTS_BACKENDS[name]()
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+(?=\S)")
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence.strip()]
+
+def normalize_sentence(sentence):
+    # Only whitespace is collapsed: case changes how an engine reads acronyms and names
+    return " ".join(sentence.split())
+
+def sentence_cache_path(backend, sentence, lang='en', slow=False):
+    key = "\x1f".join([backend.name, backend.voice(lang, slow), lang, normalize_sentence(sentence)])
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(TTS_CONFIG["cache_dir"], backend.name, digest[:2], digest + ".wav")
+
+def cached_sentence_audio(sentence, backend, lang='en', slow=False):
+    """PCM samples for one sentence, synthesizing and caching it on a miss.
+
+    Returns (samples, hit) or (None, False) when the engine could not synthesize it.
+    Cache entries are stored as PCM WAV at AUDIO_CONFIG["sample_rate"], so hits
+    never need an external decoder.
+    """
+    sample_rate = AUDIO_CONFIG["sample_rate"]
+    path = sentence_cache_path(backend, sentence, lang, slow)
+    if os.path.exists(path):
+        try:
+            return decode_audio_to_pcm(path, sample_rate), True
+        except Exception as e:
+            logger.warning(f"Discarding unreadable TTS cache entry {path}: {e}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_base = f"{os.path.splitext(path)[0]}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        raw = backend.synthesize(sentence, tmp_base + backend.extension, lang=lang, slow=slow)
+        samples = decode_audio_to_pcm(raw, sample_rate)
+        write_pcm_wav(samples, tmp_base + ".pcm.wav", sample_rate)
+        os.replace(tmp_base + ".pcm.wav", path)
+        return samples, False
+    except Exception as e:
+        logger.error(f"Failed to synthesize sentence with {backend.name}: {e}")
+        return None, False
+    finally:
+        if os.path.exists(tmp_base + backend.extension):
+            os.remove(tmp_base + backend.extension)
+
+def synthesize_sentences(text, output_path, candidates, lang='en', slow=False):
+    """Stitch cached per-sentence audio into one WAV, synthesizing only new sentences.
+
+    All sentences of the text come from one engine, so a fallback never mixes
+    voices mid-narration: if any sentence fails, the whole text is redone with
+    the next candidate.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return None
+    sample_rate = AUDIO_CONFIG["sample_rate"]
+    gap = np.zeros(int(round(TTS_CONFIG["sentence_gap"] * sample_rate)), dtype=np.int16)
+
+    for candidate in candidates:
+        if not candidate.available():
+            continue
+        parts = []
+        hits = 0
+        for sentence in sentences:
+            samples, hit = cached_sentence_audio(sentence, candidate, lang, slow)
+            if samples is None:
+                break
+            hits += hit
+            if parts:
+                parts.append(gap)
+            parts.append(samples)
+        else:
+            target = os.path.splitext(output_path)[0] + ".wav"
+            write_pcm_wav(np.concatenate(parts), target, sample_rate)
+            logger.info(f"Created audio {target[:50]}... ({candidate.name}, {hits}/{len(sentences)} sentences cached)")
+            return target
+        logger.warning(f"TTS engine '{candidate.name}' failed on a sentence, falling back for the whole narration")
+    return None
+
+def create_audio_from_text(text, output_path, lang='en', slow=False, engine=None):
+    """Create audio file from text with the selected TTS backend.
+
+    The extension of output_path is replaced with the backend's native format
+    (WAV when sentences are stitched from the cache), so callers must use the
+    returned path.
+    """
+    backend = get_tts_backend(engine)
+    candidates = [backend]
+    fallback = TTS_CONFIG.get("fallback_engine")
+    if fallback and fallback != backend.name:
+        candidates.append(get_tts_backend(fallback))
+
+    if TTS_CONFIG["sentence_cache"]:
+        path = synthesize_sentences(text, output_path, candidates, lang=lang, slow=slow)
+        if path:
+            return path
+
+    for candidate in candidates:
+        if not candidate.available():
+            logger.warning(f"TTS engine '{candidate.name}' is not available")
+            continue
+        target = os.path.splitext(output_path)[0] + candidate.extension
+        try:
+            logger.info(f"Creating audio ({candidate.name}): {target[:50]}...")
+            return candidate.synthesize(text, target, lang=lang, slow=slow)
+        except Exception as e:
+            logger.error(f"Failed to create audio with {candidate.name}: {e}")
+    return None
+
+def synthesize_narration(narration_data, audio_dir, lang='en', engine=None, keep_missing=False):
+    """Synthesize title, slide and conclusion narration, returning audio paths in slide order.
+
+    Local engines run one process per core; the network engine is limited to a
+    few concurrent requests. Failed segments are dropped, or returned as None
+    with keep_missing so positions still line up with the slides.
+    """
+    jobs = [("title", narration_data["title_narration"])]
+    for i, narration in enumerate(narration_data["slide_narrations"]):
+        jobs.append((f"slide_{i+1:02d}", narration))
+    if narration_data.get("conclusion"):
+        jobs.append(("conclusion", narration_data["conclusion"]))
+
+    backend = get_tts_backend(engine)
+    workers = TTS_CONFIG["max_workers"] if backend.local else min(4, TTS_CONFIG["max_workers"])
+    workers = memory_governor.workers(TTS_CONFIG["worker_mb"], workers)
+
+    def run(job):
+        name, text = job
+        return create_audio_from_text(text, os.path.join(audio_dir, f"{name}.mp3"), lang=lang, engine=backend.name)
+
+    results = scheduler.map("cpu" if backend.local else "io", run, jobs, limit=workers)
+    return results if keep_missing else [path for path in results if path]
+
+# def get_audio_duration(audio_path):
+#     """Get the duration of an audio file."""
+#     try:
+#         audio = mp.AudioFileClip(audio_path)
+#         duration = audio.duration
+#         audio.close()
+#         return duration
+#     except Exception as e:
+#         logger.error(f"Failed to get audio duration: {e}")
+#         return VIDEO_CONFIG["slide_duration"]  # fallback duration
+
+def convert_mp3_to_wav(mp3_path):
+    """Convert MP3 to WAV using ffmpeg if available."""
+    wav_path = mp3_path.replace('.mp3', '.wav')
+    try:
+        # Try using ffmpeg if available
+        if shutil.which('ffmpeg'):
+            subprocess.run([
+                'ffmpeg', '-i', mp3_path, '-acodec', 'pcm_s16le', 
+                '-ar', '44100', wav_path, '-y'
+            ], check=True, capture_output=True, text=True)
+            return wav_path
+        else:
+            logger.warning("ffmpeg not found, using original MP3 file")
+            return mp3_path
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Failed to convert MP3 to WAV: {e}, using original file")
+        return mp3_path
+    except Exception as e:
+        logger.error(f"Audio conversion error: {e}")
+        return mp3_path
+# def create_video_from_slides_and_audio(image_files, audio_files, output_path):
+#     """Create video from slide images and audio files using OpenCV."""
+#     logger.info("Creating video from slides and audio using OpenCV...")
+    
+#     try:
+#         # Video writer setup
+#         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+#         video_writer = cv2.VideoWriter(
+#             output_path, 
+#             fourcc, 
+#             VIDEO_CONFIG["fps"], 
+#             (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"])
+#         )
+        
+#         temp_audio_files = []
+#         total_duration = 0
+        
+#         for i, (image_path, audio_path) in enumerate(zip(image_files, audio_files)):
+#             if not os.path.exists(image_path) or not os.path.exists(audio_path):
+#                 logger.warning(f"Missing file for slide {i+1}")
+#                 continue
+            
+#             # Get audio duration
+#             audio_duration = get_audio_duration(audio_path)
+#             total_duration += audio_duration
+#             logger.info(f"Slide {i+1}: {audio_duration:.1f}s duration")
+            
+#             # Convert MP3 to WAV if needed for better compatibility
+#             wav_path = convert_mp3_to_wav(audio_path)
+#             temp_audio_files.append((wav_path, audio_path))  # Store both paths
+            
+#             # Load and process image
+#             img = cv2.imread(image_path)
+#             if img is None:
+#                 logger.error(f"Could not load image: {image_path}")
+#                 continue
+                
+#             # Resize image to video dimensions
+#             img_resized = cv2.resize(img, (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"]))
+            
+#             # Calculate number of frames for this slide
+#             num_frames = int(audio_duration * VIDEO_CONFIG["fps"])
+            
+#             # Write frames for this slide
+#             for frame_num in range(num_frames):
+#                 # Add simple fade effect for transitions (optional)
+#                 if i > 0 and frame_num < int(VIDEO_CONFIG["fps"] * VIDEO_CONFIG["transition_duration"]):
+#                     # Fade in effect
+#                     alpha = frame_num / (VIDEO_CONFIG["fps"] * VIDEO_CONFIG["transition_duration"])
+#                     # Create a simple fade by blending with a black frame
+#                     black_frame = np.zeros_like(img_resized)
+#                     faded_img = cv2.addWeighted(img_resized, alpha, black_frame, 1-alpha, 0)
+#                     video_writer.write(faded_img)
+#                 else:
+#                     video_writer.write(img_resized)
+            
+#             logger.info(f"Processed slide {i+1}: {num_frames} frames ({audio_duration:.1f}s)")
+        
+#         video_writer.release()
+#         logger.info(f"Video frames written. Total duration: {total_duration:.1f}s")
+        
+#         # Now we need to add audio to the video
+#         final_output_path = output_path.replace('.mp4', '_final.mp4')
+        
+#         if shutil.which('ffmpeg') and len(temp_audio_files) > 0:
+#             try:
+#                 # Concatenate all audio files
+#                 audio_list_file = output_path.replace('.mp4', '_audio_list.txt')
+#                 with open(audio_list_file, 'w', encoding='utf-8') as f:
+#                     for wav_path, _ in temp_audio_files:
+#                         # Use absolute path and escape for Windows
+#                         abs_path = os.path.abspath(wav_path).replace('\\', '/')
+#                         f.write(f"file '{abs_path}'\n")
+                
+#                 concat_audio_path = output_path.replace('.mp4', '_combined_audio.wav')
+                
+#                 logger.info("Combining audio files...")
+#                 # Combine audio files
+#                 result = subprocess.run([
+#                     'ffmpeg', '-f', 'concat', '-safe', '0', '-i', audio_list_file,
+#                     '-c', 'copy', concat_audio_path, '-y'
+#                 ], capture_output=True, text=True)
+                
+#                 if result.returncode != 0:
+#                     logger.error(f"FFmpeg audio concat failed: {result.stderr}")
+#                     raise subprocess.CalledProcessError(result.returncode, 'ffmpeg')
+                
+#                 logger.info("Combining video with audio...")
+#                 # Combine video with audio
+#                 result = subprocess.run([
+#                     'ffmpeg', '-i', output_path, '-i', concat_audio_path,
+#                     '-c:v', 'copy', '-c:a', 'aac', '-shortest', 
+#                     final_output_path, '-y'
+#                 ], capture_output=True, text=True)
+                
+#                 if result.returncode != 0:
+#                     logger.error(f"FFmpeg video+audio combine failed: {result.stderr}")
+#                     raise subprocess.CalledProcessError(result.returncode, 'ffmpeg')
+                
+#                 # Clean up temporary files
+#                 try:
+#                     os.remove(output_path)  # Remove video-only file
+#                     os.remove(audio_list_file)
+#                     os.remove(concat_audio_path)
+                    
+#                     # Move final file to original name
+#                     shutil.move(final_output_path, output_path)
+#                 except Exception as cleanup_error:
+#                     logger.warning(f"Cleanup error: {cleanup_error}")
+                
+#                 logger.info(f"Video with audio created successfully: {output_path}")
+#                 return output_path
+                
+#             except subprocess.CalledProcessError as e:
+#                 logger.error(f"FFmpeg error: {e}")
+#                 logger.info(f"Video created without audio: {output_path}")
+#                 return output_path
+#             except Exception as e:
+#                 logger.error(f"Unexpected error during audio-video combination: {e}")
+#                 logger.info(f"Video created without audio: {output_path}")
+#                 return output_path
+#         else:
+#             if not shutil.which('ffmpeg'):
+#                 logger.warning("ffmpeg not found - video created without audio")
+#             logger.info(f"Video created: {output_path}")
+#             return output_path
+        
+#     except Exception as e:
+#         logger.error(f"Failed to create video: {e}")
+#         return None
+#     finally:
+#         # Clean up temporary audio files
+#         for wav_path, original_path in temp_audio_files:
+#             if wav_path != original_path and os.path.exists(wav_path):
+#                 try:
+#                     os.remove(wav_path)
+#                 except Exception as e:
+#                     logger.warning(f"Failed to clean up temp audio file {wav_path}: {e}")
+
+# Also add these imports at the top of your file if not already present:
+
+def get_audio_duration(audio_path):
+    """Get the duration of an audio file using file size estimation."""
+    try:
+        if audio_path.endswith('.mp3'):
+            # For MP3, estimate duration from file size
+            file_size = os.path.getsize(audio_path)
+            # Rough estimation: 1MB â‰ˆ 60 seconds for typical speech
+            # More conservative estimate for better sync
+            estimated_duration = max(3, file_size / (1024 * 15))  # Adjust divisor for accuracy
+            return estimated_duration
+        elif audio_path.endswith('.wav'):
+            # For WAV files, try to use wave module
+            import wave
+            with wave.open(audio_path, 'r') as wav_file:
+                frames = wav_file.getnframes()
+                rate = wav_file.getframerate()
+                duration = frames / float(rate)
+                return duration
+        else:
+            return VIDEO_CONFIG["slide_duration"]  # fallback
+    except Exception as e:
+        logger.error(f"Failed to get audio duration: {e}")
+        return VIDEO_CONFIG["slide_duration"]  # fallback duration
+
+# === NARRATION TRACK ASSEMBLY ===
+
+AUDIO_CONFIG = {
+    "sample_rate": 44100,
+    "channels": 1,
+    "slide_padding": 0.4,  # seconds of silence appended after each slide except the last
+}
+
+def decode_audio_to_pcm(audio_path, sample_rate=None):
+    """Decode an audio file to a mono int16 NumPy array at sample_rate."""
+    sample_rate = sample_rate or AUDIO_CONFIG["sample_rate"]
+
+    if audio_path.endswith('.wav'):
+        with wave.open(audio_path, 'rb') as wav_file:
+            if wav_file.getsampwidth() == 2:
+                channels = wav_file.getnchannels()
+                rate = wav_file.getframerate()
+                samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+                if channels > 1:
+                    samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+                if rate != sample_rate and len(samples):
+                    target_len = int(round(len(samples) * sample_rate / rate))
+                    positions = np.linspace(0, len(samples) - 1, target_len)
+                    samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+                return samples
+
+    if not shutil.which('ffmpeg'):
+        raise RuntimeError(f"ffmpeg is required to decode {audio_path}")
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-i', audio_path, '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ac', '1', '-ar', str(sample_rate), '-'
+    ], check=True, capture_output=True)
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+def write_pcm_wav(samples, output_path, sample_rate=None):
+    """Write a mono int16 array as a PCM WAV file."""
+    sample_rate = sample_rate or AUDIO_CONFIG["sample_rate"]
+    with wave.open(output_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.ascontiguousarray(samples, dtype=np.int16).tobytes())
+    return output_path
+
+def _decode_segments(audio_files, sample_rate):
+    segments = []
+    for audio_path in audio_files:
+        if audio_path is None:
+            # Missing narration (e.g. failed synthesis); aligned tracks fill it with silence
+            segments.append(np.zeros(0, dtype=np.int16))
+            continue
+        try:
+            segments.append(decode_audio_to_pcm(audio_path, sample_rate))
+        except Exception as e:
+            logger.error(f"Failed to decode narration {audio_path}: {e}")
+            segments.append(np.zeros(int(VIDEO_CONFIG["slide_duration"] * sample_rate), dtype=np.int16))
+    return segments
+
+def _write_track(segments, output_path, sample_rate, pad_samples, slide_lengths=None):
+    parts = []
+    timeline = []
+    offset = 0
+    for i, samples in enumerate(segments):
+        parts.append(samples)
+        length = len(samples)
+        if pad_samples and i < len(segments) - 1:
+            parts.append(np.zeros(pad_samples, dtype=np.int16))
+            length += pad_samples
+        if slide_lengths and slide_lengths[i] > length:
+            parts.append(np.zeros(slide_lengths[i] - length, dtype=np.int16))
+            length = slide_lengths[i]
+        timeline.append({
+            "start": offset,
+            "end": offset + length,
+            "duration": length / sample_rate,
+        })
+        offset += length
+
+    track = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int16)
+    write_pcm_wav(track, output_path, sample_rate)
+    logger.info(f"Assembled narration track: {len(timeline)} slides, {offset / sample_rate:.2f}s")
+
+    return {"path": output_path, "sample_rate": sample_rate, "timeline": timeline}
+
+def assemble_narration_track(audio_files, output_path, sample_rate=None, padding=None):
+    """Decode every narration segment once and concatenate them into a single WAV track.
+
+    Returns a dict with the track path, its sample rate and a per-slide timeline of
+    exact sample offsets: [{"start": int, "end": int, "duration": float}, ...].
+    The padding after a slide belongs to that slide, so the slide durations add up
+    to the track length.
+    """
+    sample_rate = sample_rate or AUDIO_CONFIG["sample_rate"]
+    padding = AUDIO_CONFIG["slide_padding"] if padding is None else padding
+    pad_samples = int(round(padding * sample_rate))
+    return _write_track(_decode_segments(audio_files, sample_rate), output_path, sample_rate, pad_samples)
+
+def assemble_aligned_tracks(audio_files_by_language, output_dir, sample_rate=None, padding=None):
+    """Assemble one narration track per language on a shared slide timeline.
+
+    Each slide lasts as long as its longest narration across languages; shorter
+    narrations are followed by silence. All returned tracks therefore have the
+    same timeline and can be muxed over a single video stream.
+    """
+    sample_rate = sample_rate or AUDIO_CONFIG["sample_rate"]
+    padding = AUDIO_CONFIG["slide_padding"] if padding is None else padding
+    pad_samples = int(round(padding * sample_rate))
+
+    decoded = {lang: _decode_segments(files, sample_rate) for lang, files in audio_files_by_language.items()}
+    slide_count = min(len(segments) for segments in decoded.values())
+    slide_lengths = [
+        max(len(segments[i]) for segments in decoded.values()) + (pad_samples if i < slide_count - 1 else 0)
+        for i in range(slide_count)
+    ]
+    return {
+        lang: _write_track(segments[:slide_count], os.path.join(output_dir, f"narration_{lang}.wav"),
+                           sample_rate, pad_samples, slide_lengths)
+        for lang, segments in decoded.items()
+    }
+
+# === MEMORY GOVERNOR ===
+
+MEMORY_CONFIG = {
+    "budget_mb": float(os.getenv("MEMORY_BUDGET_MB", "2048")),  # RSS budget for the whole process, shared by all jobs it runs
+    "poll_interval": 0.25,  # seconds between RSS samples while a stage runs
+    "frame_cache": 4,  # decoded frames kept by the constant frame rate renderer
+}
+
+def current_rss_mb():
+    """Resident set size of this process (and its children, when psutil is available) in MB."""
+    try:
+        import psutil
+        proc = psutil.Process()
+        rss = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def frame_mb(width, height, channels=3):
+    return width * height * channels / (1024 * 1024)
+
+class MemoryGovernor:
+    """Keeps this process under a fixed RSS budget.
+
+    The budget is per process, not per job: RSS cannot be attributed to one job,
+    so jobs running side by side in one worker (QUEUE_CONFIG["worker_slots"])
+    share it, and stage peaks include their memory.
+
+    Work items reserve their estimated size with reserve(); a reservation blocks
+    while measured RSS plus outstanding reservations would exceed the budget.
+    One reservation is always admitted so a single oversized item cannot deadlock.
+    stage() samples RSS in the background and records the peak for each stage.
+    """
+
+    def __init__(self, budget_mb=None, poll_interval=None):
+        self.budget_mb = budget_mb or MEMORY_CONFIG["budget_mb"]
+        self.poll_interval = poll_interval or MEMORY_CONFIG["poll_interval"]
+        self.reserved_mb = 0.0
+        self.peaks = {}
+        self._cond = threading.Condition()
+
+    def headroom_mb(self):
+        return self.budget_mb - current_rss_mb() - self.reserved_mb
+
+    def workers(self, item_mb, max_workers):
+        """How many items of item_mb can run at once right now, between 1 and max_workers."""
+        return max(1, min(max_workers, int(self.headroom_mb() // max(item_mb, 1))))
+
+    @contextmanager
+    def reserve(self, mb):
+        with self._cond:
+            while self.reserved_mb > 0 and self.headroom_mb() < mb:
+                self._cond.wait(self.poll_interval)
+            self.reserved_mb += mb
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.reserved_mb -= mb
+                self._cond.notify_all()
+
+    @contextmanager
+    def stage(self, name):
+        stop = threading.Event()
+        peak = [current_rss_mb()]
+
+        def sample():
+            while not stop.wait(self.poll_interval):
+                peak[0] = max(peak[0], current_rss_mb())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            peak_mb = max(peak[0], current_rss_mb())
+            self.peaks[name] = max(self.peaks.get(name, 0.0), peak_mb)
+            level = logging.WARNING if peak_mb > self.budget_mb else logging.INFO
+            logger.log(level, f"Stage '{name}': peak RSS {peak_mb:.0f} MB (budget {self.budget_mb:.0f} MB)")
+
+    def report(self):
+        return {name: round(peak, 1) for name, peak in self.peaks.items()}
+
+memory_governor = MemoryGovernor()
+
+# === STAGE SCHEDULER ===
+
+SCHEDULER_CONFIG = {
+    "io_workers": int(os.getenv("IO_WORKERS", 32)),  # LLM, image search, downloads, network TTS
+    "cpu_workers": int(os.getenv("CPU_WORKERS", os.cpu_count() or 1)),  # soffice, pdftoppm, x264, local TTS, deck shards
+}
+
+# Lower runs first: an interactive preview overtakes queued final renders
+JOB_PRIORITIES = {"preview": 0, "draft": 1, "final": 2}
+current_job_priority = contextvars.ContextVar("current_job_priority", default=JOB_PRIORITIES["final"])
+
+def job_priority(quality=None):
+    """Scheduling priority of a job rendered at quality (see RENDER_PROFILES)."""
+    return JOB_PRIORITIES.get(quality or VIDEO_CONFIG["quality"], JOB_PRIORITIES["final"])
+
+class PriorityPool:
+    """Worker threads that run queued tasks lowest priority first, FIFO within a priority.
+
+    Tasks submitted with process=True run in a process pool of the same size (for
+    GIL-bound Python); the worker thread only holds the slot, so threads and
+    processes share one concurrency limit. A task submitted from one of this
+    pool's own workers runs inline, so nested stages never wait for a slot they hold.
+    A worker that needs nested tasks to run concurrently submits them with
+    inline=False and waits for them inside lend_slot(), which lets another thread
+    take its slot while it is blocked.
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = max(1, workers)
+        self.reset()
+
+    def reset(self):
+        """Forget queued tasks, threads and processes (they do not survive a fork)."""
+        self._queue = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._threads = []
+        self._process_pool = None
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, func, *args, priority=None, process=False, inline=True, **kwargs):
+        priority = current_job_priority.get() if priority is None else priority
+        future = Future()
+        if inline and getattr(self._local, "worker", False):
+            self._run(future, func, args, kwargs, priority, False)
+            return future
+        with self._cond:
+            self._start()
+            heapq.heappush(self._queue, (priority, next(self._seq), future, func, args, kwargs, process))
+            self._cond.notify()
+        return future
+
+    @contextmanager
+    def lend_slot(self):
+        """Let another thread run queued tasks while the calling worker blocks; no-op outside the pool."""
+        if not getattr(self._local, "worker", False):
+            yield
+            return
+        with self._cond:
+            self.workers += 1
+            self._start()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.workers -= 1  # the extra thread exits once it is idle
+
+    def _run(self, future, func, args, kwargs, priority, process):
+        if not future.set_running_or_notify_cancel():
+            return
+        token = current_job_priority.set(priority)
+        try:
+            if process:
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.workers)
+                result = self._process_pool.submit(func, *args, **kwargs).result()
+            else:
+                result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            current_job_priority.reset(token)
+
+    def _work(self):
+        self._local.worker = True
+        while True:
+            with self._cond:
+                while not self._queue and len(self._threads) <= self.workers:
+                    self._cond.wait()
+                if len(self._threads) > self.workers:
+                    self._threads.remove(threading.current_thread())
+                    return
+                priority, _, future, func, args, kwargs, process = heapq.heappop(self._queue)
+            self._run(future, func, args, kwargs, priority, process)
+
+class StageScheduler:
+    """Shared pools for every stage of every job in this process.
+
+    Network-bound work ("io") and core-bound work ("cpu", or "process" for
+    GIL-bound Python) queue separately, so downloads and API calls keep going
+    while the CPUs encode. Tasks inherit the priority of the job that submits
+    them (see priority()).
+    """
+
+    def __init__(self, io_workers=None, cpu_workers=None):
+        self.io = PriorityPool("io", io_workers or SCHEDULER_CONFIG["io_workers"])
+        self.cpu = PriorityPool("cpu", cpu_workers or SCHEDULER_CONFIG["cpu_workers"])
+
+    def reset(self):
+        self.io.reset()
+        self.cpu.reset()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) on the "io", "cpu" or "process" pool; returns a Future.
+
+        Pass inline=False (and wait inside lend_slot(kind)) to run nested tasks concurrently.
+        """
+        if kind == "io":
+            return self.io.submit(func, *args, **kwargs)
+        return self.cpu.submit(func, *args, process=kind == "process", **kwargs)
+
+    def lend_slot(self, kind):
+        """Context for a worker of kind's pool that waits on tasks it submitted with inline=False."""
+        return self.io.lend_slot() if kind == "io" else self.cpu.lend_slot()
+
+    def map(self, kind, func, items, limit=None):
+        """Like Executor.map (results in order), with at most limit of these items in flight."""
+        items = list(items)
+        limit = limit or len(items) or 1
+        results = [None] * len(items)
+        pending = {}
+        for index, item in enumerate(items):
+            while len(pending) >= limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            pending[self.submit(kind, func, item)] = index
+        for future, index in pending.items():
+            results[index] = future.result()
+        return results
+
+    @contextmanager
+    def priority(self, quality_or_level):
+        """Run a job's stages at the priority of its render quality (or an explicit level)."""
+        level = quality_or_level if isinstance(quality_or_level, int) else job_priority(quality_or_level)
+        token = current_job_priority.set(level)
+        try:
+            yield level
+        finally:
+            current_job_priority.reset(token)
+
+scheduler = StageScheduler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=scheduler.reset)
+
+# === PPT TO VIDEO CONVERSION ===
+
+# def convert_ppt_to_images(ppt_path, output_dir):
+#     """Convert PowerPoint slides to images."""
+#     logger.info(f"Converting PPT to images: {ppt_path}")
+    
+#     try:
+#         # Create output directory
+#         os.makedirs(output_dir, exist_ok=True)
+        
+#         # Use python-pptx to read the presentation
+#         prs = Presentation(ppt_path)
+#         image_files = []
+        
+#         # For each slide, we'll create a screenshot-like image
+#         # Note: This is a simplified approach. For better quality, you might need
+#         # to use tools like LibreOffice in headless mode or other conversion tools
+        
+#         for i, slide in enumerate(prs.slides):
+#             image_path = os.path.join(output_dir, f"slide_{i+1:02d}.png")
+            
+#             # Create a blank image with presentation dimensions
+#             # Convert inches to pixels (assuming 96 DPI)
+#             width_px = int(prs.slide_width.inches * 96)
+#             height_px = int(prs.slide_height.inches * 96)
+            
+#             # Scale to video resolution
+#             scale_x = VIDEO_CONFIG["width"] / width_px
+#             scale_y = VIDEO_CONFIG["height"] / height_px
+#             scale = min(scale_x, scale_y)
+            
+#             final_width = int(width_px * scale)
+#             final_height = int(height_px * scale)
+            
+#             # Create image (this is a placeholder - in practice you'd need proper PPT rendering)
+#             img = Image.new('RGB', (VIDEO_CONFIG["width"], VIDEO_CONFIG["height"]), 
+#                           color=VIDEO_CONFIG["background_color"])
+            
+#             draw = ImageDraw.Draw(img)
+            
+#             # Add slide number and basic layout
+#             draw.rectangle([50, 50, VIDEO_CONFIG["width"]-50, VIDEO_CONFIG["height"]-50], 
+#                          outline=(200, 200, 200), width=2)
+            
+#             # Add slide number
+#             try:
+#                 font = ImageDraw.ImageFont.load_default()
+#                 draw.text((VIDEO_CONFIG["width"]//2, 100), f"Slide {i+1}", 
+#                          fill=(50, 50, 50), font=font, anchor="mm")
+#             except:
+#                 draw.text((VIDEO_CONFIG["width"]//2, 100), f"Slide {i+1}", 
+#                          fill=(50, 50, 50), anchor="mm")
+            
+#             img.save(image_path, 'PNG', quality=95)
+#             image_files.append(image_path)
+#             logger.info(f"Created slide image: {image_path}")
+        
+#         return image_files
+        
+#     except Exception as e:
+#         logger.error(f"Failed to convert PPT to images: {e}")
+#         return []
+import subprocess, glob
+
+import subprocess, glob, shutil
+
+import subprocess, glob, os, shutil
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+def _pdf_page_mb(pdf_info, dpi):
+    """Decoded RGB size of one PDF page at dpi, from pdfinfo's "Page size" (in points)."""
+    match = re.match(r"([\d.]+) x ([\d.]+)", str(pdf_info.get("Page size", "")))
+    width_in, height_in = (float(match.group(1)) / 72, float(match.group(2)) / 72) if match else (13.33, 7.5)
+    return frame_mb(width_in * dpi, height_in * dpi)
+
+RASTER_CONFIG = {
+    "soffice_binary": "soffice",
+    "shard_min_slides": 24,  # smaller decks are exported by a single soffice instance
+    "max_instances": max(1, (os.cpu_count() or 2) // 2),  # concurrent soffice processes
+    "timeout": 900,  # seconds per soffice export
+}
+
+def export_pdf(ppt_path, output_dir, profile_dir=None):
+    """Export a presentation to PDF with soffice and return the PDF path.
+
+    profile_dir gives the instance its own LibreOffice user profile
+    (-env:UserInstallation), which is what lets several exports run at once.
+    """
+    temp_profile = None if profile_dir else tempfile.mkdtemp(prefix="soffice_profile_")
+    cmd = [
+        RASTER_CONFIG["soffice_binary"], f"-env:UserInstallation={Path(profile_dir or temp_profile).resolve().as_uri()}",
+        "--headless", "--convert-to", "pdf", "--outdir", output_dir, ppt_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=RASTER_CONFIG["timeout"])
+    finally:
+        if temp_profile:
+            shutil.rmtree(temp_profile, ignore_errors=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"LibreOffice PDF export failed: {result.stderr}")
+
+    pdf_path = os.path.join(output_dir, os.path.splitext(os.path.basename(ppt_path))[0] + ".pdf")
+    if not os.path.exists(pdf_path):
+        raise RuntimeError("PDF not found after LibreOffice export")
+    return pdf_path
+
+def split_presentation(ppt_path, output_dir, shard_size):
+    """Write copies of a deck that each keep one contiguous slide range.
+
+    Returns (shard_path, first_slide_number) pairs in slide order.
+    """
+    slide_count = len(Presentation(ppt_path).slides)
+    base = os.path.splitext(os.path.basename(ppt_path))[0]
+    shards = []
+    for start in range(0, slide_count, shard_size):
+        prs = Presentation(ppt_path)
+        slide_ids = prs.slides._sldIdLst
+        for index, slide_id in enumerate(list(slide_ids)):
+            if not start <= index < start + shard_size:
+                prs.part.drop_rel(slide_id.rId)
+                slide_ids.remove(slide_id)
+        shard_path = os.path.join(output_dir, f"{base}_shard{start // shard_size:03d}.pptx")
+        prs.save(shard_path)
+        shards.append((shard_path, start + 1))
+    return shards
+
+def iter_pdf_pages(pdf_path, dpi, first_slide=1):
+    """Yield (slide_number, PIL page) for every PDF page, decoding a few pages at a time."""
+    info = pdfinfo_from_path(pdf_path)
+    page_count = int(info.get("Pages", 0))
+    page_mb = _pdf_page_mb(info, dpi)
+    first = 1
+    while first <= page_count:
+        # Never hold every decoded page of a large deck in memory. No reservation is
+        # held across the yield: the consumer may itself wait on reservations.
+        batch = memory_governor.workers(page_mb, 8)
+        last = min(page_count, first + batch - 1)
+        pages = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last,
+                                  thread_count=min(batch, os.cpu_count() or 1))
+        for i, page in enumerate(pages, start=first):
+            yield first_slide + i - 1, page
+            page.close()
+        del pages
+        first = last + 1
+
+def rasterize_pdf(pdf_path, output_dir, dpi, first_slide=1):
+    """Write each PDF page as slide_NN.png, numbered from first_slide."""
+    image_files = []
+    for number, page in iter_pdf_pages(pdf_path, dpi, first_slide):
+        img_file = os.path.join(output_dir, f"slide_{number:02d}.png")
+        page.save(img_file, "PNG")
+        image_files.append(img_file)
+    return image_files
+
+def export_deck_pdfs(ppt_path, work_dir, instances=None):
+    """Export a deck to PDF, returning (pdf_path, first_slide_number) pairs in slide order.
+
+    Decks with at least RASTER_CONFIG["shard_min_slides"] slides are split into
+    contiguous slide ranges that are exported by up to `instances` isolated
+    soffice processes at once, also when called from a cpu-pool task (the
+    caller lends its slot while it waits).
+    """
+    instances = instances or RASTER_CONFIG["max_instances"]
+    slide_count = len(Presentation(ppt_path).slides)
+    if instances > 1 and slide_count >= RASTER_CONFIG["shard_min_slides"]:
+        shard_size = -(-slide_count // instances)
+        shards = split_presentation(ppt_path, work_dir, shard_size)
+        logger.info(f"Exporting {slide_count} slides in {len(shards)} shards of up to {shard_size}")
+    else:
+        shards = [(ppt_path, 1)]
+
+    def export(index, shard_path):
+        shard_dir = os.path.join(work_dir, f"shard{index:03d}")
+        os.makedirs(shard_dir, exist_ok=True)
+        return export_pdf(shard_path, shard_dir, os.path.join(shard_dir, "profile"))
+
+    futures = [scheduler.submit("cpu", export, i, path, inline=False) for i, (path, _) in enumerate(shards)]
+    with scheduler.lend_slot("cpu"):
+        return [(future.result(), first) for future, (_, first) in zip(futures, shards)]
+
+def convert_ppt_to_images(ppt_path, output_dir, dpi=None, instances=None):
+    """Convert PPT to images (one PNG per slide) using LibreOffice + pdf2image.
+
+    Large decks are exported in shards (see export_deck_pdfs); the page images are
+    numbered by their position in the original deck.
+    """
+    logger.info(f"Converting PPT to images via PDF: {ppt_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    dpi = dpi or VIDEO_CONFIG["dpi"]
+    work_dir = tempfile.mkdtemp(prefix="raster_")
+
+    try:
+        pdfs = export_deck_pdfs(ppt_path, work_dir, instances)
+        futures = [scheduler.submit("cpu", rasterize_pdf, pdf_path, output_dir, dpi, first) for pdf_path, first in pdfs]
+        image_files = [path for future in futures for path in future.result()]
+
+        logger.info(f"Generated {len(image_files)} slide images")
+        return image_files
+
+    except Exception as e:
+        logger.error(f"Failed to convert PPT to images: {e}")
+        return []
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def iter_presentation_frames(ppt_path, dpi=None, instances=None, image_dir=None):
+    """Yield the rendered pages of a deck in slide order as PIL images.
+
+    Pages go from pdftoppm straight to the caller without a PNG round trip;
+    pass image_dir to also keep a slide_NN.png copy of each page.
+    """
+    dpi = dpi or VIDEO_CONFIG["dpi"]
+    work_dir = tempfile.mkdtemp(prefix="raster_")
+    try:
+        if image_dir:
+            os.makedirs(image_dir, exist_ok=True)
+        for pdf_path, first in export_deck_pdfs(ppt_path, work_dir, instances):
+            for number, page in iter_pdf_pages(pdf_path, dpi, first):
+                if image_dir:
+                    page.save(os.path.join(image_dir, f"slide_{number:02d}.png"), "PNG")
+                yield page
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# def create_video_from_slides_and_audio(image_files, audio_files, output_path):
+#     """Create video from slide images and audio files."""
+#     logger.info("Creating video from slides and audio...")
+    
+#     try:
+#         video_clips = []
+        
+#         for i, (image_path, audio_path) in enumerate(zip(image_files, audio_files)):
+#             if not os.path.exists(image_path) or not os.path.exists(audio_path):
+#                 logger.warning(f"Missing file for slide {i+1}")
+#                 continue
+            
+#             # Get audio duration
+#             audio_duration = get_audio_duration(audio_path)
+            
+#             # Create image clip
+#             img_clip = mp.ImageClip(image_path, duration=audio_duration)
+            
+#             # Load audio
+#             audio_clip = mp.AudioFileClip(audio_path)
+            
+#             # Combine image and audio
+#             video_clip = img_clip.set_audio(audio_clip)
+            
+#             # Add fade transition
+#             if i > 0:
+#                 video_clip = video_clip.fadein(VIDEO_CONFIG["transition_duration"])
+            
+#             video_clips.append(video_clip)
+        
+#         if not video_clips:
+#             raise Exception("No valid video clips created")
+        
+#         # Concatenate all clips
+#         final_video = mp.concatenate_videoclips(video_clips, method="compose")
+        
+#         # Write the video file
+#         final_video.write_videofile(
+#             output_path,
+#             fps=VIDEO_CONFIG["fps"],
+#             codec='libx264',
+#             audio_codec='aac',
+#             temp_audiofile='temp-audio.m4a',
+#             remove_temp=True,
+#             verbose=False,
+#             logger=None
+#         )
+        
+#         # Clean up
+#         for clip in video_clips:
+#             clip.close()
+#         final_video.close()
+        
+#         logger.info(f"Video created successfully: {output_path}")
+#         return output_path
+        
+#     except Exception as e:
+#         logger.error(f"Failed to create video: {e}")
+#         return None
+
+# === STATIC SLIDE ENCODING ===
+
+ENCODING_PROFILES = {
+    # Original MoviePy path: every second carries VIDEO_CONFIG["fps"] frames
+    "constant": {"vfr": False},
+    # Variable frame rate: one frame per static slide, full rate only during transitions
+    "static": {
+        "vfr": True,
+        "x264_tune": "stillimage",
+    },
+}
+
+def get_render_settings(quality=None, profile=None):
+    """Merge VIDEO_CONFIG with an encoding profile and a render quality profile."""
+    quality = quality or VIDEO_CONFIG["quality"]
+    profile = profile or VIDEO_CONFIG["encoding_profile"]
+    if quality not in RENDER_PROFILES:
+        logger.warning(f"Unknown render quality '{quality}', using final")
+        quality = "final"
+    settings = dict(VIDEO_CONFIG)
+    settings.update(ENCODING_PROFILES.get(profile, ENCODING_PROFILES["constant"]))
+    settings.update(RENDER_PROFILES[quality])
+    settings["quality"] = quality
+    settings["encoding_profile"] = profile
+    return settings
+
+def _concat_entry(path, duration=None):
+    escaped = os.path.abspath(path).replace("\\", "/").replace("'", "'\\''")
+    entry = f"file '{escaped}'\n"
+    if duration is not None:
+        entry += f"duration {duration:.6f}\n"
+    return entry
+
+def load_slide_frame(image, width=None, height=None):
+    """Load a slide image as an RGB uint8 array fitted and padded to the output size.
+
+    image is a file path or an already decoded PIL image (e.g. a rendered PDF page).
+    """
+    width = width or VIDEO_CONFIG["width"]
+    height = height or VIDEO_CONFIG["height"]
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as img:
+            return load_slide_frame(img, width, height)
+
+    img = image.convert("RGB") if image.mode != "RGB" else image
+    scale = min(width / img.width, height / img.height)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if size == (width, height):
+        return np.asarray(img if size == img.size else img.resize(size, Image.Resampling.LANCZOS), dtype=np.uint8)
+    if size != img.size:
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    canvas = Image.new("RGB", (width, height), VIDEO_CONFIG["background_color"])
+    canvas.paste(img, ((width - size[0]) // 2, (height - size[1]) // 2))
+    return np.asarray(canvas, dtype=np.uint8)
+
+def transition_frames(prev_frame, next_frame, count, style="crossfade"):
+    """Yield the frames of a transition into next_frame as vectorized integer blends.
+
+    style is "crossfade" (from prev_frame) or "fade_black" (from black). The
+    difference image is computed once; each frame is a single multiply-add.
+    """
+    if style == "fade_black" or prev_frame is None:
+        base = np.zeros(next_frame.shape, dtype=np.int32)
+    else:
+        base = prev_frame.astype(np.int32)
+    diff = next_frame.astype(np.int32) - base
+    for k in range(count):
+        weight = (256 * k) // count
+        yield (base + ((diff * weight) >> 8)).astype(np.uint8)
+
+def _x264_args(settings):
+    # Identical settings for every segment so they can be joined with stream copy.
+    # A still segment is a single (key)frame already; the interval bounds seek
+    # distance inside transitions, reveal steps and constant-rate segments.
+    interval = settings["keyframe_interval"]
+    return [
+        "-c:v", "libx264", "-preset", settings["x264_preset"], "-tune", settings["x264_tune"],
+        "-crf", str(settings["crf"]), "-pix_fmt", "yuv420p",
+        "-g", str(max(1, round(settings["fps"] * interval))),
+        "-force_key_frames", f"expr:gte(t,n_forced*{interval})",
+        "-video_track_timescale", "90000",
+    ]
+
+def rendition_path(path, name):
+    base, ext = os.path.splitext(path)
+    return f"{base}_{name}{ext}"
+
+def _encode_raw_frames(frames, output_path, settings, framerate):
+    """Pipe RGB frames to ffmpeg as rawvideo and encode them into an H.264 segment.
+
+    With settings["renditions"], the frames are split inside the same ffmpeg
+    process and each rendition is scaled and written to rendition_path(output_path, name).
+    """
+    height, width = settings["height"], settings["width"]
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-framerate", framerate,
+        "-i", "-",
+    ]
+    renditions = settings.get("renditions")
+    if renditions:
+        split = f"[0:v]split={len(renditions)}" + "".join(f"[s{i}]" for i in range(len(renditions)))
+        scales = [f"[s{i}]scale={r['width']}:{r['height']}:flags=lanczos[v{i}]" for i, r in enumerate(renditions)]
+        cmd += ["-filter_complex", ";".join([split, *scales])]
+        for i, rendition in enumerate(renditions):
+            cmd += ["-map", f"[v{i}]", *_x264_args(dict(settings, **rendition)), "-an",
+                    rendition_path(output_path, rendition["name"])]
+    else:
+        cmd += [*_x264_args(settings), "-an", output_path]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for frame in frames:
+            proc.stdin.write(frame.tobytes())
+    finally:
+        proc.stdin.close()
+    stderr = proc.stderr.read().decode(errors="replace")
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg segment encode failed: {stderr}")
+    return output_path
+
+def encode_still_segment(frame, duration, output_path, settings):
+    """Encode a static slide as a single frame that lasts exactly duration seconds (at least one frame time)."""
+    duration = max(duration, 1 / settings["fps"])  # zero-length slides (empty narration) still show one frame
+    framerate = Fraction(1 / duration).limit_denominator(1000000)
+    return _encode_raw_frames([frame], output_path, settings, f"{framerate.numerator}/{framerate.denominator}")
+
+def encode_transition_segment(prev_frame, next_frame, count, output_path, settings, style="crossfade"):
+    """Encode only the frames inside a transition window, at the render frame rate."""
+    frames = transition_frames(prev_frame, next_frame, count, style)
+    return _encode_raw_frames(frames, output_path, settings, str(settings["fps"]))
+
+def slide_segment_jobs(index, prev_frame, frame, duration, work_dir, settings):
+    """Encode jobs for one slide: an optional transition into it, then the still remainder.
+
+    Returns (func, args, estimated_mb, segment_path) tuples in playback order.
+    """
+    fps = settings["fps"]
+    style = settings["transition_style"]
+    still_mb = frame_mb(settings["width"], settings["height"])
+    jobs = []
+    remaining = duration
+    if prev_frame is not None and style != "none":
+        count = min(int(round(settings["transition_duration"] * fps)), int(remaining * fps) - 1)
+        if count > 0:
+            # A transition holds two frames plus int32 working copies while it is blended
+            segment = os.path.join(work_dir, f"slide_{index+1:03d}_transition.mp4")
+            jobs.append((encode_transition_segment, (prev_frame, frame, count, segment, settings, style),
+                         still_mb * 10, segment))
+            remaining -= count / fps
+
+    segment = os.path.join(work_dir, f"slide_{index+1:03d}_still.mp4")
+    jobs.append((encode_still_segment, (frame, remaining, segment, settings), still_mb, segment))
+    return jobs
+
+def _run_reserved(func, args, mb):
+    with memory_governor.reserve(mb):
+        return func(*args)
+
+def encode_slide_segments(image_files, timeline, work_dir, settings, reveals=None):
+    """Encode every slide's transition and still segments in parallel; returns segment paths in order.
+
+    Slides in reveals (see plan_bullet_reveals) fade their bullets in one by one.
+    """
+    slide_mb = frame_mb(settings["width"], settings["height"]) * 11 * max(1, len(settings.get("renditions") or ()))
+    max_workers = max(1, (os.cpu_count() or 2) // 2)
+    segments = []
+    pending = set()
+    prev_frame = None
+    for i, (image_path, entry) in enumerate(zip(image_files, timeline)):
+        if isinstance(image_path, str) and not os.path.exists(image_path):
+            logger.warning(f"Missing image for slide {i+1}")
+            continue
+
+        # Bound the frames queued for encoding, not just the running encoders
+        window = memory_governor.workers(slide_mb, max_workers * 2)
+        while len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+
+        frame = load_slide_frame(image_path, settings["width"], settings["height"])
+        if reveals and i in reveals:
+            jobs = reveal_segment_jobs(i, prev_frame, frame, reveals[i], entry["duration"], work_dir, settings)
+        else:
+            jobs = slide_segment_jobs(i, prev_frame, frame, entry["duration"], work_dir, settings)
+        for func, args, mb, segment in jobs:
+            pending.add(scheduler.submit("cpu", _run_reserved, func, args, mb))
+            segments.append(segment)
+        prev_frame = frame
+
+    if not segments:
+        raise Exception("No valid slide images")
+
+    logger.info(f"Waiting for {len(segments)} segments of the static VFR profile...")
+    for future in pending:
+        future.result()
+    return segments
+
+def join_segments(segments, audio_path, output_path, audio_args):
+    """Join encoded video segments by stream copy and mux in an audio track."""
+    list_path = os.path.splitext(output_path)[0] + "_segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("".join(_concat_entry(segment) for segment in segments))
+
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy", *audio_args,
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        logger.error(f"ffmpeg segment join failed: {result.stderr}")
+        return None
+    return output_path
+
+def encode_static_slides_vfr(image_files, narration_track, output_path, settings=None, reveals=None):
+    """Encode slides as a variable-frame-rate H.264 video with ffmpeg.
+
+    Each slide is split into a transition segment (the first transition_duration
+    seconds, blended with NumPy and encoded at the render frame rate) and a still segment holding one frame for the rest
+    of its timeline entry. Segments are encoded in parallel and joined by stream
+    copy, then the narration track is muxed in. settings come from get_render_settings.
+
+    image_files may also yield decoded PIL pages (see iter_presentation_frames);
+    they are consumed lazily and piped to ffmpeg as raw RGB frames. reveals
+    animates bullet slides (see plan_bullet_reveals).
+    """
+    settings = settings or get_render_settings(profile="static")
+    work_dir = tempfile.mkdtemp(prefix="vfr_")
+    try:
+        segments = encode_slide_segments(image_files, narration_track["timeline"], work_dir, settings, reveals)
+        return join_segments(segments, narration_track["path"], output_path,
+                             ["-c:a", "aac", "-b:a", settings["audio_bitrate"]])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+RENDITION_LADDER = {
+    "1080p": {"width": 1920, "height": 1080, "crf": 20},
+    "720p": {"width": 1280, "height": 720, "crf": 22},
+    "480p": {"width": 854, "height": 480, "crf": 24},
+}
+
+def encode_rendition_ladder(image_files, narration_track, output_path, settings=None, ladder=None, reveals=None):
+    """Encode several scaled renditions of the slides in a single pass.
+
+    Each slide is decoded and fitted once at the largest rendition's size; every
+    segment encoder splits and scales those frames into all renditions (see
+    _encode_raw_frames). The narration is encoded to AAC once and stream-copied
+    into each output. ladder lists RENDITION_LADDER names (default: all of them).
+    Returns {name: path} with paths from rendition_path(output_path, name).
+    """
+    settings = settings or get_render_settings(profile="static")
+    renditions = [dict(RENDITION_LADDER[name], name=name) for name in (ladder or RENDITION_LADDER)]
+    renditions.sort(key=lambda r: r["width"] * r["height"], reverse=True)
+    top = renditions[0]
+    settings = dict(settings, width=top["width"], height=top["height"], renditions=renditions)
+    work_dir = tempfile.mkdtemp(prefix="ladder_")
+
+    try:
+        audio_path = os.path.join(work_dir, "narration.m4a")
+        result = subprocess.run([
+            "ffmpeg", "-y", "-v", "error", "-i", narration_track["path"],
+            "-c:a", "aac", "-b:a", settings["audio_bitrate"], audio_path,
+        ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg audio encode failed: {result.stderr}")
+
+        segments = encode_slide_segments(image_files, narration_track["timeline"], work_dir, settings, reveals)
+        joined = scheduler.map("cpu", lambda r: join_segments([rendition_path(segment, r["name"]) for segment in segments],
+                                                              audio_path, rendition_path(output_path, r["name"]),
+                                                              ["-c:a", "copy"]), renditions)
+        outputs = {r["name"]: path for r, path in zip(renditions, joined)}
+        if not all(outputs.values()):
+            return None
+        return outputs
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# === BULLET REVEAL ===
+
+REVEAL_CONFIG = {
+    "fade_duration": 0.4,  # seconds per bullet fade-in
+    "lead_in": 1.0,  # earliest reveal, in seconds after the slide starts
+    "diff_threshold": 12,  # per-channel difference that puts a pixel into a bullet layer
+    "mask_dilation": 2,  # pixels; keeps anti-aliased glyph edges inside the layer
+}
+BULLET_SHAPE_NAME = "Bullets"  # set by add_enhanced_text_and_image_slide
+
+def bullet_groups(shape):
+    """Group the paragraphs of a bullet text box per bullet (the point plus its description)."""
+    groups = []
+    for paragraph in shape.text_frame.paragraphs:
+        if not paragraph.text.strip():
+            continue
+        if paragraph.level == 0 or not groups:
+            groups.append([paragraph])
+        else:
+            groups[-1].append(paragraph)
+    return groups
+
+def slide_bullet_groups(slide):
+    for shape in slide.shapes:
+        if shape.name == BULLET_SHAPE_NAME and shape.has_text_frame:
+            return bullet_groups(shape)
+    return []
+
+def reveal_bullets(ppt_path):
+    """{slide index: [bullet text, ...]} for every slide with a bullet text box."""
+    bullets = {}
+    for index, slide in enumerate(Presentation(ppt_path).slides):
+        groups = slide_bullet_groups(slide)
+        if groups:
+            bullets[index] = [" ".join(p.text for p in group) for group in groups]
+    return bullets
+
+def write_reveal_decks(ppt_path, output_dir):
+    """Write one deck per reveal step k holding the bullet slides that show only their first k bullets.
+
+    Later bullets are painted in the background colour instead of being removed,
+    so text fitting and layout are identical to the full slide. Returns
+    (deck_path, slide indexes) pairs, one per step.
+    """
+    counts = {index: len(texts) for index, texts in reveal_bullets(ppt_path).items()}
+    os.makedirs(output_dir, exist_ok=True)
+    decks = []
+    for step in range(max(counts.values(), default=0)):
+        prs = Presentation(ppt_path)
+        keep = [index for index, count in counts.items() if count > step]
+        slide_ids = prs.slides._sldIdLst
+        for index, (slide, slide_id) in enumerate(zip(list(prs.slides), list(slide_ids))):
+            if index not in keep:
+                prs.part.drop_rel(slide_id.rId)
+                slide_ids.remove(slide_id)
+                continue
+            for group in slide_bullet_groups(slide)[step:]:
+                for paragraph in group:
+                    paragraph.font.color.rgb = MCKINSEY_COLORS["background"]
+                    for run in paragraph.runs:
+                        run.font.color.rgb = MCKINSEY_COLORS["background"]
+        deck_path = os.path.join(output_dir, f"reveal_step{step}.pptx")
+        prs.save(deck_path)
+        decks.append((deck_path, keep))
+    return decks
+
+def rasterize_reveal_states(ppt_path, output_dir, dpi=None):
+    """Render the partial states of every bullet slide.
+
+    Returns [[slide index, [state_0.png, ...]], ...] where state k shows the first
+    k bullets; the full slide is the regular rendering.
+    """
+    states = {}
+    for step, (deck_path, indexes) in enumerate(write_reveal_decks(ppt_path, output_dir)):
+        files = convert_ppt_to_images(deck_path, os.path.join(output_dir, f"step{step}"), dpi=dpi)
+        if len(files) != len(indexes):
+            logger.warning(f"Reveal step {step} rendered {len(files)} of {len(indexes)} slides")
+            continue
+        for index, path in zip(indexes, files):
+            states.setdefault(index, []).append(path)
+    return [[index, paths] for index, paths in sorted(states.items())]
+
+def _content_words(text):
+    return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 3}
+
+def sentence_starts(text, duration, lang='en', engine=None):
+    """Split narration into sentences and estimate when each starts, in seconds.
+
+    Exact when every sentence is in the TTS sentence cache; otherwise the
+    duration is shared out by sentence length.
+    """
+    sentences = split_sentences(text)
+    lengths = None
+    if TTS_CONFIG["sentence_cache"] and sentences:
+        backend = get_tts_backend(engine)
+        paths = [sentence_cache_path(backend, sentence, lang) for sentence in sentences]
+        if all(os.path.exists(path) for path in paths):
+            lengths = [get_audio_duration(path) + TTS_CONFIG["sentence_gap"] for path in paths]
+    if lengths is None:
+        total = sum(len(sentence) for sentence in sentences) or 1
+        lengths = [duration * len(sentence) / total for sentence in sentences]
+
+    starts, offset = [], 0.0
+    for length in lengths:
+        starts.append(offset)
+        offset += length
+    return sentences, starts
+
+def bullet_reveal_times(bullets, narration, duration, lang='en', engine=None):
+    """Time each bullet to the first narration sentence that talks about it.
+
+    Sentences are matched in order by shared content words. Bullets the narration
+    never mentions are spaced evenly between their matched neighbours.
+    """
+    sentences, starts = sentence_starts(narration, duration, lang, engine)
+    lead_in = min(REVEAL_CONFIG["lead_in"], duration / 4)
+    times = []
+    position = 0
+    for bullet in bullets:
+        words = _content_words(bullet)
+        scores = [len(words & _content_words(sentence)) for sentence in sentences[position:]]
+        if scores and max(scores) > 0:
+            position += scores.index(max(scores))
+            times.append(max(starts[position], lead_in))
+        else:
+            times.append(None)
+
+    anchors = [(-1, lead_in)] + [(k, t) for k, t in enumerate(times) if t is not None] + [(len(times), duration * 0.9)]
+    for (i, start), (j, end) in zip(anchors, anchors[1:]):
+        for k in range(i + 1, j):
+            times[k] = start + (end - start) * (k - i) / (j - i)
+    return times
+
+def plan_bullet_reveals(ppt_path, states, narration_data, narration_track, lang='en', engine=None):
+    """Pair rendered reveal states with narration timing.
+
+    Returns {slide index: {"states": [...], "times": [seconds from slide start]}}
+    for encode_slide_segments.
+    """
+    bullets = reveal_bullets(ppt_path)
+    narrations = [narration_data["title_narration"], *narration_data["slide_narrations"]]
+    timeline = narration_track["timeline"]
+    reveals = {}
+    for index, files in states:
+        if index >= min(len(timeline), len(narrations)) or len(files) != len(bullets.get(index, ())):
+            continue
+        speech = timeline[index]["duration"] - (AUDIO_CONFIG["slide_padding"] if index < len(timeline) - 1 else 0)
+        reveals[index] = {
+            "states": files,
+            "times": bullet_reveal_times(bullets[index], narrations[index], speech, lang, engine),
+        }
+    logger.info(f"Bullet reveal on {len(reveals)} slides")
+    return reveals
+
+def build_reveal_layers(state_frames, full_frame):
+    """Split a slide into its base frame and one layer per bullet.
+
+    A layer is (box, mask, pixels) cropped to the pixels that bullet changes, or
+    None if it changes nothing visible.
+    """
+    radius = REVEAL_CONFIG["mask_dilation"]
+    kernel = np.ones((2 * radius + 1, 2 * radius + 1), np.uint8)
+    layers = []
+    for before, after in zip(state_frames, [*state_frames[1:], full_frame]):
+        changed = np.abs(after.astype(np.int16) - before).max(axis=2) > REVEAL_CONFIG["diff_threshold"]
+        mask = cv2.dilate(changed.astype(np.uint8), kernel) if radius else changed.astype(np.uint8)
+        ys, xs = np.nonzero(mask)
+        if not len(ys):
+            layers.append(None)
+            continue
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        layers.append(((y0, y1, x0, x1), mask[y0:y1, x0:x1, None].astype(np.int32), after[y0:y1, x0:x1].copy()))
+    return state_frames[0], layers
+
+def apply_layer(frame, layer):
+    (y0, y1, x0, x1), mask, pixels = layer
+    out = frame.copy()
+    out[y0:y1, x0:x1] = np.where(mask.astype(bool), pixels, out[y0:y1, x0:x1])
+    return out
+
+def reveal_frames(frame, layer, count):
+    """Yield the frames of one bullet fading in over frame.
+
+    Only the layer's box is blended (integer alpha, as in transition_frames);
+    the same output array is updated in place and yielded each time.
+    """
+    (y0, y1, x0, x1), mask, pixels = layer
+    region = frame[y0:y1, x0:x1].astype(np.int32)
+    diff = (pixels.astype(np.int32) - region) * mask
+    out = frame.copy()
+    for k in range(count):
+        weight = (256 * k) // count
+        out[y0:y1, x0:x1] = region + ((diff * weight) >> 8)
+        yield out
+
+def encode_reveal_segment(frame, layer, count, output_path, settings):
+    return _encode_raw_frames(reveal_frames(frame, layer, count), output_path, settings, str(settings["fps"]))
+
+def reveal_segment_jobs(index, prev_frame, frame, reveal, duration, work_dir, settings):
+    """Encode jobs for a bullet slide: the transition into its base, then a fade and a still per bullet.
+
+    Falls back to slide_segment_jobs for the full slide when the slide is too
+    short to fit every fade.
+    """
+    fps = settings["fps"]
+    fade_count = max(1, int(round(REVEAL_CONFIG["fade_duration"] * fps)))
+    fade = fade_count / fps
+    starts, earliest = [], 1 / fps
+    for t in reveal["times"]:
+        start = max(round(t * fps) / fps, earliest)
+        starts.append(start)
+        earliest = start + fade + 1 / fps
+    if not starts or earliest > duration:
+        return slide_segment_jobs(index, prev_frame, frame, duration, work_dir, settings)
+
+    state_frames = [load_slide_frame(path, settings["width"], settings["height"]) for path in reveal["states"]]
+    base, layers = build_reveal_layers(state_frames, frame)
+    still_mb = frame_mb(settings["width"], settings["height"])
+
+    jobs = slide_segment_jobs(index, prev_frame, base, starts[0], work_dir, settings)
+    current = base
+    for k, (start, layer) in enumerate(zip(starts, layers)):
+        end = starts[k + 1] if k + 1 < len(starts) else duration
+        prefix = os.path.join(work_dir, f"slide_{index+1:03d}_bullet{k+1:02d}")
+        if layer is not None:
+            jobs.append((encode_reveal_segment, (current, layer, fade_count, prefix + "_fade.mp4", settings),
+                         still_mb * 4, prefix + "_fade.mp4"))
+            current = apply_layer(current, layer)
+        else:
+            start -= fade  # nothing to fade in; the still takes the whole span
+        jobs.append((encode_still_segment, (current, end - start - fade, prefix + "_still.mp4", settings),
+                     still_mb, prefix + "_still.mp4"))
+    return jobs
+
+# === SEGMENTED STREAMING OUTPUT ===
+
+HLS_CONFIG = {
+    "playlist": "index.m3u8",
+    "segment_name": "slide_{:03d}_{:02d}.ts",  # slide number, part of the slide
+    "segment_seconds": float(os.getenv("HLS_SEGMENT_SECONDS", "6")),  # longer slides are split into several segments
+    "dash": os.getenv("VIDEO_DASH", "0") == "1",  # also write a DASH manifest once all slides are done
+    "dash_manifest": "manifest.mpd",
+}
+
+AAC_FRAME_SAMPLES = 1024
+
+def write_hls_playlist(path, entries, target_duration, finished=False):
+    """Atomically rewrite an HLS event playlist; entries are (segment_name, duration) pairs.
+
+    Segments are muxed independently, so each one after the first is marked as a discontinuity.
+    """
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{int(np.ceil(target_duration))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+    ]
+    for i, (name, duration) in enumerate(entries):
+        if i:
+            lines.append("#EXT-X-DISCONTINUITY")
+        lines += [f"#EXTINF:{duration:.6f},", name]
+    if finished:
+        lines.append("#EXT-X-ENDLIST")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+def hls_segment_durations(duration, max_seconds=None):
+    """Split a slide's duration into equal segments no longer than max_seconds."""
+    max_seconds = max_seconds or HLS_CONFIG["segment_seconds"]
+    count = max(1, int(np.ceil(duration / max_seconds - 1e-9)))
+    return [duration / count] * count
+
+def encode_narration_aac(narration_track, output_path, settings):
+    """Encode the whole narration once as raw AAC (ADTS), so all segments share one continuous audio stream."""
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-i", narration_track["path"],
+        "-c:a", "aac", "-b:a", settings["audio_bitrate"], "-f", "adts", output_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg narration encode failed: {result.stderr}")
+    return output_path
+
+def read_adts_frames(path):
+    """Split an ADTS file into its AAC frames of AAC_FRAME_SAMPLES samples each.
+
+    The encoder's priming frame is dropped, so frame i starts at input sample i * AAC_FRAME_SAMPLES.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    frames = []
+    pos = 0
+    while pos + 7 <= len(data):
+        length = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if data[pos] != 0xFF or data[pos + 1] & 0xF0 != 0xF0 or length < 7:
+            raise ValueError(f"Invalid ADTS frame at byte {pos}")
+        frames.append(data[pos:pos + length])
+        pos += length
+    return frames[1:]
+
+def write_audio_slice(frames, sample_rate, start, duration, output_path):
+    """Write the AAC frames covering [start, start + duration) seconds of the narration.
+
+    Boundaries are rounded to whole frames the same way for every slice, so consecutive
+    slices neither overlap nor leave gaps.
+    """
+    first = int(round(start * sample_rate / AAC_FRAME_SAMPLES))
+    last = int(round((start + duration) * sample_rate / AAC_FRAME_SAMPLES))
+    with open(output_path, "wb") as f:
+        f.write(b"".join(frames[first:last]))
+    return output_path
+
+def mux_hls_segment(video_parts, audio_path, offset, output_path):
+    """Join one segment's video parts with its slice of the encoded narration into an MPEG-TS segment.
+
+    Both streams are copied; offset is the segment's start time in the stream, so
+    segment timestamps are continuous.
+    """
+    list_path = os.path.splitext(output_path)[0] + ".txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("".join(_concat_entry(part) for part in video_parts))
+    has_audio = os.path.getsize(audio_path) > 0  # a segment shorter than one AAC frame has none
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        *(["-f", "aac", "-i", audio_path] if has_audio else []),
+        "-map", "0:v", *(["-map", "1:a"] if has_audio else []), "-c", "copy",
+        "-output_ts_offset", f"{offset:.6f}", "-muxdelay", "0",
+        "-f", "mpegts", output_path,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg HLS segment mux failed: {result.stderr}")
+    return output_path
+
+def write_dash_manifest(output_dir, segment_names, settings):
+    """Remux the finished HLS segments into a DASH presentation by stream copy."""
+    list_path = os.path.join(output_dir, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("".join(_concat_entry(os.path.join(output_dir, name)) for name in segment_names))
+    dash_dir = os.path.join(output_dir, "dash")
+    os.makedirs(dash_dir, exist_ok=True)
+    manifest = os.path.join(dash_dir, HLS_CONFIG["dash_manifest"])
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+        "-map", "0:v", "-map", "0:a", "-c", "copy", "-f", "dash", manifest,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg DASH remux failed: {result.stderr}")
+    return manifest
+
+def encode_slides_hls(image_files, narration_track, output_dir, settings=None, dash=None):
+    """Encode slides as an HLS stream, published slide by slide as they finish.
+
+    Slides are encoded in parallel like encode_static_slides_vfr. Each slide is
+    cut into segments of at most HLS_CONFIG["segment_seconds"] and each segment
+    is muxed into its own MPEG-TS file with its slice of the narration, which is
+    encoded to AAC once up front so the audio stays continuous across segments.
+    The playlist is rewritten as soon as the next segment in order is ready, so
+    playback can start while later slides are still rendering. With dash, a DASH
+    manifest is added once the stream is complete. Returns the playlist path.
+    """
+    settings = settings or get_render_settings(profile="static")
+    dash = HLS_CONFIG["dash"] if dash is None else dash
+    os.makedirs(output_dir, exist_ok=True)
+    playlist = os.path.join(output_dir, HLS_CONFIG["playlist"])
+    target_duration = max((max(hls_segment_durations(entry["duration"])) for entry in narration_track["timeline"]),
+                          default=1)
+    work_dir = tempfile.mkdtemp(prefix="hls_")
+    still_mb = frame_mb(settings["width"], settings["height"])
+    slide_mb = still_mb * 11
+    max_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    published = []
+    queued = deque()  # (mux future, segment name, duration) in slide order
+
+    def publish(block=False):
+        while queued and (block or queued[0][0].done()):
+            future, name, duration = queued.popleft()
+            future.result()
+            published.append((name, duration))
+            write_hls_playlist(playlist, published, target_duration)
+            logger.info(f"Published HLS segment {name} ({duration:.2f}s)")
+
+    def finish_slide(parts, *args):
+        for part in parts:
+            part.result()
+        return mux_hls_segment(*args)
+
+    write_hls_playlist(playlist, [], target_duration)
+    try:
+        sample_rate = narration_track["sample_rate"]
+        audio_frames = read_adts_frames(encode_narration_aac(narration_track, os.path.join(work_dir, "narration.aac"),
+                                                             settings))
+        offset = 0.0
+        prev_frame = None
+        # Mux tasks wait on the cpu pool's encodes, so they queue on the io pool
+        with scheduler.lend_slot("io"):
+            for i, (image_path, entry) in enumerate(zip(image_files, narration_track["timeline"])):
+                if isinstance(image_path, str) and not os.path.exists(image_path):
+                    logger.warning(f"Missing image for slide {i+1}")
+                    continue
+                if entry["duration"] <= 0:
+                    logger.warning(f"Skipping zero-length slide {i+1}")
+                    continue
+
+                frame = load_slide_frame(image_path, settings["width"], settings["height"])
+                start = entry["start"] / sample_rate
+                for j, duration in enumerate(hls_segment_durations(entry["duration"])):
+                    window = memory_governor.workers(slide_mb, max_workers * 2)
+                    while len(queued) >= window:
+                        wait([queued[0][0]])
+                        publish()
+
+                    if j == 0:
+                        jobs = slide_segment_jobs(i, prev_frame, frame, duration, work_dir, settings)
+                    else:
+                        segment = os.path.join(work_dir, f"slide_{i+1:03d}_still_{j:02d}.mp4")
+                        jobs = [(encode_still_segment, (frame, duration, segment, settings), still_mb, segment)]
+                    parts = [scheduler.submit("cpu", _run_reserved, func, args, mb) for func, args, mb, _ in jobs]
+                    audio = write_audio_slice(audio_frames, sample_rate, start, duration,
+                                              os.path.join(work_dir, f"slide_{i+1:03d}_{j:02d}.aac"))
+                    name = HLS_CONFIG["segment_name"].format(i + 1, j + 1)
+                    queued.append((scheduler.submit("io", finish_slide, parts, [segment for *_, segment in jobs], audio,
+                                                    offset, os.path.join(output_dir, name), inline=False),
+                                   name, duration))
+                    start += duration
+                    offset += duration
+                    publish()
+                prev_frame = frame
+
+            publish(block=True)
+
+        if not published:
+            raise Exception("No valid slide images")
+        write_hls_playlist(playlist, published, target_duration, finished=True)
+        if dash:
+            write_dash_manifest(output_dir, [name for name, _ in published], settings)
+        return playlist
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+class SlideFrameSource:
+    """make_frame callable for MoviePy that decodes slide frames on demand.
+
+    Only the last MEMORY_CONFIG["frame_cache"] decoded frames are kept, instead of
+    one ImageClip array per slide, so memory does not grow with deck length.
+    """
+
+    def __init__(self, image_files, timeline, settings, cache_size=None):
+        self.settings = settings
+        self.cache_size = cache_size or MEMORY_CONFIG["frame_cache"]
+        self.cache = {}
+        self.slides = []
+        self.starts = []
+        offset = 0.0
+        for i, (image_path, entry) in enumerate(zip(image_files, timeline)):
+            if not os.path.exists(image_path):
+                logger.warning(f"Missing image for slide {i+1}")
+                continue
+            logger.info(f"Slide {i+1}: {entry['duration']:.3f}s duration")
+            self.slides.append(image_path)
+            self.starts.append(offset)
+            offset += entry["duration"]
+        self.duration = offset
+
+    def frame(self, index):
+        if index not in self.cache:
+            if len(self.cache) >= self.cache_size:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[index] = load_slide_frame(self.slides[index], self.settings["width"], self.settings["height"])
+        return self.cache[index]
+
+    def __call__(self, t):
+        index = max(0, bisect.bisect_right(self.starts, t) - 1)
+        frame = self.frame(index)
+        elapsed = t - self.starts[index]
+        transition = self.settings["transition_duration"]
+        style = self.settings["transition_style"]
+        if index == 0 or style == "none" or elapsed >= transition:
+            return frame
+        base = np.zeros_like(frame) if style == "fade_black" else self.frame(index - 1)
+        weight = int(256 * elapsed / transition)
+        return (base.astype(np.int32) + (((frame.astype(np.int32) - base) * weight) >> 8)).astype(np.uint8)
+
+def create_video_from_slides_and_audio(image_files, narration_track, output_path, profile=None, quality=None,
+                                       reveals=None):
+    """Create video from slide images and a single assembled narration track.
+
+    narration_track is the dict returned by assemble_narration_track; each slide is
+    shown for exactly the length of its timeline entry. profile names an entry of
+    ENCODING_PROFILES and quality an entry of RENDER_PROFILES (both default to
+    VIDEO_CONFIG). reveals (bullet animation) needs the static profile.
+    """
+    logger.info("Creating video from slides and audio...")
+
+    settings = get_render_settings(quality, profile)
+    if settings["vfr"]:
+        if shutil.which("ffmpeg"):
+            try:
+                video_path = encode_static_slides_vfr(image_files, narration_track, output_path, settings, reveals)
+                if video_path:
+                    logger.info(f"Video created successfully: {output_path}")
+                    return video_path
+            except Exception as e:
+                logger.error(f"Static slide encoding failed: {e}")
+            logger.warning("Falling back to constant frame rate encoding")
+        else:
+            logger.warning("ffmpeg not found, using constant frame rate encoding")
+
+    try:
+        import moviepy.editor as mp_editor
+        
+        frames = SlideFrameSource(image_files, narration_track["timeline"], settings)
+        if not frames.slides:
+            raise Exception("No valid video clips created")
+        
+        # One lazily rendered clip for the whole deck and the single narration track
+        logger.info("Building video clip...")
+        final_video = mp_editor.VideoClip(frames, duration=frames.duration)
+        audio_clip = mp_editor.AudioFileClip(narration_track["path"])
+        final_video = final_video.set_audio(audio_clip)
+        
+        # Write the video file
+        logger.info(f"Writing video to {output_path}...")
+        final_video.write_videofile(
+            output_path,
+            fps=settings["fps"],
+            codec='libx264',
+            audio_codec='aac',
+            audio_bitrate=settings["audio_bitrate"],
+            preset=settings["x264_preset"],
+            ffmpeg_params=["-crf", str(settings["crf"]), "-pix_fmt", "yuv420p"],
+            temp_audiofile='temp-audio.m4a',
+            remove_temp=True,
+            verbose=False,
+            logger=None
+        )
+        
+        # Clean up
+        audio_clip.close()
+        final_video.close()
+        
+        logger.info(f"Video created successfully: {output_path}")
+        return output_path
+        
+    except ImportError:
+        logger.error("MoviePy not properly installed. Please install with: pip install moviepy")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to create video: {e}")
+        return None
+
+def create_video_from_presentation(ppt_path, narration_track, output_path, profile=None, quality=None, image_dir=None,
+                                   reveals=None):
+    """Render a deck straight into a video, without intermediate slide images.
+
+    With the static (VFR) profile, rendered pages are piped to the encoder as raw
+    frames; image_dir additionally keeps a PNG per slide. Other profiles (or a
+    missing ffmpeg) rasterize to PNGs and use create_video_from_slides_and_audio.
+    """
+    settings = get_render_settings(quality, profile)
+    if settings["vfr"] and shutil.which("ffmpeg"):
+        try:
+            frames = iter_presentation_frames(ppt_path, dpi=settings["dpi"], image_dir=image_dir)
+            video_path = encode_static_slides_vfr(frames, narration_track, output_path, settings, reveals)
+            if video_path:
+                logger.info(f"Video created successfully: {output_path}")
+                return video_path
+        except Exception as e:
+            logger.error(f"Direct frame encoding failed: {e}")
+
+    temp_dir = None if image_dir else tempfile.mkdtemp(prefix="slides_")
+    try:
+        image_files = convert_ppt_to_images(ppt_path, image_dir or temp_dir, dpi=settings["dpi"])
+        if not image_files:
+            return None
+        return create_video_from_slides_and_audio(image_files, narration_track, output_path,
+                                                  profile="constant", quality=quality)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+# === JOB WORKSPACE ===
+
+JOB_WORKSPACE_CONFIG = {
+    "root": os.getenv("JOB_WORKSPACE_DIR", ".jobs"),
+    "max_age_hours": 72,  # finished (or abandoned) workspaces older than this are removed
+    "max_total_mb": 5000,  # oldest finished workspaces are removed above this quota
+}
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JobWorkspace:
+    """Persistent per-job directory with a manifest of completed stages.
+
+    Each stage records its JSON result, the checksums of the files it
+    produced, and the digests of the upstream stages it was built from. On a
+    retry a stage is skipped only if all its artifacts still match their
+    checksums, none of its upstream stages has been re-run with a different
+    outcome since, and any external inputs (e.g. the source pptx) still have
+    the digests recorded with it.
+    """
+
+    def __init__(self, job_id, root=None):
+        self.job_id = job_id
+        self.path = os.path.abspath(os.path.join(root or JOB_WORKSPACE_CONFIG["root"], job_id))
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._lock = threading.Lock()  # stages may complete from several threads
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            now = time.time()
+            return {"job_id": self.job_id, "created": now, "updated": now, "status": "running", "stages": {}}
+
+    def _write_manifest(self):
+        with self._lock:
+            self.manifest["updated"] = time.time()
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+    def subdir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def stage_digest(self, name):
+        """Digest of a completed stage's result and artifacts, or None if it has not run."""
+        stage = self.manifest["stages"].get(name)
+        return stage.get("digest") if stage else None
+
+    def stage_result(self, name, after=(), inputs=None):
+        """Return the stored result of a completed stage, or None if it must be (re)run."""
+        stage = self.manifest["stages"].get(name)
+        if not stage:
+            return None
+        for upstream in after:
+            if stage.get("inputs", {}).get(upstream) != self.stage_digest(upstream):
+                logger.warning(f"Checkpoint '{name}' is stale (stage '{upstream}' changed), re-running")
+                return None
+        for key, digest in (inputs or {}).items():
+            if stage.get("external", {}).get(key) != digest:
+                logger.warning(f"Checkpoint '{name}' is stale (input '{key}' changed), re-running")
+                return None
+        for artifact, checksum in stage["artifacts"].items():
+            path = os.path.join(self.path, artifact)
+            if not os.path.exists(path) or file_checksum(path) != checksum:
+                logger.warning(f"Checkpoint '{name}' is stale ({artifact} changed), re-running")
+                return None
+        return stage["result"]
+
+    def complete_stage(self, name, result, artifacts=(), after=(), inputs=None):
+        checksums = {os.path.relpath(path, self.path): file_checksum(path) for path in artifacts}
+        payload = json.dumps([result, checksums], sort_keys=True, default=str).encode("utf-8")
+        stage = {
+            "completed": time.time(),
+            "result": result,
+            "artifacts": checksums,
+            "digest": hashlib.sha256(payload).hexdigest(),
+            "inputs": {upstream: self.stage_digest(upstream) for upstream in after},
+            "external": dict(inputs or {}),
+        }
+        with self._lock:  # another thread may be serializing the manifest
+            self.manifest["stages"][name] = stage
+        self._write_manifest()
+
+    def run_stage(self, name, func, after=(), inputs=None):
+        """Run func() -> (result, artifact_paths) unless a valid checkpoint exists.
+
+        after names the upstream stages whose results func() uses; inputs maps
+        external inputs (files the workspace does not own) to their digests. The
+        checkpoint is invalidated when any of either has changed since it was
+        recorded. func() may return None for the artifacts to hand back a
+        provisional result (e.g. a fallback script): it is used for this run
+        but not checkpointed, so the stage runs again on the next attempt.
+        """
+        result = self.stage_result(name, after, inputs)
+        if result is not None:
+            logger.info(f"[{self.job_id}] Resuming: stage '{name}' already complete")
+            return result
+        with memory_governor.stage(name):
+            result, artifacts = func()
+        if artifacts is None:
+            logger.warning(f"[{self.job_id}] Stage '{name}' produced a provisional result, not checkpointing it")
+            return result
+        self.complete_stage(name, result, artifacts, after, inputs)
+        return result
+
+    def mark_finished(self):
+        self.manifest["status"] = "finished"
+        self._write_manifest()
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+def gc_workspaces(root=None, max_age_hours=None, max_total_mb=None):
+    """Remove expired workspaces, then the oldest finished ones until under the size quota."""
+    root = root or JOB_WORKSPACE_CONFIG["root"]
+    max_age = (max_age_hours or JOB_WORKSPACE_CONFIG["max_age_hours"]) * 3600
+    max_total = (max_total_mb or JOB_WORKSPACE_CONFIG["max_total_mb"]) * 1024 * 1024
+    if not os.path.isdir(root):
+        return []
+
+    workspaces = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            manifest = {"status": "unknown", "updated": os.path.getmtime(path)}
+        workspaces.append((manifest.get("updated", 0), manifest.get("status"), path, _dir_size(path)))
+
+    removed = []
+    now = time.time()
+    for updated, status, path, size in sorted(workspaces):
+        if now - updated > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+
+    remaining = [w for w in sorted(workspaces) if w[2] not in removed]
+    total = sum(w[3] for w in remaining)
+    for updated, status, path, size in remaining:
+        if total <= max_total:
+            break
+        if status == "finished":
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+            total -= size
+
+    if removed:
+        logger.info(f"Removed {len(removed)} old job workspaces")
+    return removed
+
+def narration_stage(parsed_data, topic):
+    """JobWorkspace stage for the narration script; the generic fallback is not checkpointed."""
+    narration_data = generate_narration_script(parsed_data, topic)
+    return narration_data, None if narration_data.get("fallback") else []
+
+def video_job_id(parsed_data, topic, tts_engine=None, quality=None):
+    """Stable id for a video job, so a retry with the same inputs reuses its workspace.
+
+    The id covers the deck content, not the .pptx file: a rebuilt package of the
+    same deck has different bytes (timestamps, zip order) but the same slides.
+    """
+    digest = hashlib.sha256()
+    digest.update(as_deck(parsed_data).dumps())
+    digest.update(json.dumps([topic, tts_engine or TTS_CONFIG["engine"], quality or VIDEO_CONFIG["quality"]]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def create_presentation_video(parsed_data, topic, ppt_path, tts_engine=None, quality=None, job_id=None,
+                              save_images=None, lang="en", reveal=None):
+    """Main function to create video from presentation data.
+
+    tts_engine selects the narration backend for this job (see TTS_BACKENDS) and
+    quality the render profile (see RENDER_PROFILES). Intermediate results are
+    checkpointed in a JobWorkspace, so calling again after a failure resumes from
+    the last completed stage. Slide PNGs are only written when save_images (default
+    VIDEO_CONFIG["save_slide_images"]) is set or the encoding profile needs them;
+    otherwise rendered pages are piped straight to the encoder. lang other than
+    English translates the narration before synthesis (see NARRATION_LANGUAGES).
+    With VIDEO_CONFIG["output_format"] set to "hls" the result is an HLS playlist
+    whose segments are published slide by slide (see encode_slides_hls); with
+    VIDEO_CONFIG["rendition_ladder"] every rendition is encoded in one pass and the
+    largest one is returned. reveal (default VIDEO_CONFIG["bullet_reveal"]) fades
+    bullets in as the narration reaches them (see plan_bullet_reveals).
+    """
+    settings = get_render_settings(quality)
+    if save_images is None:
+        save_images = VIDEO_CONFIG["save_slide_images"]
+    save_images = save_images or not settings["vfr"]
+    if reveal is None:
+        reveal = VIDEO_CONFIG["bullet_reveal"]
+    job_id = job_id or video_job_id(parsed_data, topic, tts_engine, settings["quality"])
+    if lang != "en":
+        job_id += f"_{lang}"
+    workspace = JobWorkspace(job_id)
+    logger.info(f"Starting video creation process (job {job_id})...")
+    
+    try:
+        images_dir = workspace.subdir("images")
+        audio_dir = workspace.subdir("audio")
+        
+        # Step 1: Generate narration script
+        narration_data = workspace.run_stage(
+            "narration", lambda: narration_stage(parsed_data, topic))
+        script_stage = "narration"
+        if lang != "en":
+            script_stage = f"narration_{lang}"
+            narration_data = workspace.run_stage(
+                script_stage, lambda: (translate_narration(narration_data, lang), []), after=["narration"])
+        
+        # Step 2: Create audio files (title, content slides, conclusion)
+        def synthesize():
+            files = synthesize_narration(narration_data, audio_dir, lang=lang, engine=tts_engine)
+            return files, files
+        audio_files = workspace.run_stage("audio", synthesize, after=[script_stage])
+
+        logger.info(f"Created {len(audio_files)} audio files")
+        
+        # Step 3: Convert PPT to images (only when they are kept). The job id only
+        # covers the deck content and slide images are re-fetched on every build, so
+        # renders are tied to the exact pptx they were made from.
+        pptx_input = {"pptx": file_checksum(ppt_path)}
+        image_files = None
+        if save_images:
+            def rasterize():
+                files = convert_ppt_to_images(ppt_path, images_dir, dpi=settings["dpi"])
+                if not files:
+                    raise Exception("Slide rasterization produced no images")
+                return files, files
+            image_files = workspace.run_stage("images", rasterize, inputs=pptx_input)
+            slide_count = len(image_files)
+        else:
+            slide_count = len(Presentation(ppt_path).slides)
+        
+        # Ensure we have matching numbers of slides and audio files
+        min_length = min(slide_count, len(audio_files))
+        audio_files = audio_files[:min_length]
+        if image_files:
+            image_files = image_files[:min_length]
+        
+        if min_length == 0:
+            raise Exception("No matching image and audio files found")
+        
+        # Step 4: Assemble one narration track with exact per-slide offsets
+        def assemble():
+            track = assemble_narration_track(audio_files, os.path.join(audio_dir, "narration.wav"))
+            return track, [track["path"]]
+        narration_track = workspace.run_stage("track", assemble, after=["audio"])
+
+        # Step 4b: Render the partial-bullet states for the reveal animation
+        reveals = None
+        if reveal and settings["vfr"] and settings["output_format"] != "hls":
+            def render_states():
+                states = rasterize_reveal_states(ppt_path, workspace.subdir("reveal"), dpi=settings["dpi"])
+                return states, [path for _, paths in states for path in paths]
+            states = workspace.run_stage("reveal", render_states, inputs=pptx_input)
+            reveals = plan_bullet_reveals(ppt_path, states, narration_data, narration_track, lang, tts_engine)
+        
+        # Step 5: Create video
+        video_filename = topic.strip().replace(" ", "_") + "_presentation.mp4"
+        with memory_governor.stage("video"):
+            if settings["output_format"] == "hls" and shutil.which("ffmpeg"):
+                frames = image_files or iter_presentation_frames(ppt_path, dpi=settings["dpi"])
+                video_path = encode_slides_hls(frames, narration_track, os.path.splitext(video_filename)[0] + "_hls",
+                                               get_render_settings(settings["quality"], "static"))
+            elif settings["rendition_ladder"] and shutil.which("ffmpeg"):
+                frames = image_files or iter_presentation_frames(ppt_path, dpi=settings["dpi"])
+                outputs = encode_rendition_ladder(frames, narration_track, video_filename,
+                                                  get_render_settings(settings["quality"], "static"),
+                                                  ladder=[name.strip() for name in settings["rendition_ladder"]],
+                                                  reveals=reveals)
+                for name, path in (outputs or {}).items():
+                    logger.info(f"Rendition {name}: {path}")
+                video_path = next(iter(outputs.values())) if outputs else None
+            elif image_files:
+                video_path = create_video_from_slides_and_audio(image_files, narration_track, video_filename,
+                                                                quality=settings["quality"], reveals=reveals)
+            else:
+                video_path = create_video_from_presentation(ppt_path, narration_track, video_filename,
+                                                            quality=settings["quality"], reveals=reveals)
+        logger.info(f"Peak memory per stage (MB): {memory_governor.report()}")
+        
+        if video_path and os.path.exists(video_path):
+            logger.info(f"Video creation successful: {video_path}")
+            file_size = os.path.getsize(video_path) / (1024 * 1024)  # MB
+            logger.info(f"Video file size: {file_size:.1f} MB")
+            workspace.mark_finished()
+            return video_path
+        else:
+            raise Exception("Video creation failed")
+    
+    except Exception as e:
+        logger.error(f"Video creation process failed: {e}")
+        logger.info(f"Workspace kept for retry: {workspace.path}")
+        return None
+    
+    finally:
+        try:
+            gc_workspaces()
+        except Exception as e:
+            logger.warning(f"Failed to clean up old job workspaces: {e}")
+
+# === MULTI-LANGUAGE NARRATION ===
+
+def mux_narration_tracks(video_path, tracks, output_path, bitrate=None):
+    """Stream-copy the video and add one AAC audio track per language.
+
+    tracks maps language codes to narration track dicts (or WAV paths), in the
+    order the audio streams should appear; the first one is the default.
+    """
+    cmd = ["ffmpeg", "-y", "-v", "error", "-i", video_path]
+    for track in tracks.values():
+        cmd += ["-i", track["path"] if isinstance(track, dict) else track]
+    cmd += ["-map", "0:v"]
+    for i in range(len(tracks)):
+        cmd += ["-map", f"{i + 1}:a"]
+    cmd += ["-c:v", "copy", "-c:a", "aac", "-b:a", bitrate or VIDEO_CONFIG.get("audio_bitrate", "128k")]
+    for i, lang in enumerate(tracks):
+        name, tag = NARRATION_LANGUAGES.get(lang, (lang, lang))
+        cmd += [f"-metadata:s:a:{i}", f"language={tag}", f"-metadata:s:a:{i}", f"title={name}",
+                f"-disposition:a:{i}", "default" if i == 0 else "0"]
+    cmd += ["-movflags", "+faststart", output_path]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg audio mux failed: {result.stderr}")
+    return output_path
+
+def create_multilingual_video(parsed_data, topic, ppt_path, languages, tts_engine=None, quality=None,
+                              separate_outputs=False, job_id=None):
+    """Render a deck once and narrate it in several languages.
+
+    The narration script is written once and translated into every other
+    language concurrently; each language is then synthesized on the shared TTS pool. The slides are encoded once on a
+    timeline shared by all languages. Each language is then added as its own
+    audio track, or written to its own file by stream copy with separate_outputs.
+    Returns the output path, or a {language: path} dict with separate_outputs.
+    """
+    languages = list(dict.fromkeys(languages))
+    settings = get_render_settings(quality)
+    job_id = job_id or video_job_id(parsed_data, topic, tts_engine, settings["quality"]) + "_" + "-".join(languages)
+    workspace = JobWorkspace(job_id)
+    logger.info(f"Starting multi-language video ({', '.join(languages)}, job {job_id})...")
+
+    try:
+        audio_dir = workspace.subdir("audio")
+        narration_data = workspace.run_stage(
+            "narration", lambda: narration_stage(parsed_data, topic))
+
+        # The script is written in English; every other language is a translation, all requested at once
+        script_stages = {lang: "narration" if lang == "en" else f"narration_{lang}" for lang in languages}
+        translate = lambda lang: workspace.run_stage(
+            script_stages[lang], lambda: (translate_narration(narration_data, lang), []), after=["narration"])
+        foreign = [lang for lang in languages if lang != "en"]
+        scripts = dict(zip(foreign, scheduler.map("io", translate, foreign)), en=narration_data)
+
+        # Languages are synthesized one after another; each one already fills the TTS pool slide by slide
+        audio_files = {}
+        for lang in languages:
+            def synthesize():
+                files = synthesize_narration(scripts[lang], workspace.subdir(os.path.join("audio", lang)),
+                                             lang=lang, engine=tts_engine, keep_missing=True)
+                return files, [path for path in files if path]
+            audio_files[lang] = workspace.run_stage(f"audio_{lang}", synthesize, after=[script_stages[lang]])
+
+        slide_count = len(Presentation(ppt_path).slides)
+        audio_files = {lang: files[:slide_count] for lang, files in audio_files.items()}
+
+        def assemble():
+            tracks = assemble_aligned_tracks(audio_files, audio_dir)
+            return tracks, [track["path"] for track in tracks.values()]
+        tracks = workspace.run_stage("tracks", assemble, after=[f"audio_{lang}" for lang in languages])
+
+        # The video is rendered once, against the primary language's track
+        base = topic.strip().replace(" ", "_") + "_presentation"
+        video_only = os.path.join(workspace.path, "video.mp4")
+        with memory_governor.stage("video"):
+            if not create_video_from_presentation(ppt_path, tracks[languages[0]], video_only,
+                                                  quality=settings["quality"]):
+                raise Exception("Video creation failed")
+
+        bitrate = settings["audio_bitrate"]
+        if separate_outputs:
+            outputs = {}
+            for lang in languages:
+                outputs[lang] = mux_narration_tracks(video_only, {lang: tracks[lang]}, f"{base}_{lang}.mp4", bitrate)
+                logger.info(f"Video created ({lang}): {outputs[lang]}")
+            result = outputs
+        else:
+            result = mux_narration_tracks(video_only, tracks, base + ".mp4", bitrate)
+            logger.info(f"Video created with {len(tracks)} audio tracks: {result}")
+
+        workspace.mark_finished()
+        return result
+
+    except Exception as e:
+        logger.error(f"Multi-language video creation failed: {e}")
+        logger.info(f"Workspace kept for retry: {workspace.path}")
+        return None
+
+    finally:
+        try:
+            gc_workspaces()
+        except Exception as e:
+            logger.warning(f"Failed to clean up old job workspaces: {e}")
+
+# === UTILITY FUNCTIONS ===
+
+def classify_paragraph_type(raw_text):
+    """Classifies the type of presentation based on user input text."""
+    prompt = f"""
+    Classify the following text into one category:
+    - business
+    - academic
+    - technical
+    - educational
+    - motivational
+    - general
+
+    Text:
+    \"\"\"{raw_text}\"\"\"
+
+    Respond with only one word (the category).
+    """
+    result = llm.invoke(prompt).content.strip().lower()
+    if result not in ["business", "academic", "technical", "educational", "motivational", "general"]:
+        return "business"  # default fallback
+    return result
+
+def refine_paragraph_input(raw_text, category="business"):
+    """Refines raw text differently depending on content type."""
+    style_guidelines = {
+        "business": "Make it concise, factual, and strategic. Focus on insights, numbers, and implications.",
+        "academic": "Make it clear, explanatory, with definitions and logical flow.",
+        "technical": "Make it precise, structured, with focus on processes, systems, and technical clarity.",
+        "educational": "Make it simple, clear, and beginner-friendly with learning outcomes.",
+        "motivational": "Make it inspiring, story-driven, with positive tone and key messages.",
+        "general": "Make it well-structured, clear, and neutral."
+    }
+
+    guidelines = style_guidelines.get(category, style_guidelines["business"])
+
+    prompt = f"""
+    Refine and summarize the following text for a professional {category} presentation.
+    {guidelines}
+    Output 5-6 concise paragraphs, well-structured for slide generation.
+    Do not use bold, italics, underlines, Markdown symbols (like *, **, _), or any decorative formatting.
+    Only plain text should be returned.
+    Text:
+    \"\"\"{raw_text}\"\"\"
+
+    Refined version:
+    """
+    return llm.invoke(prompt).content
+
+def get_slide_content_from_paragraph(context_text, category="business", min_slides=1, max_slides=15):
+    """Generate slide content from paragraph input."""
+    style_instructions = {
+        "business": "Use a McKinsey-style with charts, insights, and data-driven points.",
+        "academic": "Use an academic style with definitions, theories, and structured explanation.",
+        "technical": "Use a technical style with system diagrams, architecture, workflows, or pseudocode.",
+        "educational": "Use an educational style with simple language, learning outcomes, and key concepts.",
+        "motivational": "Use a motivational style with quotes, storytelling, and call-to-action messages.",
+        "general": "Use a general informative style with clarity and balanced explanation."
+    }
+    style = style_instructions.get(category, style_instructions["business"])
+
+    prompt = f"""
+    You are preparing a professional {category} PowerPoint presentation outline 
+    based on the following refined content:
+
+    \"\"\"{context_text}\"\"\"
+
+    Rules:
+    - Create between {min_slides} and {max_slides} slides depending on content richness.
+    - {style}
+    - Return ONLY valid JSON, no explanations or markdown.
+    - "intro" must be maximum 2-3 lines.
+    - Each slide must include:
+      - "title": max 8 words
+      - "insight": one or two sentences summarizing the key takeaway
+      - "type": either "bullets" or "chart"
+      - If "type" = "bullets", "data" must be an array of objects:
+        {{"point": "short phrase", "desc": "5-6 line proper explanation"}}
+      - If "type" = "chart", "data" must be JSON:
+        {{
+          "type": "BAR" | "LINE" | "PIE" | "COLUMN" | "DOUGHNUT" | "AREA" | "SCATTER" | "STACKED_BAR",
+          "data": [["Label1", 123], ["Label2", 456]],
+          "source": "Source: Organization, 2025"
+        }}
+        and optionally include "context": "Why this data matters"
+
+    JSON format:
+    {{
+      "intro": "short intro text",
+      "slides": [
+        {{
+          "title": "Slide Title",
+          "insight": "Key insight",
+          "type": "bullets",
+          "data": [
+            {{"point": "Clarity", "desc": "Use straightforward language to avoid confusion"}},
+            {{"point": "Audience Awareness", "desc": "Adapt tone and style to the readers"}}
+          ]
+        }},
+        {{
+          "title": "Slide with Chart",
+          "insight": "Data-driven point",
+          "type": "chart",
+          "data": {{
+            "type": "COLUMN",
+            "data": [["X", 10], ["Y", 20]],
+            "source": "Source: Example Org, 2025"
+          }},
+          "context": "Why this data is important"
+        }}
+      ]
+    }}
+    """
+    return llm.invoke(prompt).content
+
+def generate_topic_from_paragraph(context_text):
+    """Generate a topic title from paragraph content."""
+    prompt = f"""
+    Generate a concise, professional presentation title (max 6 words) from this content:
+    "{context_text[:200]}..."
+    
+    Return only the title, no quotes or formatting.
+    """
+    return llm.invoke(prompt).content.strip()
+
+# === LONG DOCUMENT INGESTION ===
+
+DOCUMENT_CONFIG = {
+    "extensions": (".txt", ".md", ".pdf", ".docx"),
+    "direct_tokens": 3000,  # shorter inputs are sent to the LLM as-is
+    "chunk_tokens": 2500,  # budget per map (summarize) call
+    "reduce_tokens": 3000,  # summaries are merged until they fit in this budget
+    "cache_dir": os.getenv("SUMMARY_CACHE_DIR", ".summary_cache"),
+    "max_workers": LLM_RATE_LIMITS["max_concurrency"],
+}
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+def iter_document_blocks(path):
+    """Stream a document as text blocks (paragraphs, or pages for PDFs without paragraph breaks).
+
+    .txt/.md are read line by line; .docx paragraphs are parsed incrementally from
+    word/document.xml; .pdf text comes from poppler's pdftotext (already required
+    by pdf2image), page by page.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".docx":
+        import zipfile
+        import xml.etree.ElementTree as ET
+        with zipfile.ZipFile(path) as package, package.open("word/document.xml") as xml_file:
+            for _, element in ET.iterparse(xml_file):
+                if element.tag == WORD_NS + "p":
+                    text = "".join(node.text or "" for node in element.iter(WORD_NS + "t")).strip()
+                    if text:
+                        yield text
+                    element.clear()
+        return
+
+    if ext == ".pdf":
+        proc = subprocess.Popen(["pdftotext", "-layout", path, "-"], stdout=subprocess.PIPE, text=True,
+                                encoding="utf-8", errors="replace")
+        lines = proc.stdout
+    else:
+        proc = None
+        lines = open(path, encoding="utf-8", errors="replace")
+
+    try:
+        block = []
+        for line in lines:
+            pages = line.split("\f")
+            for k, part in enumerate(pages):
+                stripped = part.strip()
+                # Blank lines, page breaks and Markdown headings start a new block
+                if k > 0 or not stripped or stripped.startswith("#"):
+                    if block:
+                        yield " ".join(block)
+                    block = []
+                if stripped:
+                    block.append(stripped)
+        if block:
+            yield " ".join(block)
+    finally:
+        lines.close()
+        if proc and proc.wait() != 0:
+            raise RuntimeError(f"pdftotext failed for {path}")
+
+def _is_cut_point(piece, tokens, average_tokens):
+    """Content-defined chunk boundary: chosen by the piece's own hash, about once per average_tokens."""
+    digest = hashlib.blake2b(piece.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < tokens / average_tokens
+
+def chunk_blocks(blocks, max_tokens=None):
+    """Group text blocks into chunks of at most max_tokens (estimated), splitting oversized blocks by sentence.
+
+    Boundaries follow the content rather than a running token count: a chunk ends
+    before a Markdown heading or after a block whose hash marks it as a cut point,
+    and the size limit only applies when neither comes in time. An edit therefore
+    changes the chunks around it, while later chunks keep their summary cache keys.
+    """
+    max_tokens = max_tokens or DOCUMENT_CONFIG["chunk_tokens"]
+    min_tokens = max_tokens // 4  # avoid a summarize call per short section
+    chunk = []
+    size = 0
+    for block in blocks:
+        if chunk and size >= min_tokens and block.lstrip().startswith("#"):
+            yield "\n\n".join(chunk)
+            chunk, size = [], 0
+        pieces = [block] if estimate_tokens(block) <= max_tokens else split_sentences(block)
+        for piece in pieces:
+            while estimate_tokens(piece) > max_tokens:  # one enormous "sentence"
+                cut = max_tokens * 4
+                yield piece[:cut]
+                piece = piece[cut:]
+            tokens = estimate_tokens(piece)
+            if chunk and size + tokens > max_tokens:
+                yield "\n\n".join(chunk)
+                chunk, size = [], 0
+            chunk.append(piece)
+            size += tokens
+            if size >= min_tokens and _is_cut_point(piece, tokens, max_tokens / 2):
+                yield "\n\n".join(chunk)
+                chunk, size = [], 0
+    if chunk:
+        yield "\n\n".join(chunk)
+
+def summarize_chunk(chunk, category="business"):
+    """Summarize one chunk for slide generation, cached by its content."""
+    digest = hashlib.sha256(f"v1\x1f{category}\x1f{chunk}".encode("utf-8")).hexdigest()
+    cache_path = os.path.join(DOCUMENT_CONFIG["cache_dir"], digest[:2], digest + ".txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+
+    prompt = f"""
+    Summarize this section of a longer document for a {category} presentation.
+    Keep every figure, date, name and conclusion; drop repetition and boilerplate.
+    Return plain text only, at most a few short paragraphs.
+
+    Section:
+    \"\"\"{chunk}\"\"\"
+    """
+    summary = llm.invoke(prompt).content.strip()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(summary)
+    os.replace(tmp_path, cache_path)
+    return summary
+
+def map_reduce_text(chunks, category="business"):
+    """Summarize chunks in parallel, then merge the summaries level by level until they fit one budget."""
+    level = list(chunks)
+    while True:
+        summaries = scheduler.map("io", lambda chunk: summarize_chunk(chunk, category), level,
+                                  limit=DOCUMENT_CONFIG["max_workers"])
+        merged = "\n\n".join(summaries)
+        if estimate_tokens(merged) <= DOCUMENT_CONFIG["reduce_tokens"] or len(summaries) == 1:
+            return merged
+        logger.info(f"Reducing {len(summaries)} summaries")
+        level = list(chunk_blocks(summaries, DOCUMENT_CONFIG["reduce_tokens"]))
+        if len(level) >= len(summaries):
+            return merged  # summaries are not shrinking; stop rather than loop
+
+def condense_source(source):
+    """Turn mode 2 input into (category, text small enough for one prompt).
+
+    source is pasted text or a path to a .txt/.md/.pdf/.docx file. Long inputs are
+    split into chunks that are summarized in parallel (with a per-chunk cache, so
+    re-runs only summarize changed sections) and reduced to one text.
+    """
+    is_file = os.path.isfile(source) and source.lower().endswith(DOCUMENT_CONFIG["extensions"])
+    blocks = iter_document_blocks(source) if is_file else [block for block in source.split("\n\n") if block.strip()]
+    chunks = list(chunk_blocks(blocks))
+    if not chunks:
+        raise ValueError("No text found in the input")
+
+    category = classify_paragraph_type(chunks[0])
+    if len(chunks) == 1 and estimate_tokens(chunks[0]) <= DOCUMENT_CONFIG["direct_tokens"]:
+        return category, chunks[0]
+
+    logger.info(f"Condensing {len(chunks)} chunks ({sum(map(estimate_tokens, chunks))} tokens)")
+    return category, map_reduce_text(chunks, category)
+
+# === DISTRIBUTED WORKERS ===
+
+QUEUE_CONFIG = {
+    "db_path": os.getenv("TASK_QUEUE_DB", os.path.join(".jobs", "tasks.db")),
+    "artifact_dir": os.getenv("ARTIFACT_DIR", os.path.join(".jobs", "artifacts")),  # shared by the workers on this host
+    "lease_seconds": 300,  # a task whose lease expires is handed to another worker
+    "heartbeat_interval": 30,
+    "max_attempts": 3,
+    "retry_backoff": 10,  # seconds, doubled per attempt
+    "poll_interval": 2,
+    "worker_slots": 2,  # tasks one worker runs at once, so network and CPU stages overlap
+}
+
+class TaskQueue:
+    """Durable task queue in a SQLite database.
+
+    Tasks form a per-job DAG through depends_on; a task can be leased only when all
+    of its dependencies are done. Runnable tasks are leased by priority (see
+    JOB_PRIORITIES), then oldest first. Workers extend their lease with heartbeat(); a
+    crashed worker's task becomes available again once the lease expires, unless it
+    has used up max_attempts, in which case it is marked failed.
+
+    This covers several worker processes on one machine, not several machines.
+    The database runs in WAL mode, which needs memory shared between
+    connections, and SQLite's file locking is not reliable on network
+    filesystems, so the database and the artifact directory must stay on the
+    host the workers run on. Spreading work across machines needs a queue
+    backend with its own server behind the same lease/heartbeat/complete/fail
+    interface, plus shared artifact storage; neither is provided here.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            depends_on TEXT NOT NULL DEFAULT '[]',
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            available_at REAL NOT NULL DEFAULT 0,
+            priority INTEGER NOT NULL DEFAULT 2,
+            result TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, available_at);
+        CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id);
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or QUEUE_CONFIG["db_path"]
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            if "priority" not in {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}:
+                conn.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 2")
+                conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self):
+        """Connection running its statements in one IMMEDIATE (write-locked) transaction."""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id, kind, payload, depends_on=(), priority=None):
+        now = time.time()
+        priority = current_job_priority.get() if priority is None else priority
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO tasks (job_id, kind, payload, depends_on, priority, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), json.dumps(list(depends_on)), priority, now, now))
+            return cursor.lastrowid
+
+    def lease(self, worker_id, kinds=None):
+        """Claim the most urgent runnable task, or return None."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM tasks WHERE available_at <= ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY priority, id",
+                (now, now)).fetchall()
+            for row in rows:
+                if kinds and row["kind"] not in kinds:
+                    continue
+                if row["status"] == "leased" and row["attempts"] >= QUEUE_CONFIG["max_attempts"]:
+                    # Its last worker died holding the lease
+                    self._mark_failed(conn, row["id"], row["error"] or "lease expired after the last attempt", now)
+                    continue
+                deps = json.loads(row["depends_on"])
+                if deps:
+                    done = conn.execute(
+                        f"SELECT COUNT(*) FROM tasks WHERE status = 'done' AND id IN ({','.join('?' * len(deps))})",
+                        deps).fetchone()[0]
+                    if done < len(deps):
+                        continue
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated = ? WHERE id = ?",
+                    (worker_id, now + QUEUE_CONFIG["lease_seconds"], now, row["id"]))
+                task = dict(row)
+                task["payload"] = json.loads(row["payload"])
+                task["depends_on"] = deps
+                task["attempts"] += 1
+                return task
+        return None
+
+    def heartbeat(self, task_id, worker_id):
+        """Extend a lease; returns False if the task was taken over by another worker."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (now + QUEUE_CONFIG["lease_seconds"], now, task_id, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (json.dumps(result), time.time(), task_id, worker_id))
+
+    @staticmethod
+    def _mark_failed(conn, task_id, error, now):
+        conn.execute("UPDATE tasks SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                     (str(error), now, task_id))
+        # Nothing downstream of a failed task can run; independent branches of the job still can
+        rows = conn.execute("SELECT id, depends_on FROM tasks WHERE status = 'pending' "
+                            "AND job_id = (SELECT job_id FROM tasks WHERE id = ?)", (task_id,)).fetchall()
+        dependents = {}
+        for row in rows:
+            for dep in json.loads(row["depends_on"]):
+                dependents.setdefault(dep, []).append(row["id"])
+        blocked, frontier = set(), [task_id]
+        while frontier:
+            for child in dependents.get(frontier.pop(), ()):
+                if child not in blocked:
+                    blocked.add(child)
+                    frontier.append(child)
+        conn.executemany("UPDATE tasks SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                         [(f"dependency {task_id} failed", now, child) for child in blocked])
+
+    def fail(self, task_id, worker_id, error):
+        """Record a failure; the task is retried with backoff until max_attempts."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts, lease_owner FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row["lease_owner"] != worker_id:
+                return  # the lease expired and another worker took the task over
+            if row["attempts"] >= QUEUE_CONFIG["max_attempts"]:
+                self._mark_failed(conn, task_id, error, now)
+            else:
+                delay = QUEUE_CONFIG["retry_backoff"] * 2 ** (row["attempts"] - 1)
+                conn.execute("UPDATE tasks SET status = 'pending', lease_owner = NULL, error = ?, "
+                             "available_at = ?, updated = ? WHERE id = ?",
+                             (str(error), now + delay, now, task_id))
+
+    def results(self, task_ids):
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, kind, result FROM tasks WHERE id IN ({','.join('?' * len(task_ids))})",
+                list(task_ids)).fetchall()
+        return {row["kind"]: json.loads(row["result"]) for row in rows if row["result"]}
+
+    def job_status(self, job_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT kind, status, attempts, result, error FROM tasks WHERE job_id = ? ORDER BY id",
+                                (job_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+def job_artifact_dir(job_id, *parts):
+    path = os.path.abspath(os.path.join(QUEUE_CONFIG["artifact_dir"], job_id, *parts))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _artifact(job_id, relpath):
+    return os.path.join(job_artifact_dir(job_id), relpath)
+
+def _relative(job_id, path):
+    return os.path.relpath(path, job_artifact_dir(job_id))
+
+# Each task handler takes (job_id, payload, deps) where deps maps the kind of each
+# dependency to its result, and returns a JSON result. Artifact paths in results
+# are relative to the job's artifact directory so any worker can resolve them.
+
+def task_outline(job_id, payload, deps):
+    topic = payload["topic"]
+    if payload.get("context_text"):
+        category, context_text = condense_source(payload["context_text"])
+        refined_text = refine_paragraph_input(context_text, category)
+        topic = generate_topic_from_paragraph(context_text)
+        parsed = generate_parsed_slides(lambda: get_slide_content_from_paragraph(refined_text, category), kind="paragraph")
+        deck = Deck.from_dict(fill_missing_slides(parsed, topic))
+    else:
+        n = payload["n_slides"]
+        deck = load_cached_deck("topic", topic, n)
+        if not deck:
+            parsed = generate_topic_slides(topic, n)
+            deck = Deck.from_dict(fill_missing_slides(parsed, topic))
+            if deck.usable():
+                save_cached_deck(deck, "topic", topic, n)
+    if not deck.usable():
+        raise Exception(f"Only {deck.recovered} of {len(deck.slides)} slides were generated")
+    return {"deck": _relative(job_id, deck.save(_artifact(job_id, "deck.bin"))), "topic": topic}
+
+def task_fetch_images(job_id, payload, deps):
+    deck = Deck.load(_artifact(job_id, deps["outline"]["deck"]))
+    topic = deps["outline"]["topic"]
+    images_dir = job_artifact_dir(job_id, "images")
+    images = {}
+    for i, path in fetch_slide_images(deck, topic).items():
+        if path:
+            target = os.path.join(images_dir, f"slide_{i:02d}{os.path.splitext(path)[1]}")
+            shutil.copy(path, target)
+            images[str(i)] = _relative(job_id, target)
+    return {"images": images}
+
+def task_build_pptx(job_id, payload, deps):
+    deck = Deck.load(_artifact(job_id, deps["outline"]["deck"]))
+    topic = deps["outline"]["topic"]
+    images = {int(i): _artifact(job_id, path) for i, path in deps["fetch_images"]["images"].items()}
+    ppt_path = build_mckinsey_ppt(deck, topic, images=images, output_path=_artifact(job_id, "presentation.pptx"))
+    return {"pptx": _relative(job_id, ppt_path)}
+
+def task_rasterize(job_id, payload, deps):
+    settings = get_render_settings(payload.get("quality"))
+    image_files = convert_ppt_to_images(_artifact(job_id, deps["build_pptx"]["pptx"]),
+                                        job_artifact_dir(job_id, "frames"), dpi=settings["dpi"])
+    if not image_files:
+        raise Exception("Slide rasterization produced no images")
+    return {"frames": [_relative(job_id, path) for path in image_files]}
+
+def task_synthesize_audio(job_id, payload, deps):
+    deck = Deck.load(_artifact(job_id, deps["outline"]["deck"]))
+    narration_data = generate_narration_script(deck, deps["outline"]["topic"])
+    lang = payload.get("lang") or "en"
+    if lang != "en":
+        narration_data = translate_narration(narration_data, lang)
+    audio_dir = job_artifact_dir(job_id, "audio")
+    audio_files = synthesize_narration(narration_data, audio_dir, lang=lang, engine=payload.get("tts_engine"))
+    if not audio_files:
+        raise Exception("No narration audio was synthesized")
+    track = assemble_narration_track(audio_files, os.path.join(audio_dir, "narration.wav"))
+    return dict(track, path=_relative(job_id, track["path"]))
+
+def task_encode(job_id, payload, deps):
+    image_files = [_artifact(job_id, path) for path in deps["rasterize"]["frames"]]
+    track = dict(deps["synthesize_audio"])
+    track["path"] = _artifact(job_id, track["path"])
+    count = min(len(image_files), len(track["timeline"]))
+    track["timeline"] = track["timeline"][:count]
+    video_path = create_video_from_slides_and_audio(image_files[:count], track, _artifact(job_id, "presentation.mp4"),
+                                                    quality=payload.get("quality"))
+    if not video_path:
+        raise Exception("Video encoding failed")
+    return {"video": _relative(job_id, video_path)}
+
+TASK_HANDLERS = {
+    "outline": task_outline,
+    "fetch_images": task_fetch_images,
+    "build_pptx": task_build_pptx,
+    "rasterize": task_rasterize,
+    "synthesize_audio": task_synthesize_audio,
+    "encode": task_encode,
+}
+
+def submit_job(queue, topic=None, n_slides=None, context_text=None, create_video=True, tts_engine=None, quality=None,
+               lang="en"):
+    """Enqueue the task graph for one deck (and video) and return its job id.
+
+    The video is narrated in one language, lang; multi-language videos
+    (create_multilingual_video) are not available through the queue.
+    """
+    job_id = datetime.now().strftime("%Y%m%d%H%M%S") + "_" + hashlib.sha256(os.urandom(8)).hexdigest()[:6]
+    options = {"tts_engine": tts_engine, "quality": quality, "lang": lang}
+    with scheduler.priority(quality):
+        outline = queue.enqueue(job_id, "outline", {"topic": topic, "n_slides": n_slides, "context_text": context_text})
+        images = queue.enqueue(job_id, "fetch_images", {}, [outline])
+        pptx = queue.enqueue(job_id, "build_pptx", {}, [outline, images])
+        if create_video:
+            frames = queue.enqueue(job_id, "rasterize", options, [pptx])
+            audio = queue.enqueue(job_id, "synthesize_audio", options, [outline])
+            queue.enqueue(job_id, "encode", options, [frames, audio])
+    logger.info(f"Submitted job {job_id}")
+    return job_id
+
+def run_task(queue, task, worker_id):
+    """Run one leased task at its job's priority, heartbeating its lease until it finishes."""
+    logger.info(f"[{task['job_id']}] Running {task['kind']} (attempt {task['attempts']})")
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(QUEUE_CONFIG["heartbeat_interval"]):
+            if not queue.heartbeat(task["id"], worker_id):
+                logger.warning(f"Lost lease on task {task['id']}")
+                return
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    try:
+        deps = queue.results(task["depends_on"]) if task["depends_on"] else {}
+        with memory_governor.stage(task["kind"]), scheduler.priority(task["priority"]):
+            result = TASK_HANDLERS[task["kind"]](task["job_id"], task["payload"], deps)
+        queue.complete(task["id"], worker_id, result)
+    except Exception as e:
+        logger.error(f"[{task['job_id']}] {task['kind']} failed: {e}")
+        queue.fail(task["id"], worker_id, e)
+    finally:
+        stop.set()
+        beat.join()
+
+def run_worker(queue=None, worker_id=None, kinds=None, exit_when_idle=False, slots=None):
+    """Lease and run tasks until interrupted (or, with exit_when_idle, until no task is runnable).
+
+    Up to `slots` tasks run at once, e.g. one job's audio synthesis (network)
+    next to another job's encode (CPU); their stages share the process-wide
+    scheduler pools.
+    """
+    queue = queue or TaskQueue()
+    worker_id = worker_id or f"{platform.node()}:{os.getpid()}"
+    slots = slots or QUEUE_CONFIG["worker_slots"]
+    logger.info(f"Worker {worker_id} polling {queue.db_path} ({slots} slots)")
+
+    running = []
+    while True:
+        running = [thread for thread in running if thread.is_alive()]
+        if len(running) >= slots:
+            running[0].join(0.1)
+            continue
+        task = queue.lease(worker_id, kinds)
+        if task is None:
+            if exit_when_idle and not running:
+                return
+            if running:
+                running[0].join(QUEUE_CONFIG["poll_interval"])  # a finishing task may unblock its dependents
+            else:
+                time.sleep(QUEUE_CONFIG["poll_interval"])
+            continue
+
+        thread = threading.Thread(target=run_task, args=(queue, task, worker_id), daemon=True)
+        thread.start()
+        running.append(thread)
+
+# === MAIN EXECUTION ===
+
+if __name__ == "__main__":
+    import sys
+
+    # `--regenerate` ignores cached decks and overwrites them (same as DECK_CACHE=refresh)
+    if "--regenerate" in sys.argv:
+        sys.argv.remove("--regenerate")
+        DECK_CACHE_MODE = "refresh"
+
+    # `python prevmicro.py worker [kind ...]` runs a queue worker (optionally limited to some task kinds)
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        run_worker(kinds=sys.argv[2:] or None)
+        sys.exit()
+
+    print("=== PPT to Video Converter with AI Narration ===\n")
+    
+    mode = input("Choose input mode (1=Topic, 2=Paragraph, 3=Submit to worker queue): ").strip()
+    create_video = input("Create video after PPT? (y/n): ").strip().lower() == 'y'
+    tts_engine = None
+    quality = None
+    languages = []
+    if create_video:
+        tts_engine = input(f"TTS engine ({'/'.join(TTS_BACKENDS)}) [{TTS_CONFIG['engine']}]: ").strip().lower() or None
+        quality = input(f"Render quality ({'/'.join(RENDER_PROFILES)}) [{VIDEO_CONFIG['quality']}]: ").strip().lower() or None
+        languages = [code.strip() for code in input(
+            f"Narration languages, comma separated ({'/'.join(NARRATION_LANGUAGES)}) [en]: ").split(",") if code.strip()]
+
+    # Everything this session runs is scheduled at its render quality's priority (previews first)
+    current_job_priority.set(job_priority(quality))
+
+    if mode == "1":
+        # === Topic-based workflow ===
+        topic = input("Enter your presentation topic: ").strip()
+        try:
+            n = int(input("Number of slides: "))
+            if n < 1:
+                raise ValueError("Slide count must be at least 1.")
+        except Exception as e:
+            print(f"Invalid input: {e}")
+            exit()
+
+        parsed_slides = load_cached_deck("topic", topic, n)
+        if parsed_slides:
+            print(f"\n[1/4] Reusing cached slide content for '{topic}'")
+        else:
+            print(f"\n[1/4] Generating JSON content with AI for '{topic}'...")
+            print("[2/4] Parsing JSON response...")
+            parsed = generate_topic_slides(topic, n)
+            parsed_slides = Deck.from_dict(fill_missing_slides(parsed, topic))
+
+            if not parsed_slides.usable():
+                print(f"Failed to generate or parse JSON content ({parsed_slides.recovered} of "
+                      f"{len(parsed_slides.slides)} slides recovered). Please try again.")
+                exit()
+            save_cached_deck(parsed_slides, "topic", topic, n)
+
+        print(f"[3/4] Building PowerPoint presentation...")
+        ppt_path = build_mckinsey_ppt(parsed_slides, topic)
+        
+        if create_video:
+            print(f"[4/4] Creating video with AI narration...")
+            if len(languages) > 1:
+                video_path = create_multilingual_video(parsed_slides, topic, ppt_path, languages,
+                                                       tts_engine=tts_engine, quality=quality)
+            else:
+                video_path = create_presentation_video(parsed_slides, topic, ppt_path, tts_engine=tts_engine,
+                                                       quality=quality, lang=(languages or ["en"])[0])
+            if video_path:
+                print(f"\n SUCCESS!")
+                print(f" PowerPoint: {ppt_path}")
+                print(f" Video: {video_path}")
+            else:
+                print(f"\nâš ï¸  PowerPoint created: {ppt_path}")
+                print("âŒ Video creation failed")
+
+    elif mode == "2":
+        # === Paragraph-based workflow ===
+        source = input("Enter paragraph/context, or a .txt/.md/.pdf/.docx file path: ").strip()
+
+        print("\n[1/6] Reading input and detecting content type...")
+        try:
+            category, context_text = condense_source(source)
+        except ValueError as e:
+            print(f"Invalid input: {e}")
+            exit()
+        print(f" Detected category: {category}")
+
+        print("\n[2/6] Refining input text...")
+        refined_text = refine_paragraph_input(context_text, category)
+
+        topic = generate_topic_from_paragraph(context_text)
+        print(f"â†’ Generated topic: {topic}")
+
+        print("\n[3/6] Generating JSON slides...")
+        print("[4/6] Parsing JSON response...")
+        parsed = generate_parsed_slides(lambda: get_slide_content_from_paragraph(refined_text, category), kind="paragraph")
+        parsed_slides = Deck.from_dict(fill_missing_slides(parsed, topic))
+
+        if not parsed_slides.usable():
+            print(f"Failed to generate or parse JSON content ({parsed_slides.recovered} of "
+                  f"{len(parsed_slides.slides)} slides recovered). Please try again.")
+            exit()
+
+        print(f"[5/6] Building PowerPoint presentation...")
+        ppt_path = build_mckinsey_ppt(parsed_slides, topic)
+        
+        if create_video:
+            print(f"[6/6] Creating video with AI narration...")
+            if len(languages) > 1:
+                video_path = create_multilingual_video(parsed_slides, topic, ppt_path, languages,
+                                                       tts_engine=tts_engine, quality=quality)
+            else:
+                video_path = create_presentation_video(parsed_slides, topic, ppt_path, tts_engine=tts_engine,
+                                                       quality=quality, lang=(languages or ["en"])[0])
+            if video_path:
+                print(f"\n SUCCESS!")
+                print(f"PowerPoint: {ppt_path}")
+                print(f" Video: {video_path}")
+            else:
+                print(f"\nPowerPoint created: {ppt_path}")
+                print(" Video creation failed")
+
+    elif mode == "3":
+        # === Queue a job for the distributed workers ===
+        if len(languages) > 1:
+            print("Invalid input: queued jobs are narrated in one language; use mode 1 or 2 for several")
+            exit()
+        topic = input("Enter your presentation topic (leave empty to paste a paragraph): ").strip()
+        context_text = None
+        n = None
+        if topic:
+            try:
+                n = int(input("Number of slides: "))
+                if n < 1:
+                    raise ValueError("Slide count must be at least 1.")
+            except Exception as e:
+                print(f"Invalid input: {e}")
+                exit()
+        else:
+            context_text = input("Enter paragraph/context, or a .txt/.md/.pdf/.docx file path: ").strip()
+
+        job_id = submit_job(TaskQueue(), topic=topic, n_slides=n, context_text=context_text,
+                            create_video=create_video, tts_engine=tts_engine, quality=quality,
+                            lang=(languages or ["en"])[0])
+        print(f"\nSubmitted job {job_id} to {QUEUE_CONFIG['db_path']}")
+        print(f"Start workers with: python {os.path.basename(__file__)} worker")
+        print(f"Artifacts: {job_artifact_dir(job_id)}")
+
+    else:
         print("Invalid mode. Exiting.")
\ No newline at end of file
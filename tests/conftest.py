@@ -0,0 +1,6 @@
+import os
+import sys
+
+# prevmicro builds its Groq client at import time; the tests never call it
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
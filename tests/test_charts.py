@@ -0,0 +1,46 @@
+import numpy as np
+
+import prevmicro
+
+
+def test_lttb_keeps_short_series():
+    assert list(prevmicro.lttb_indices(np.arange(5.0), 10)) == [0, 1, 2, 3, 4]
+
+
+def test_lttb_returns_sorted_unique_indices_with_endpoints():
+    y = np.sin(np.linspace(0, 20, 1000))
+    indices = prevmicro.lttb_indices(y, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_keeps_spikes():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    y[811] = -50.0
+    indices = prevmicro.lttb_indices(y, 20)
+    assert 437 in indices and 811 in indices
+
+
+def test_downsample_line_to_point_budget():
+    categories = [f"t{i}" for i in range(1000)]
+    values = np.vstack([np.linspace(0, 1, 1000), np.linspace(1, 0, 1000)])
+    kept, reduced = prevmicro.downsample_chart(categories, values, "LINE", max_points=100)
+    assert len(kept) == 100 and reduced.shape == (2, 100)
+    assert kept[0] == "t0" and kept[-1] == "t999"
+
+
+def test_downsample_leaves_bar_charts_alone():
+    categories = [f"c{i}" for i in range(1000)]
+    values = np.ones((1, 1000))
+    kept, reduced = prevmicro.downsample_chart(categories, values, "BAR")
+    assert kept is categories and reduced is values
+
+
+def test_downsample_pie_folds_small_slices_into_other():
+    categories = ["a", "b", "c", "d", "e"]
+    values = np.array([[5.0, 40.0, 1.0, 30.0, 2.0]])
+    kept, reduced = prevmicro.downsample_chart(categories, values, "PIE", max_slices=3)
+    assert kept == ["b", "d", prevmicro.CHART_CONFIG["other_label"]]
+    assert reduced.tolist() == [[40.0, 30.0, 8.0]]
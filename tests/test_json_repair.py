@@ -0,0 +1,115 @@
+import json
+
+import prevmicro
+
+
+def bullet_slide(title="Title", insight="Insight"):
+    return {"type": "bullets", "title": title, "insight": insight, "data": [{"point": "p", "desc": "d"}]}
+
+
+def deck_json(*slides, intro="Intro"):
+    return json.dumps({"intro": intro, "slides": list(slides)}, ensure_ascii=False)
+
+
+def first_valid(text):
+    return prevmicro._loads_first(prevmicro.repair_json_text(text))
+
+
+def test_repair_trailing_commas():
+    text = '{"intro": "x", "slides": [{"title": "a", "data": ["p",],},],}'
+    assert first_valid(text) == {"intro": "x", "slides": [{"title": "a", "data": ["p"]}]}
+
+
+def test_repair_code_fences_and_trailing_text():
+    text = '```json\n{"intro": "x", "slides": []}\n```\nHope this helps!'
+    assert first_valid(text) == {"intro": "x", "slides": []}
+
+
+def test_repair_raw_newline_in_string():
+    assert first_valid('{"intro": "line one\nline two"}') == {"intro": "line one\nline two"}
+
+
+def test_repair_truncated_output_keeps_complete_elements():
+    text = deck_json(bullet_slide("One"), bullet_slide("Two"))
+    parsed = first_valid(text[:text.rfind('"insight"') + 12])
+    assert parsed["slides"][0] == bullet_slide("One")
+
+
+def test_repair_keeps_curly_quotes_inside_strings():
+    text = '{"intro": "The “new normal” is here", "slides": [],}'
+    assert first_valid(text) == {"intro": "The “new normal” is here", "slides": []}
+
+
+def test_repair_converts_curly_quote_delimiters():
+    text = '{“intro”: “plain”, “slides”: []}'
+    assert first_valid(text) == {"intro": "plain", "slides": []}
+
+
+def test_smart_quote_delimiters_leaves_valid_json_alone():
+    text = '{"title": "A “quoted” word"}'
+    assert prevmicro.smart_quote_delimiters(text) == text
+
+
+def test_smart_quote_delimiters_escapes_plain_quotes_in_smart_strings():
+    text = '{“title”: “Say "hi" now”}'
+    assert json.loads(prevmicro.smart_quote_delimiters(text)) == {"title": 'Say "hi" now'}
+
+
+def test_salvage_recovers_complete_slides():
+    slide = bullet_slide("The “new normal”")
+    text = deck_json(slide, intro="A “quoted” intro")[:-2] + ', {"title": "cut off'
+    assert prevmicro.salvage_json_slides(text) == {"intro": "A “quoted” intro", "slides": [slide]}
+
+
+def test_parse_valid_deck():
+    parsed = prevmicro.parse_json_slides(deck_json(bullet_slide("One"), bullet_slide("Two")), expected_slides=2)
+    assert parsed["intro"] == "Intro"
+    assert [slide["title"] for slide in parsed["slides"]] == ["One", "Two"]
+    assert parsed["missing"] == []
+
+
+def test_parse_lists_invalid_and_absent_slides_as_missing():
+    text = deck_json(bullet_slide("One"), {"type": "bullets", "title": "No data"}, bullet_slide("Three"))
+    parsed = prevmicro.parse_json_slides(text, expected_slides=5)
+    assert [slide["title"] for slide in parsed["slides"]] == ["One", "Three"]
+    assert parsed["missing"] == [1, 3, 4]
+
+
+def test_parse_unrecoverable_text_marks_every_slide_missing():
+    parsed = prevmicro.parse_json_slides("Sorry, I can't help with that.", expected_slides=3)
+    assert parsed == {"intro": "", "slides": [], "missing": [0, 1, 2]}
+
+
+def test_fill_missing_slides_inserts_in_place():
+    parsed = {"intro": "i", "slides": [bullet_slide("One"), bullet_slide("Three")], "missing": [1, 3]}
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return deck_json(bullet_slide("Two"), bullet_slide("Four"))
+
+    filled = prevmicro.fill_missing_slides(parsed, "topic", generate=generate)
+    assert [slide["title"] for slide in filled["slides"]] == ["One", "Two", "Three", "Four"]
+    assert filled["missing"] == []
+    assert "slides 2, 4 are missing" in prompts[0]
+
+
+def test_fill_missing_slides_keeps_unfilled_positions():
+    parsed = {"intro": "i", "slides": [bullet_slide("One")], "missing": [1, 2]}
+    filled = prevmicro.fill_missing_slides(parsed, "topic", generate=lambda prompt: deck_json(bullet_slide("Two")))
+    assert [slide["title"] for slide in filled["slides"]] == ["One", "Two"]
+    assert filled["missing"] == [2]
+
+
+def test_fill_missing_slides_survives_generation_errors():
+    parsed = {"intro": "i", "slides": [], "missing": [0]}
+
+    def generate(prompt):
+        raise RuntimeError("rate limited")
+
+    assert prevmicro.fill_missing_slides(parsed, "topic", generate=generate) is parsed
+
+
+def test_fill_missing_slides_skips_complete_decks():
+    parsed = {"intro": "i", "slides": [bullet_slide()], "missing": []}
+    assert prevmicro.fill_missing_slides(parsed, "topic", generate=None) is parsed
@@ -0,0 +1,111 @@
+import pytest
+
+import prevmicro
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "retry_backoff", 0)
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "max_attempts", 2)
+    return prevmicro.TaskQueue(str(tmp_path / "tasks.db"))
+
+
+def statuses(queue, job_id="job"):
+    return {row["kind"]: row["status"] for row in queue.job_status(job_id)}
+
+
+def test_lease_by_priority_then_age(queue):
+    queue.enqueue("final", "a", {}, priority=2)
+    queue.enqueue("preview", "b", {}, priority=0)
+    queue.enqueue("final", "c", {}, priority=2)
+    queue.enqueue("preview", "d", {}, priority=0)
+    leased = [queue.lease("w")["kind"] for _ in range(4)]
+    assert leased == ["b", "d", "a", "c"]
+    assert queue.lease("w") is None
+
+
+def test_lease_filters_by_kind(queue):
+    queue.enqueue("job", "encode", {})
+    queue.enqueue("job", "outline", {})
+    assert queue.lease("w", kinds={"outline"})["kind"] == "outline"
+
+
+def test_dependencies_gate_leasing(queue):
+    outline = queue.enqueue("job", "outline", {"topic": "t"})
+    queue.enqueue("job", "build", {}, depends_on=[outline])
+    task = queue.lease("w")
+    assert task["kind"] == "outline" and task["payload"] == {"topic": "t"} and task["attempts"] == 1
+    assert queue.lease("w") is None
+
+    queue.complete(task["id"], "w", {"deck": "deck.bin"})
+    task = queue.lease("w")
+    assert task["kind"] == "build" and task["depends_on"] == [outline]
+    assert queue.results(task["depends_on"]) == {"outline": {"deck": "deck.bin"}}
+
+
+def test_complete_ignores_workers_that_lost_the_lease(queue):
+    task_id = queue.enqueue("job", "outline", {})
+    queue.lease("w1")
+    queue.complete(task_id, "w2", {"stolen": True})
+    assert statuses(queue) == {"outline": "leased"}
+
+
+def test_failure_is_retried_until_max_attempts(queue):
+    task_id = queue.enqueue("job", "outline", {})
+    queue.lease("w")
+    queue.fail(task_id, "w", "boom")
+    assert statuses(queue) == {"outline": "pending"}
+
+    task = queue.lease("w")
+    assert task["attempts"] == 2
+    queue.fail(task_id, "w", "boom again")
+    assert statuses(queue) == {"outline": "failed"}
+    assert queue.job_status("job")[0]["error"] == "boom again"
+    assert queue.lease("w") is None
+
+
+def test_failure_backs_off(queue, monkeypatch):
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "retry_backoff", 60)
+    task_id = queue.enqueue("job", "outline", {})
+    queue.lease("w")
+    queue.fail(task_id, "w", "boom")
+    assert queue.lease("w") is None
+
+
+def test_failure_fails_only_downstream_tasks(queue, monkeypatch):
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "max_attempts", 1)
+    outline = queue.enqueue("job", "outline", {})
+    build = queue.enqueue("job", "build", {}, depends_on=[outline])
+    queue.enqueue("job", "encode", {}, depends_on=[build])
+    queue.enqueue("job", "cleanup", {})
+    queue.lease("w", kinds={"outline"})
+    queue.fail(outline, "w", "boom")
+    assert statuses(queue) == {"outline": "failed", "build": "failed", "encode": "failed", "cleanup": "pending"}
+
+
+def test_expired_lease_is_handed_to_another_worker(queue, monkeypatch):
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "lease_seconds", -1)
+    task_id = queue.enqueue("job", "outline", {})
+    queue.lease("w1")
+    task = queue.lease("w2")
+    assert task["id"] == task_id and task["attempts"] == 2
+    assert not queue.heartbeat(task_id, "w1")
+    queue.fail(task_id, "w1", "late failure from the old worker")
+    assert statuses(queue) == {"outline": "leased"}
+
+
+def test_expired_lease_after_last_attempt_fails_task(queue, monkeypatch):
+    monkeypatch.setitem(prevmicro.QUEUE_CONFIG, "lease_seconds", -1)
+    outline = queue.enqueue("job", "outline", {})
+    queue.enqueue("job", "build", {}, depends_on=[outline])
+    queue.lease("w1")
+    queue.lease("w2")
+    assert queue.lease("w3") is None
+    assert statuses(queue) == {"outline": "failed", "build": "failed"}
+
+
+def test_heartbeat_extends_own_lease(queue):
+    task_id = queue.enqueue("job", "outline", {})
+    queue.lease("w")
+    assert queue.heartbeat(task_id, "w")
+    assert not queue.heartbeat(task_id, "other")
@@ -0,0 +1,34 @@
+import prevmicro
+
+
+def test_split_sentences_on_terminal_punctuation():
+    text = "Revenue grew 12%. Why? Costs fell! Margins rose… Next year looks good."
+    assert prevmicro.split_sentences(text) == [
+        "Revenue grew 12%.", "Why?", "Costs fell!", "Margins rose…", "Next year looks good.",
+    ]
+
+
+def test_split_sentences_keeps_decimals_and_unterminated_tail():
+    assert prevmicro.split_sentences("  Growth was 3.5 percent.\n\nThen it slowed  ") == [
+        "Growth was 3.5 percent.", "Then it slowed",
+    ]
+
+
+def test_split_sentences_of_blank_text():
+    assert prevmicro.split_sentences("   \n ") == []
+
+
+def test_normalize_sentence_collapses_whitespace():
+    assert prevmicro.normalize_sentence("  The   EU\tand\nthe US ") == "The EU and the US"
+
+
+def test_normalize_sentence_keeps_case():
+    assert prevmicro.normalize_sentence("NASA") != prevmicro.normalize_sentence("nasa")
+
+
+def test_sentence_cache_key_ignores_whitespace_only(monkeypatch, tmp_path):
+    monkeypatch.setitem(prevmicro.TTS_CONFIG, "cache_dir", str(tmp_path))
+    backend = prevmicro.EspeakBackend()
+    path = prevmicro.sentence_cache_path(backend, "Hello  world.")
+    assert path == prevmicro.sentence_cache_path(backend, " Hello world. ")
+    assert path != prevmicro.sentence_cache_path(backend, "HELLO world.")
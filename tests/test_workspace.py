@@ -0,0 +1,74 @@
+import os
+
+import prevmicro
+
+
+class Stage:
+    """A stage function that counts its runs, writing the run number to its artifacts."""
+
+    def __init__(self, artifacts=()):
+        self.runs = 0
+        self.artifacts = artifacts
+
+    def __call__(self):
+        self.runs += 1
+        for path in self.artifacts:
+            with open(path, "w") as f:
+                f.write(str(self.runs))
+        return self.runs, list(self.artifacts)
+
+
+def test_completed_stage_is_resumed(tmp_path):
+    stage = Stage()
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    assert workspace.run_stage("narration", stage) == 1
+    reopened = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    assert reopened.run_stage("narration", stage) == 1
+    assert stage.runs == 1
+
+
+def test_changed_artifact_reruns_stage(tmp_path):
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    path = os.path.join(workspace.subdir("audio"), "slide.wav")
+    stage = Stage([path])
+    workspace.run_stage("audio", stage)
+    with open(path, "w") as f:
+        f.write("edited")
+    assert workspace.run_stage("audio", stage) == 2
+
+
+def test_missing_artifact_reruns_stage(tmp_path):
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    path = os.path.join(workspace.subdir("audio"), "slide.wav")
+    stage = Stage([path])
+    workspace.run_stage("audio", stage)
+    os.remove(path)
+    assert workspace.run_stage("audio", stage) == 2
+
+
+def test_rerun_upstream_invalidates_downstream(tmp_path):
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    upstream, downstream = Stage(), Stage()
+    workspace.run_stage("narration", upstream)
+    workspace.run_stage("audio", downstream, after=["narration"])
+    assert workspace.run_stage("audio", downstream, after=["narration"]) == 1
+
+    del workspace.manifest["stages"]["narration"]
+    workspace.run_stage("narration", upstream)  # new result, new digest
+    assert workspace.run_stage("audio", downstream, after=["narration"]) == 2
+
+
+def test_changed_external_input_reruns_stage(tmp_path):
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    stage = Stage()
+    workspace.run_stage("images", stage, inputs={"pptx": "aaa"})
+    assert workspace.run_stage("images", stage, inputs={"pptx": "aaa"}) == 1
+    assert workspace.run_stage("images", stage, inputs={"pptx": "bbb"}) == 2
+
+
+def test_provisional_result_is_not_checkpointed(tmp_path):
+    workspace = prevmicro.JobWorkspace("job", root=str(tmp_path))
+    assert workspace.run_stage("narration", lambda: ({"fallback": True}, None)) == {"fallback": True}
+    assert workspace.stage_digest("narration") is None
+    assert workspace.run_stage("narration", lambda: ({"title_narration": "Hi"}, [])) == {"title_narration": "Hi"}
+    assert workspace.stage_digest("narration") is not None